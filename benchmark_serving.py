@@ -0,0 +1,192 @@
+"""
+Load test for the serving modes.
+
+Starts the server in each mode in turn: 'dev' is the current setup,
+python server.py on Flask's threaded server, and is the baseline; any
+other mode is a gunicorn worker class (see gunicorn.conf.py), e.g.
+gthread, gevent or sync. Holds a number of /api/scraper-events streams
+open, and runs concurrent clients that mostly query /api/listings and
+sometimes geocode an unknown address against a local stand-in geocoder
+that answers slowly. Prints sustained throughput and latency per mode.
+
+    python benchmark_serving.py --modes dev gevent --clients 64 --duration 20
+
+Run it from the directory holding the rental data (rentals_latest.json or
+listings.db), as for server.py.
+"""
+import argparse
+import json
+import os
+import random
+import shutil
+import socket
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import requests
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+
+LISTING_QUERIES = [
+    {}, {'limit': 100}, {'sort': 'price', 'limit': 100}, {'bedrooms': '1'}, {'bedrooms': '2', 'max_price': 5000},
+    {'area': 'west village'}, {'days_filter': '0-7'}, {'pets': 'true', 'laundry': 'In building'},
+]
+
+
+def free_port():
+    with socket.socket() as s:
+        s.bind(('127.0.0.1', 0))
+        return s.getsockname()[1]
+
+
+def start_stub_geocoder(delay):
+    """A LocationIQ stand-in that takes delay seconds per lookup"""
+    class Handler(BaseHTTPRequestHandler):
+        def do_GET(self):
+            time.sleep(delay)
+            body = json.dumps([{'lat': '40.73', 'lon': '-73.99', 'display_name': 'stub'}]).encode()
+            self.send_response(200)
+            self.send_header('Content-Type', 'application/json')
+            self.send_header('Content-Length', str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, *args):
+            pass
+
+    server = ThreadingHTTPServer(('127.0.0.1', 0), Handler)
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return f"http://127.0.0.1:{server.server_address[1]}/v1/search.php"
+
+
+def start_server(mode, port, workers, geocoder_url, workdir):
+    env = dict(os.environ, GEOCODER_URL=geocoder_url, GEOCODE_DB=os.path.join(workdir, f"geocode-{mode}.db"))
+    if mode == 'dev':
+        # One process serving parsed snapshots, as with python server.py
+        env.pop('SNAPSHOT_DIR', None)
+        command = [sys.executable, os.path.join(HERE, 'server.py')]
+        env['PORT'] = str(port)
+    else:
+        command = [sys.executable, '-m', 'gunicorn', '-c', os.path.join(HERE, 'gunicorn.conf.py'),
+                   '--pythonpath', HERE, 'server:app']
+        env.update(WORKER_CLASS=mode, WEB_CONCURRENCY=str(workers), BIND=f"127.0.0.1:{port}",
+                   SNAPSHOT_DIR=os.path.join(workdir, f"snapshots-{mode}"))
+    process = subprocess.Popen(command, env=env, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    base = f"http://127.0.0.1:{port}"
+    for _ in range(300):
+        try:
+            if requests.get(f"{base}/api/listings", params={'limit': 1}, timeout=5).ok:
+                return process, base
+        except requests.RequestException:
+            pass
+        time.sleep(0.1)
+    process.kill()
+    raise RuntimeError(f"Server in {mode} mode did not come up")
+
+
+def hold_streams(base, count, stop):
+    """Open count /api/scraper-events streams and keep reading them until stop is set"""
+    def follow():
+        try:
+            with requests.get(f"{base}/api/scraper-events", stream=True, timeout=(5, None)) as resp:
+                for _ in resp.iter_lines():
+                    if stop.is_set():
+                        return
+        except requests.RequestException:
+            pass
+
+    threads = [threading.Thread(target=follow, daemon=True) for _ in range(count)]
+    for thread in threads:
+        thread.start()
+    return threads
+
+
+def percentile(values, q):
+    if not values:
+        return float('nan')
+    values = sorted(values)
+    return values[min(len(values) - 1, int(q * len(values)))]
+
+
+def run_clients(base, clients, duration, geocode_share):
+    latencies = {'listings': [], 'geocode': []}
+    errors = [0]
+    lock = threading.Lock()
+    deadline = time.monotonic() + duration
+    counter = iter(range(10 ** 9))
+
+    def client(seed):
+        rng = random.Random(seed)
+        session = requests.Session()
+        while time.monotonic() < deadline:
+            if rng.random() < geocode_share:
+                kind, url, params = 'geocode', f"{base}/api/geocode", {'address': f"{next(counter)} Benchmark Ave"}
+            else:
+                kind, url, params = 'listings', f"{base}/api/listings", rng.choice(LISTING_QUERIES)
+            start = time.monotonic()
+            try:
+                ok = session.get(url, params=params, timeout=10).ok
+            except requests.RequestException:
+                ok = False
+            elapsed = time.monotonic() - start
+            with lock:
+                if ok:
+                    latencies[kind].append(elapsed)
+                else:
+                    errors[0] += 1
+
+    threads = [threading.Thread(target=client, args=(i,)) for i in range(clients)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    return latencies, errors[0]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n\n')[0])
+    parser.add_argument('--modes', nargs='+', default=['dev', 'gthread', 'gevent'],
+                        help="Modes to compare: 'dev' (python server.py, the baseline) and gunicorn worker classes")
+    parser.add_argument('--workers', type=int, default=2, help='Worker processes (gunicorn modes)')
+    parser.add_argument('--clients', type=int, default=64, help='Concurrent clients')
+    parser.add_argument('--duration', type=float, default=20, help='Seconds of load per mode')
+    parser.add_argument('--streams', type=int, default=4, help='Open /api/scraper-events streams during the run')
+    parser.add_argument('--geocode-share', type=float, default=0.1, help='Fraction of requests that geocode')
+    parser.add_argument('--geocode-delay', type=float, default=1.0, help='Seconds the stand-in geocoder takes')
+    args = parser.parse_args()
+
+    geocoder_url = start_stub_geocoder(args.geocode_delay)
+    workdir = tempfile.mkdtemp(prefix='benchmark-')
+    results = []
+    try:
+        for mode in args.modes:
+            process, base = start_server(mode, free_port(), args.workers, geocoder_url, workdir)
+            stop = threading.Event()
+            try:
+                hold_streams(base, args.streams, stop)
+                latencies, errors = run_clients(base, args.clients, args.duration, args.geocode_share)
+            finally:
+                stop.set()
+                process.terminate()
+                process.wait()
+            listings, geocode = latencies['listings'], latencies['geocode']
+            results.append((mode, (len(listings) + len(geocode)) / args.duration, len(listings) / args.duration,
+                            percentile(listings, 0.5), percentile(listings, 0.99), percentile(geocode, 0.5), errors))
+    finally:
+        shutil.rmtree(workdir, ignore_errors=True)
+
+    print(f"{args.workers} workers, {args.clients} clients, {args.streams} open event streams, "
+          f"{args.geocode_share:.0%} geocodes at {args.geocode_delay}s each, {args.duration}s per mode")
+    print(f"{'mode':<10}{'req/s':>10}{'listings/s':>12}{'listings p50':>14}{'listings p99':>14}{'geocode p50':>13}{'errors':>8}")
+    for mode, total, listings, p50, p99, geocode_p50, errors in results:
+        print(f"{mode:<10}{total:>10.1f}{listings:>12.1f}{p50 * 1000:>12.1f}ms{p99 * 1000:>12.1f}ms"
+              f"{geocode_p50 * 1000:>11.1f}ms{errors:>8}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,130 @@
+import re
+from html.parser import HTMLParser
+from urllib.parse import urljoin
+
+# Text of the bot check page served instead of the requested page
+CAPTCHA_MARKER = 'Press & Hold to confirm'
+
+# Link containers that mark navigation rather than building content, and ones that mark building content
+NAV_INDICATORS = ('nav', 'menu', 'header', 'listitem', 'list_list')
+BUILDING_INDICATORS = ('item', 'building', 'property', 'card', 'photo', 'details')
+
+_CARD_PATTERN = re.compile(r'building-card|property-card|buildingcard', re.IGNORECASE)
+_ADDRESS_PATTERN = re.compile(r'address|title', re.IGNORECASE)
+_SLUG_PATTERN = re.compile(r'/building/([^/?#]+)')
+_PAGE_PATTERN = re.compile(r'[?&]page=(\d+)')
+
+# Elements that never have an end tag
+_VOID_TAGS = {'area', 'base', 'br', 'col', 'embed', 'hr', 'img', 'input', 'link', 'meta', 'source', 'track', 'wbr'}
+
+
+def _is_card(classes):
+    return bool(_CARD_PATTERN.search(classes)) or {'item', 'building'} <= set(classes.lower().split())
+
+
+class _Element:
+    def __init__(self, tag, classes):
+        self.tag = tag
+        self.classes = classes
+        self.is_card = _is_card(classes)
+        # For cards: the first address-like text inside them
+        self.address = None
+
+
+class _Link:
+    def __init__(self, href, stack):
+        self.href = href
+        self.card = next((e for e in reversed(stack) if e.is_card), None)
+        self.context = ' '.join(e.classes for e in stack[-2:]).lower()
+        self.text = []
+
+
+class BuildingPageParser(HTMLParser):
+    """
+    Collects the building links and pagination of a /buildings/<area> page,
+    replacing the per-element WebDriver lookups with one pass over the HTML.
+    """
+
+    def __init__(self):
+        super().__init__(convert_charrefs=True)
+        self.stack = []
+        self.links = []
+        self.page_numbers = []
+        self._link = None
+        self._address_text = None
+
+    def handle_starttag(self, tag, attrs):
+        attrs = dict(attrs)
+        classes = attrs.get('class') or ''
+        if tag == 'a' and attrs.get('href'):
+            href = attrs['href']
+            if '/building/' in href:
+                self._link = _Link(href, self.stack)
+                self.links.append(self._link)
+            page = _PAGE_PATTERN.search(href)
+            if page and any('pagination' in e.classes for e in self.stack):
+                self.page_numbers.append(int(page.group(1)))
+        if tag not in _VOID_TAGS:
+            element = _Element(tag, classes)
+            if (tag == 'h3' or _ADDRESS_PATTERN.search(classes)) and self._address_text is None:
+                self._address_text = (element, [])
+            self.stack.append(element)
+
+    def handle_endtag(self, tag):
+        if tag == 'a':
+            self._link = None
+        for i in range(len(self.stack) - 1, -1, -1):
+            if self.stack[i].tag == tag:
+                closed = self.stack[i:]
+                del self.stack[i:]
+                break
+        else:
+            return
+        if self._address_text is not None and self._address_text[0] in closed:
+            text = ' '.join(''.join(self._address_text[1]).split())
+            card = next((e for e in reversed(self.stack) if e.is_card), None)
+            if card is not None and card.address is None and len(text) > 3:
+                card.address = text
+            self._address_text = None
+
+    def handle_data(self, data):
+        if self._link is not None:
+            self._link.text.append(data)
+        if self._address_text is not None:
+            self._address_text[1].append(data)
+        if data.strip().isdigit() and any('pagination' in e.classes for e in self.stack):
+            self.page_numbers.append(int(data.strip()))
+
+
+def parse_building_page(html, url):
+    """
+    (buildings, total pages) for a /buildings/<area> page, where buildings
+    is a list of (slug, absolute href, address) in page order.
+
+    Links inside building cards are used when there are any; otherwise all
+    building links except those that look like navigation.
+    """
+    parser = BuildingPageParser()
+    parser.feed(html)
+    parser.close()
+
+    links = [link for link in parser.links if link.card is not None]
+    if not links:
+        links = [link for link in parser.links
+                 if not any(i in link.context for i in NAV_INDICATORS)
+                 or any(i in link.context for i in BUILDING_INDICATORS)]
+
+    buildings = []
+    seen = set()
+    for link in links:
+        href = urljoin(url, link.href)
+        match = _SLUG_PATTERN.search(href)
+        if not match or match.group(1) in seen:
+            continue
+        slug = match.group(1)
+        seen.add(slug)
+        text = ' '.join(''.join(link.text).split())
+        if len(text) <= 3:
+            text = link.card.address if link.card is not None and link.card.address else f"Building {slug}"
+        buildings.append((slug, href, text))
+    return buildings, max(parser.page_numbers, default=1)
@@ -0,0 +1,220 @@
+import json
+import os
+import re
+import threading
+import time
+
+import requests
+
+from pending import Pending
+from sqlite_pool import ConnectionPool
+
+GEOCODE_DB = os.environ.get('GEOCODE_DB', 'geocode_cache.db')
+
+# Cached lookups expire after this long and the cache keeps at most this many addresses
+GEOCODE_TTL_DAYS = float(os.environ.get('GEOCODE_TTL_DAYS', 30))
+GEOCODE_CACHE_SIZE = int(os.environ.get('GEOCODE_CACHE_SIZE', 50000))
+
+# LocationIQ-compatible search endpoint; point it at a local stand-in for testing
+GEOCODER_URL = os.environ.get('GEOCODER_URL', 'https://us1.locationiq.com/v1/search.php')
+GEOCODER_TIMEOUT = 10
+
+# Access times of cache hits are written in one batch per this many hits or seconds
+ACCESS_FLUSH_SIZE = 256
+ACCESS_FLUSH_INTERVAL = 60
+
+# Connections kept open to the geocoder; under gevent this bounds concurrent outbound lookups
+GEOCODER_POOL_SIZE = int(os.environ.get('GEOCODER_POOL_SIZE', 32))
+
+# Every address is looked up within the city
+CITY_SUFFIX = ', New York, NY'
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS geocodes (
+    address TEXT PRIMARY KEY,
+    result TEXT NOT NULL,
+    created_at REAL NOT NULL,
+    accessed_at REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS idx_geocodes_accessed ON geocodes(accessed_at);
+"""
+
+# Borough kept in the address key for each city name an address may end with: the boroughs
+# and Queens' postal city names. Street numbers repeat across boroughs but not within one
+# (Queens' are hyphenated). Manhattan's is empty, as addresses without a city are looked up
+# in New York (CITY_SUFFIX).
+CITY_BOROUGHS = {
+    'new york': '', 'new york city': '', 'nyc': '', 'manhattan': '',
+    'brooklyn': 'brooklyn', 'bronx': 'bronx', 'the bronx': 'bronx', 'staten island': 'staten island',
+    'queens': 'queens', 'long island city': 'queens', 'astoria': 'queens', 'flushing': 'queens',
+    'jamaica': 'queens', 'forest hills': 'queens', 'jackson heights': 'queens', 'ridgewood': 'queens',
+    'sunnyside': 'queens', 'woodside': 'queens', 'elmhurst': 'queens', 'corona': 'queens', 'bayside': 'queens',
+}
+
+# Optional ", <city>", ", NY" or ", New York" and zip code (after a comma or a space) at the end
+_CITY_PATTERN = re.compile(r'(,\s*(?P<city>%s))?(,\s*(ny|new york))?(,?\s*\d{5}(-\d{4})?)?$'
+                           % '|'.join(sorted(map(re.escape, CITY_BOROUGHS), key=len, reverse=True)))
+
+# Bumped when normalize_address changes, so cached results under old keys are dropped
+ADDRESS_KEY_VERSION = 2
+
+
+def normalize_address(address):
+    """
+    Cache key for an address: lowercase and single-spaced, with the city
+    replaced by its borough (none for Manhattan) and the state and zip
+    code dropped.
+    """
+    address = ' '.join(str(address or '').lower().replace('.', '').split())
+    match = _CITY_PATTERN.search(address)
+    street = address[:match.start()].strip(' ,')
+    borough = CITY_BOROUGHS[match.group('city')] if match.group('city') else ''
+    return f'{street}, {borough}' if borough else street
+
+
+def location_result(address, latitude, longitude, source):
+    """A single-match result in the shape LocationIQ's search returns"""
+    return [{'lat': str(latitude), 'lon': str(longitude), 'display_name': address, 'source': source}]
+
+
+class LocationIQBackend:
+    """
+    Geocodes addresses with LocationIQ's search API over a pooled HTTP
+    session. Under a gevent worker (see gunicorn.conf.py) the session's
+    sockets are cooperative, so a slow lookup only parks its own request.
+
+    Any object with a search(address) method returning LocationIQ-shaped
+    JSON can stand in for it.
+    """
+
+    def __init__(self, api_key, url=GEOCODER_URL, timeout=GEOCODER_TIMEOUT, pool_size=GEOCODER_POOL_SIZE):
+        self.api_key = api_key
+        self.url = url
+        self.timeout = timeout
+        self.session = requests.Session()
+        self.session.headers['User-Agent'] = 'LeaseExplorer/1.0'
+        adapter = requests.adapters.HTTPAdapter(pool_connections=1, pool_maxsize=pool_size, pool_block=True)
+        self.session.mount('http://', adapter)
+        self.session.mount('https://', adapter)
+
+    def search(self, address):
+        params = {'key': self.api_key, 'q': f'{address}{CITY_SUFFIX}', 'format': 'json', 'limit': 1}
+        resp = self.session.get(self.url, params=params, timeout=self.timeout)
+        # 404 means "no match", which is an answer worth caching; anything else non-200 is not
+        if resp.status_code not in (200, 404):
+            resp.raise_for_status()
+        return resp.json()
+
+
+class GeocodeCache:
+    """
+    Persistent geocode results in SQLite, keyed by normalized address.
+
+    Entries expire after ttl seconds; when the cache grows past max_entries
+    the least recently used addresses are evicted.
+    """
+
+    def __init__(self, path=GEOCODE_DB, ttl=GEOCODE_TTL_DAYS * 86400, max_entries=GEOCODE_CACHE_SIZE):
+        self.path = path
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self._pool = ConnectionPool(path, setup=self._setup)
+        # Access times of cache hits not yet written: address -> time
+        self._accessed = {}
+        self._accessed_lock = threading.Lock()
+        self._flushed_at = time.monotonic()
+
+    def _setup(self, conn):
+        conn.execute('PRAGMA journal_mode=WAL')
+        conn.executescript(SCHEMA)
+        if conn.execute('PRAGMA user_version').fetchone()[0] != ADDRESS_KEY_VERSION:
+            with conn:
+                conn.execute('DELETE FROM geocodes')
+            conn.execute(f'PRAGMA user_version = {ADDRESS_KEY_VERSION}')
+
+    def get(self, key):
+        """Cached result for a normalized address, or None if missing or expired"""
+        now = time.time()
+        with self._pool.connection() as conn:
+            row = conn.execute('SELECT result, created_at FROM geocodes WHERE address = ?', (key,)).fetchone()
+            if row is None:
+                return None
+            if now - row[1] > self.ttl:
+                with conn:
+                    conn.execute('DELETE FROM geocodes WHERE address = ?', (key,))
+                return None
+        self._touch(key, now)
+        return json.loads(row[0])
+
+    def _touch(self, key, now):
+        """Note a cache hit; access times are written in batches so hits stay read-only"""
+        with self._accessed_lock:
+            self._accessed[key] = now
+            due = (len(self._accessed) >= ACCESS_FLUSH_SIZE
+                   or time.monotonic() - self._flushed_at >= ACCESS_FLUSH_INTERVAL)
+        if due:
+            self.flush_access_times()
+
+    def flush_access_times(self):
+        """Write the pending access times of cache hits"""
+        with self._accessed_lock:
+            accessed, self._accessed = self._accessed, {}
+            self._flushed_at = time.monotonic()
+        if accessed:
+            with self._pool.connection() as conn, conn:
+                conn.executemany('UPDATE geocodes SET accessed_at = MAX(accessed_at, ?) WHERE address = ?',
+                                 [(when, key) for key, when in accessed.items()])
+
+    def put(self, key, result):
+        # Evictions go by access time, so bring it up to date first
+        self.flush_access_times()
+        now = time.time()
+        with self._pool.connection() as conn, conn:
+            conn.execute('INSERT OR REPLACE INTO geocodes (address, result, created_at, accessed_at) '
+                         'VALUES (?, ?, ?, ?)', (key, json.dumps(result), now, now))
+            excess = conn.execute('SELECT COUNT(*) FROM geocodes').fetchone()[0] - self.max_entries
+            if excess > 0:
+                conn.execute('DELETE FROM geocodes WHERE address IN '
+                             '(SELECT address FROM geocodes ORDER BY accessed_at LIMIT ?)', (excess,))
+
+
+class Geocoder:
+    """
+    Cached geocoding in front of a backend.
+
+    Concurrent lookups of the same address are coalesced: the first caller
+    queries the backend and the others wait for its result.
+    """
+
+    def __init__(self, backend, cache=None):
+        self.backend = backend
+        self.cache = cache or GeocodeCache()
+        self._lock = threading.Lock()
+        self._pending = {}
+
+    def lookup(self, address):
+        key = normalize_address(address)
+        result = self.cache.get(key)
+        if result is not None:
+            return result
+
+        with self._lock:
+            pending = self._pending.get(key)
+            owner = pending is None
+            if owner:
+                pending = self._pending[key] = Pending()
+
+        if not owner:
+            return pending.wait()
+
+        try:
+            pending.value = self.backend.search(address)
+            self.cache.put(key, pending.value)
+            return pending.value
+        except Exception as e:
+            pending.error = e
+            raise
+        finally:
+            with self._lock:
+                del self._pending[key]
+            pending.done()
@@ -0,0 +1,288 @@
+import threading
+from collections import deque
+
+from pending import Pending
+
+# Fields fetched for each building; the same as the single-slug buildingBySlug lookup
+BUILDING_FIELDS = """
+    id
+    name
+    geoCenter { latitude longitude }
+    address { street city state zipCode }
+"""
+
+# Fields fetched for each rental; the same as the scraper's minimal fields history query
+HISTORY_FIELDS = """
+    id
+    legacy { id }
+    street
+    displayUnit
+    buildingId
+    availableAt
+    offMarketAt
+    bedroomCount
+    fullBathroomCount
+    halfBathroomCount
+    livingAreaSize
+    price
+    urlPath
+    status
+    slug
+    areaName
+"""
+
+# Keys per request: starts at BATCH_SIZE, halves when a batch fails and grows back after successes
+BATCH_SIZE = 50
+MAX_BATCH_SIZE = 200
+BATCH_GROWTH = 10
+
+# The same for rental histories, which are much larger than building lookups
+HISTORY_BATCH_SIZE = 10
+HISTORY_MAX_BATCH_SIZE = 40
+HISTORY_BATCH_GROWTH = 2
+
+# Query field whose result type a building field must share to stand in for it
+HISTORY_QUERY_FIELD = 'rentalsHistoryByBuildingId'
+BUILDING_QUERY_FIELD = 'buildingBySlug'
+
+
+def batch_query(field, argument, argument_type, selection, keys):
+    """One GraphQL request querying field once per key, as aliased fields b0, b1, ..."""
+    params = ', '.join(f'$k{i}: {argument_type}' for i in range(len(keys)))
+    fields = '\n'.join(f'b{i}: {field}({argument}: $k{i}) {{ {selection} }}' for i in range(len(keys)))
+    return {
+        'query': f'query Batch({params}) {{\n{fields}\n}}',
+        'variables': {f'k{i}': key for i, key in enumerate(keys)},
+    }
+
+
+def _type_signature(type_ref):
+    """(kind, ..., name) of an introspected type reference, e.g. ('NON_NULL', 'LIST', 'OBJECT', 'Rental')"""
+    signature = []
+    while type_ref:
+        signature.append(type_ref.get('kind'))
+        if type_ref.get('name'):
+            signature.append(type_ref['name'])
+        type_ref = type_ref.get('ofType')
+    return tuple(signature)
+
+
+def _field(type_info, name):
+    return next((f for f in (type_info or {}).get('fields') or [] if f.get('name') == name), None)
+
+
+def building_type_name(query_type):
+    """Name of the type buildingBySlug returns, from the introspected Query type"""
+    field = _field(query_type, BUILDING_QUERY_FIELD)
+    return _type_signature(field['type'])[-1] if field else None
+
+
+def nested_history_field(query_type, building_type):
+    """
+    Name of the building type's field for its rental history, if the
+    introspected types have one: a field with no required arguments whose
+    type is exactly that of rentalsHistoryByBuildingId. None otherwise, or
+    if several fields match.
+    """
+    history = _field(query_type, HISTORY_QUERY_FIELD)
+    if history is None:
+        return None
+    signature = _type_signature(history['type'])
+    matches = [f['name'] for f in (building_type or {}).get('fields') or []
+               if _type_signature(f.get('type')) == signature
+               and not any((a.get('type') or {}).get('kind') == 'NON_NULL' for a in f.get('args') or [])]
+    return matches[0] if len(matches) == 1 else None
+
+
+class ResolveError(Exception):
+    """A key could not be resolved in a batch; the caller should look it up on its own"""
+
+
+class BatchLoader:
+    """
+    Resolves keys of a one-argument GraphQL field in batches.
+
+    Keys are queued with prefetch() (or by resolve() itself) and sent by
+    loader threads, many per request as aliased fields. Each resolve(key)
+    waits for the batch holding its key. A failed request is split in half
+    and retried, and the batch size shrinks with it; a key that fails on
+    its own raises ResolveError from resolve(). An alias that comes back
+    with data is kept even if the response also reports errors under it.
+
+    post(query) sends a GraphQL request and returns the decoded response,
+    raising on HTTP errors. Once stopped() returns true, or after cancel(),
+    nothing more is sent and unresolved keys raise ResolveError.
+    """
+
+    field = None
+    argument = None
+    argument_type = None
+    selection = None
+
+    def __init__(self, post, loaders=2, batch_size=BATCH_SIZE, max_batch_size=MAX_BATCH_SIZE, growth=BATCH_GROWTH,
+                 stopped=None):
+        self.post = post
+        self.stopped = stopped
+        self.loaders = loaders
+        self.batch_size = batch_size
+        self.max_batch_size = max_batch_size
+        self.growth = growth
+        self.requests = 0
+        self._lock = threading.Lock()
+        self._queue = deque()
+        self._pending = {}
+        self._running = 0
+
+    def prefetch(self, keys):
+        """Queue keys for resolution, in the order they will be asked for"""
+        with self._lock:
+            for key in keys:
+                self._queue_key(key)
+            self._start_loaders()
+
+    def resolve(self, key):
+        """The field's result for a key; each queued key is handed out once"""
+        with self._lock:
+            pending = self._queue_key(key)
+            self._start_loaders()
+        try:
+            return pending.wait()
+        finally:
+            with self._lock:
+                self._pending.pop(key, None)
+
+    def cancel(self):
+        """Drop the queued keys; their resolve() calls raise ResolveError"""
+        with self._lock:
+            keys, self._queue = list(self._queue), deque()
+        self._fail(keys, ResolveError('lookup cancelled'))
+
+    def _stopped(self):
+        return self.stopped is not None and self.stopped()
+
+    def _queue_key(self, key):
+        pending = self._pending.get(key)
+        if pending is None:
+            pending = self._pending[key] = Pending()
+            self._queue.append(key)
+        return pending
+
+    def _start_loaders(self):
+        while self._running < min(self.loaders, len(self._queue)):
+            self._running += 1
+            thread = threading.Thread(target=self._load)
+            thread.daemon = True
+            thread.start()
+
+    def _load(self):
+        while True:
+            if self._stopped():
+                self.cancel()
+            with self._lock:
+                if not self._queue:
+                    self._running -= 1
+                    return
+                batch = [self._queue.popleft() for _ in range(min(self.batch_size, len(self._queue)))]
+            self._send(batch)
+
+    def _send(self, batch):
+        if self._stopped():
+            self._fail(batch, ResolveError('lookup cancelled'))
+            return
+        try:
+            with self._lock:
+                self.requests += 1
+            data = self.post(batch_query(self.field, self.argument, self.argument_type, self.selection, batch))
+            results = data.get('data')
+            if not isinstance(results, dict):
+                raise ResolveError(f"no data in response: {data.get('errors')}")
+        except Exception as e:
+            self._failed(batch, e)
+            return
+
+        failed = {str(error['path'][0]) for error in data.get('errors') or [] if error.get('path')}
+        retry = []
+        for i, key in enumerate(batch):
+            value = results.get(f'b{i}')
+            # A null alias is only a failure if an error names it; unknown keys are null too
+            if value is None and (f'b{i}' in failed or f'b{i}' not in results):
+                retry.append(key)
+            else:
+                self._finish(key, value)
+        with self._lock:
+            if retry:
+                self.batch_size = max(1, self.batch_size // 2)
+            else:
+                self.batch_size = min(self.max_batch_size, self.batch_size + self.growth)
+        if retry:
+            self._failed(retry, ResolveError('lookup failed in batch'), shrink=False)
+
+    def _failed(self, batch, error, shrink=True):
+        """Split a failed batch and send the halves again; single keys fail for good"""
+        if shrink:
+            with self._lock:
+                self.batch_size = max(1, min(self.batch_size, len(batch)) // 2)
+        if len(batch) == 1:
+            self._fail(batch, error if isinstance(error, ResolveError) else ResolveError(str(error)))
+            return
+        middle = len(batch) // 2
+        self._send(batch[:middle])
+        self._send(batch[middle:])
+
+    def _fail(self, keys, error):
+        with self._lock:
+            for key in keys:
+                pending = self._pending.get(key)
+                if pending is not None and not pending.event.is_set():
+                    pending.error = error
+                    pending.done()
+
+    def _finish(self, key, value):
+        with self._lock:
+            pending = self._pending.get(key)
+            # Keys cancelled while their batch was in flight have already failed
+            if pending is not None and not pending.event.is_set():
+                pending.value = value
+                pending.done()
+
+
+class SlugResolver(BatchLoader):
+    """
+    Building slugs to buildingBySlug results (None for unknown slugs).
+
+    With history_field (see nested_history_field) each result also carries
+    the building's rental history under that field, so a building needs one
+    round trip instead of a lookup followed by a HistoryLoader batch; the
+    results are then as large as histories, and so are the batches.
+    """
+
+    field = BUILDING_QUERY_FIELD
+    argument = 'slug'
+    argument_type = 'String!'
+    selection = BUILDING_FIELDS
+
+    def __init__(self, post, loaders=2, batch_size=BATCH_SIZE, max_batch_size=MAX_BATCH_SIZE, growth=BATCH_GROWTH,
+                 stopped=None, history_field=None):
+        self.history_field = history_field
+        if history_field:
+            self.selection = f'{BUILDING_FIELDS}    {history_field} {{ {HISTORY_FIELDS} }}'
+            batch_size = min(batch_size, HISTORY_BATCH_SIZE)
+            max_batch_size = min(max_batch_size, HISTORY_MAX_BATCH_SIZE)
+            growth = min(growth, HISTORY_BATCH_GROWTH)
+        super().__init__(post, loaders, batch_size, max_batch_size, growth, stopped)
+
+
+class HistoryLoader(BatchLoader):
+    """
+    Building IDs to their rentalsHistoryByBuildingId results. Histories are
+    much larger than building lookups, so batches are smaller.
+    """
+
+    field = HISTORY_QUERY_FIELD
+    argument = 'id'
+    argument_type = 'ID!'
+    selection = HISTORY_FIELDS
+
+    def __init__(self, post, loaders=2, batch_size=HISTORY_BATCH_SIZE, max_batch_size=HISTORY_MAX_BATCH_SIZE,
+                 growth=HISTORY_BATCH_GROWTH, stopped=None):
+        super().__init__(post, loaders, batch_size, max_batch_size, growth, stopped)
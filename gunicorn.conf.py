@@ -0,0 +1,37 @@
+# Production serving: gunicorn -c gunicorn.conf.py server:app
+#
+# A publisher process, started by the master next to the workers, builds each
+# listing snapshot once and publishes it as a memory-mapped file; workers map
+# it read-only, so memory stays flat as the number of workers grows. The
+# master itself stays a plain process manager: no data and no threads to fork.
+import os
+import subprocess
+import sys
+
+os.environ.setdefault('SNAPSHOT_DIR', 'snapshots')
+
+bind = os.environ.get('BIND', '0.0.0.0:5001')
+workers = int(os.environ.get('WEB_CONCURRENCY', 4))
+# 'gthread' (default): a thread per in-flight request, so /api/scraper-events streams don't each hold
+# a whole worker. 'gevent': each request is a greenlet, so slow geocoder calls and event streams only
+# park a coroutine and never starve listing queries of threads.
+worker_class = os.environ.get('WORKER_CLASS', 'gthread')
+threads = int(os.environ.get('WORKER_THREADS', 8))
+worker_connections = int(os.environ.get('WORKER_CONNECTIONS', 1000))
+
+
+publisher = None
+
+
+def when_ready(server):
+    global publisher
+    script = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'mapped_snapshot.py')
+    publisher = subprocess.Popen([sys.executable, script])
+    server.log.info(f"Started snapshot publisher (pid: {publisher.pid})")
+
+
+def on_exit(server):
+    # poll() also notices if the master already reaped it
+    if publisher is not None and publisher.poll() is None:
+        publisher.terminate()
+        publisher.wait()
@@ -0,0 +1,123 @@
+from datetime import date
+
+from listing_view import LISTING_FIELDS
+from storage import normalize_unit
+
+# Fields compared between snapshot versions; days_on_market follows from offMarketAt
+DIFF_FIELDS = tuple(f for f in LISTING_FIELDS if f != 'days_on_market') + ('status',)
+
+
+def unit_key(row):
+    """Identity of a unit across snapshot versions"""
+    return row['building_slug'], normalize_unit(row['unit'])
+
+
+def _identity(row):
+    """How a unit is referred to in removed/changed entries: as the client last saw it"""
+    return {'building_slug': row['building_slug'], 'unit': row['unit'], 'id': row['id']}
+
+
+def _rows(view):
+    """Unit key -> (row with status, off-market ordinal); the first row wins if two units normalize alike"""
+    rows = {}
+    for row, status, ordinal in zip(view.rows, view.statuses, view.off_market_ordinals):
+        rows.setdefault(unit_key(row), (dict(row, status=status), ordinal))
+    return rows
+
+
+class SnapshotDiff:
+    """
+    Listing changes between two consecutive snapshot versions, keyed by
+    unit_key.
+
+    Each entry is ('added', row, ordinal), ('removed', identity) or
+    ('changed', identity, fields, ordinal), where fields holds the new
+    values of the DIFF_FIELDS that differ (all of them for a unit that was
+    removed and came back). Diffs of consecutive versions can be combined
+    with then().
+    """
+
+    def __init__(self, entries):
+        self.entries = entries
+
+    @classmethod
+    def between(cls, old_view, new_view):
+        old, new = _rows(old_view), _rows(new_view)
+        entries = {}
+        for key, (row, ordinal) in new.items():
+            previous = old.get(key)
+            if previous is None:
+                entries[key] = ('added', row, ordinal)
+                continue
+            fields = {f: row[f] for f in DIFF_FIELDS if row[f] != previous[0][f]}
+            if fields:
+                entries[key] = ('changed', _identity(previous[0]), fields, ordinal)
+        for key, (row, _) in old.items():
+            if key not in new:
+                entries[key] = ('removed', _identity(row))
+        return cls(entries)
+
+    def then(self, later):
+        """The combined diff of this one followed by a later one"""
+        entries = dict(self.entries)
+        for key, entry in later.entries.items():
+            earlier = entries.get(key)
+            if earlier is None:
+                entries[key] = entry
+            elif earlier[0] == 'removed':
+                if entry[0] == 'added':
+                    # Back after being removed: clients still hold the old row, so this changes it
+                    entries[key] = ('changed', earlier[1], {f: entry[1][f] for f in DIFF_FIELDS}, entry[2])
+                else:
+                    entries[key] = entry
+            elif entry[0] == 'removed':
+                if earlier[0] == 'added':
+                    del entries[key]
+                else:
+                    entries[key] = ('removed', earlier[1])
+            elif earlier[0] == 'added':
+                row = dict(earlier[1], **entry[2]) if entry[0] == 'changed' else entry[1]
+                entries[key] = ('added', row, entry[-1])
+            elif entry[0] == 'changed':
+                entries[key] = ('changed', earlier[1], dict(earlier[2], **entry[2]), entry[3])
+            else:
+                entries[key] = entry
+        return SnapshotDiff(entries)
+
+    def __len__(self):
+        return len(self.entries)
+
+    def render(self, today=None):
+        """JSON-ready added/changed/removed lists, with days_on_market as of today"""
+        today = (today or date.today()).toordinal()
+        added, changed, removed = [], [], []
+        for entry in self.entries.values():
+            if entry[0] == 'added':
+                _, row, ordinal = entry
+                added.append(dict(row, days_on_market=today - ordinal if ordinal is not None else 0))
+            elif entry[0] == 'changed':
+                _, identity, fields, ordinal = entry
+                if 'offMarketAt' in fields:
+                    fields = dict(fields, days_on_market=today - ordinal if ordinal is not None else 0)
+                changed.append(dict(identity, fields=fields))
+            else:
+                removed.append(entry[1])
+        return {'added': added, 'changed': changed, 'removed': removed}
+
+
+def changes_between(changes, since, current):
+    """
+    Combined SnapshotDiff from version since to version current, given a
+    {version: (previous version, diff)} history, or None if the history
+    doesn't reach back to since
+    """
+    diffs = []
+    while current != since:
+        if current not in changes or len(diffs) == len(changes):
+            return None
+        current, diff = changes[current]
+        diffs.append(diff)
+    combined = SnapshotDiff({})
+    for diff in reversed(diffs):
+        combined = combined.then(diff)
+    return combined
@@ -0,0 +1,399 @@
+from datetime import date
+
+import numpy as np
+
+from storage import last_off_market_days, normalize_area
+
+# days_filter values as inclusive days_on_market ranges
+DAYS_FILTERS = {'0-7': (-np.inf, 6), '7-30': (7, 30), '30+': (31, np.inf)}
+
+# Columns /api/listings can be sorted by
+SORT_KEYS = ('price', 'days_on_market')
+
+# Side of a GridIndex cell in degrees (roughly 550m north-south in NYC)
+GRID_CELL_DEGREES = 0.005
+
+
+def _encode(values):
+    """Dictionary-encode a list of values into (codes, distinct values)"""
+    table = {}
+    codes = np.fromiter((table.setdefault(v, len(table)) for v in values), dtype=np.int32, count=len(values))
+    return codes, list(table)
+
+
+def _number(value):
+    try:
+        return float(value)
+    except (TypeError, ValueError):
+        return np.nan
+
+
+def _tristate(values):
+    """1 where a value equals True, 0 where it equals False, -1 for anything else (e.g. None)"""
+    return np.fromiter((1 if v == True else 0 if v == False else -1 for v in values),  # noqa: E712
+                       dtype=np.int8, count=len(values))
+
+
+def bedroom_keys(bedrooms, values):
+    """The beds values a bedrooms filter ('3+', 'Studio' or an exact count) selects"""
+    if bedrooms == '3+':
+        return [v for v in values if v and v.isdigit() and int(v) >= 3]
+    if bedrooms == 'Studio':
+        return ['0', 'Studio']
+    return [bedrooms]
+
+
+class BitmapIndex:
+    """
+    Inverted index of packed bitmaps, one per distinct value of each
+    categorical field. A request intersects a handful of bitsets instead of
+    scanning every row.
+    """
+
+    def __init__(self, size):
+        self.size = size
+        self._bitmaps = {}
+        self.empty = np.zeros((size + 7) // 8, dtype=np.uint8)
+
+    def add(self, field, key, mask):
+        """Add (or OR into) the bitmap for field == key"""
+        bits = np.packbits(mask)
+        existing = self._bitmaps.get((field, key))
+        self._bitmaps[(field, key)] = bits if existing is None else existing | bits
+
+    def add_encoded(self, field, codes, values, key=None):
+        """Add one bitmap per distinct value of a dictionary-encoded column"""
+        order = np.argsort(codes, kind='stable')
+        bounds = np.searchsorted(codes[order], np.arange(len(values) + 1))
+        for code, value in enumerate(values):
+            mask = np.zeros(self.size, dtype=bool)
+            mask[order[bounds[code]:bounds[code + 1]]] = True
+            self.add(field, key(value) if key else value, mask)
+
+    def keys(self, field):
+        return [k for f, k in self._bitmaps if f == field]
+
+    def get(self, field, key):
+        return self._bitmaps.get((field, key), self.empty)
+
+    def any_of(self, field, keys):
+        """Union of the bitmaps for several values of one field"""
+        result = self.empty
+        for key in keys:
+            result = result | self.get(field, key)
+        return result
+
+    def to_mask(self, bits):
+        return np.unpackbits(bits, count=self.size).view(bool)
+
+
+def normalize_filters(filters):
+    """
+    Canonical, hashable form of a /api/listings filter dict.
+
+    Filters that have no effect are dropped and equivalent spellings are
+    unified, so requests that select the same rows get the same key.
+    """
+    normalized = {}
+    area = filters.get('area')
+    if area and area != 'all':
+        normalized['area'] = normalize_area(area)
+    for field in ('bedrooms', 'laundry'):
+        if filters.get(field, 'all') != 'all':
+            normalized[field] = filters[field]
+    for field in ('pets', 'outdoor'):
+        if filters.get(field, 'all') != 'all':
+            normalized[field] = 'true' if filters[field].lower() == 'true' else 'false'
+    if filters.get('by_owner') in ('true', 'false'):
+        normalized['by_owner'] = filters['by_owner']
+    if filters.get('rent_stabilized') in ('likely', 'unlikely', 'high', 'medium', 'low'):
+        normalized['rent_stabilized'] = filters['rent_stabilized']
+    for field in ('min_price', 'max_price'):
+        if filters.get(field) is not None:
+            normalized[field] = filters[field]
+    if filters.get('days_filter') in DAYS_FILTERS:
+        normalized['days_filter'] = filters['days_filter']
+    if last_off_market_days(filters.get('last_off_market')):
+        normalized['last_off_market'] = filters['last_off_market']
+    if filters.get('offmarket_month_start') and filters.get('offmarket_month_end'):
+        normalized['offmarket_month_start'] = filters['offmarket_month_start']
+        normalized['offmarket_month_end'] = filters['offmarket_month_end']
+    if filters.get('bbox'):
+        normalized['bbox'] = tuple(filters['bbox'])
+    return tuple(sorted(normalized.items()))
+
+
+class SortedIndex:
+    """Row numbers ordered by a column, so range predicates become binary searches"""
+
+    def __init__(self, values):
+        self.order = np.argsort(values, kind='stable')
+        self.values = values[self.order]
+        self.rank = np.empty_like(self.order)
+        self.rank[self.order] = np.arange(len(self.order))
+        # NaNs sort last; keep them out of open-ended ranges
+        self.valid = len(values) - int(np.count_nonzero(np.isnan(values))) if values.dtype.kind == 'f' else len(values)
+
+    def range(self, low=None, high=None):
+        """Rows with low <= value <= high (either bound may be None)"""
+        lo = 0 if low is None else np.searchsorted(self.values, low, 'left')
+        hi = self.valid if high is None else np.searchsorted(self.values, high, 'right')
+        return self.order[lo:max(lo, hi)]
+
+
+class GridIndex:
+    """
+    Uniform latitude/longitude grid over the listings with coordinates.
+
+    Rows are ordered by cell (row-major), so the cells a bounding box covers
+    in one grid row form a single contiguous slice.
+    """
+
+    def __init__(self, latitude, longitude, cell_size=GRID_CELL_DEGREES):
+        self.latitude = latitude
+        self.longitude = longitude
+        self.cell_size = cell_size
+        rows = np.flatnonzero(~(np.isnan(latitude) | np.isnan(longitude)))
+        self.origin = (latitude[rows].min(), longitude[rows].min()) if len(rows) else (0.0, 0.0)
+        y, x = self._cell(latitude[rows], longitude[rows])
+        self.shape = (int(y.max()) + 1, int(x.max()) + 1) if len(rows) else (0, 0)
+        keys = y * self.shape[1] + x
+        order = np.argsort(keys, kind='stable')
+        self.keys = keys[order]
+        self.order = rows[order]
+
+    def _cell(self, latitude, longitude):
+        return (np.floor((latitude - self.origin[0]) / self.cell_size).astype(np.int64),
+                np.floor((longitude - self.origin[1]) / self.cell_size).astype(np.int64))
+
+    def range(self, south, west, north, east):
+        """Rows with south <= latitude <= north and west <= longitude <= east, in no particular order"""
+        (y0, x0), (y1, x1) = zip(*self._cell(np.array([south, north]), np.array([west, east])))
+        y0, x0 = max(y0, 0), max(x0, 0)
+        y1, x1 = min(y1, self.shape[0] - 1), min(x1, self.shape[1] - 1)
+        if y0 > y1 or x0 > x1:
+            return self.order[:0]
+        grid_rows = np.arange(y0, y1 + 1) * self.shape[1]
+        starts = np.searchsorted(self.keys, grid_rows + x0, 'left')
+        ends = np.searchsorted(self.keys, grid_rows + x1, 'right')
+        rows = np.concatenate([self.order[start:end] for start, end in zip(starts, ends)])
+        # Cells on the edge of the box are only partly inside it
+        lat, lon = self.latitude[rows], self.longitude[rows]
+        return rows[(lat >= south) & (lat <= north) & (lon >= west) & (lon <= east)]
+
+
+class ListingIndex:
+    """
+    Columnar copy of a ListingView used to evaluate /api/listings filters.
+
+    Categorical filters resolve to bitmap intersections (see BitmapIndex),
+    range filters to contiguous slices of sorted indexes (see SortedIndex)
+    and bounding boxes to grid cells (see GridIndex).
+    Only the surviving row numbers are turned back into listing dicts.
+    """
+
+    def __init__(self, view):
+        rows = view.rows
+        self.size = len(rows)
+        self.price = np.fromiter((_number(r['price']) for r in rows), dtype=np.float64, count=self.size)
+        self.latitude = np.fromiter((_number(r['latitude']) for r in rows), dtype=np.float64, count=self.size)
+        self.longitude = np.fromiter((_number(r['longitude']) for r in rows), dtype=np.float64, count=self.size)
+        self.off_market = np.fromiter((o if o is not None else -1 for o in view.off_market_ordinals),
+                                      dtype=np.int64, count=self.size)
+        self.month = np.fromiter((date.fromordinal(o).month if o is not None else 0
+                                  for o in view.off_market_ordinals), dtype=np.int8, count=self.size)
+        self.is_owner = np.fromiter((bool(r['is_owner']) for r in rows), dtype=bool, count=self.size)
+        self.stabilized = np.fromiter((bool(r['likely_stabilized']) for r in rows), dtype=bool, count=self.size)
+        self.pets = _tristate([r['pets_allowed'] for r in rows])
+        self.outdoor = _tristate([r['private_outdoor_space'] for r in rows])
+        self.area, self.area_values = _encode([r['source_area'] or '' for r in rows])
+        self.beds, self.beds_values = _encode([r['beds'] for r in rows])
+        self.laundry, self.laundry_values = _encode([r['laundry_type'] for r in rows])
+        self.status, self.status_values = _encode(view.statuses)
+        self.confidence, self.confidence_values = _encode(
+            [str(r['stabilization_confidence'] or '').lower() for r in rows])
+
+        # Area keys are normalized once here rather than per row per request
+        self.bitmaps = BitmapIndex(self.size)
+        self.bitmaps.add_encoded('area', self.area, self.area_values, key=normalize_area)
+        self.bitmaps.add_encoded('beds', self.beds, self.beds_values)
+        self.bitmaps.add_encoded('laundry', self.laundry, self.laundry_values)
+        self.bitmaps.add('by_owner', 'true', self.is_owner)
+        self.bitmaps.add('by_owner', 'false', ~self.is_owner)
+        self.bitmaps.add('pets', 'true', self.pets == 1)
+        self.bitmaps.add('pets', 'false', self.pets == 0)
+        self.bitmaps.add('outdoor', 'true', self.outdoor == 1)
+        self.bitmaps.add('outdoor', 'false', self.outdoor == 0)
+        self.bitmaps.add('rent_stabilized', 'likely', self.stabilized)
+        self.bitmaps.add('rent_stabilized', 'unlikely', ~self.stabilized)
+        for code, confidence in enumerate(self.confidence_values):
+            if confidence in ('high', 'medium', 'low'):
+                self.bitmaps.add('rent_stabilized', confidence, self.stabilized & (self.confidence == code))
+
+        # Sorted secondary indexes for range filters and server-side sorting
+        self.price_index = SortedIndex(self.price)
+        self.off_market_index = SortedIndex(self.off_market)
+        self.month_index = SortedIndex(self.month)
+        # Most recently off market first, i.e. ascending days_on_market; unknown dates last
+        days_key = np.where(self.off_market >= 0, -self.off_market, np.iinfo(np.int64).max)
+        self.sort_indexes = {'price': self.price_index, 'days_on_market': SortedIndex(days_key)}
+        self.grid_index = GridIndex(self.latitude, self.longitude)
+
+    def days_on_market(self, today=None):
+        """days_on_market column as of today (0 where the off-market date is unknown)"""
+        today = (today or date.today()).toordinal()
+        return np.where(self.off_market >= 0, today - self.off_market, 0)
+
+    def categorical_bits(self, filters):
+        """Packed bitmap of the rows matching the categorical filters, or None if there are none"""
+        bitmaps = self.bitmaps
+        selected = []
+
+        area = filters.get('area')
+        if area and area != 'all':
+            area = normalize_area(area)
+            # Listings without a source_area never match an area filter
+            selected.append(bitmaps.get('area', area) if area else bitmaps.empty)
+
+        bedrooms = filters.get('bedrooms', 'all')
+        if bedrooms != 'all':
+            selected.append(bitmaps.any_of('beds', bedroom_keys(bedrooms, bitmaps.keys('beds'))))
+
+        laundry = filters.get('laundry', 'all')
+        if laundry != 'all':
+            selected.append(bitmaps.get('laundry', laundry))
+        if filters.get('by_owner') in ('true', 'false'):
+            selected.append(bitmaps.get('by_owner', filters['by_owner']))
+        if filters.get('rent_stabilized') in ('likely', 'unlikely', 'high', 'medium', 'low'):
+            selected.append(bitmaps.get('rent_stabilized', filters['rent_stabilized']))
+        for field in ('pets', 'outdoor'):
+            value = filters.get(field, 'all')
+            if value != 'all':
+                selected.append(bitmaps.get(field, 'true' if value.lower() == 'true' else 'false'))
+
+        if not selected:
+            return None
+        bits = selected[0]
+        for other in selected[1:]:
+            bits = bits & other
+        return bits
+
+    def _range_filters(self, filters, today):
+        """
+        Resolve the range filters to (candidate rows, row test) pairs.
+
+        Candidates come from a binary search over a sorted index; the test
+        re-checks the same predicate for rows that were found via another index.
+        """
+        ranges = []
+        today = (today or date.today()).toordinal()
+
+        min_price, max_price = filters.get('min_price'), filters.get('max_price')
+        if min_price is not None or max_price is not None:
+            def price_test(rows):
+                ok = np.ones(len(rows), dtype=bool)
+                if min_price is not None:
+                    ok &= self.price[rows] >= min_price
+                if max_price is not None:
+                    ok &= self.price[rows] <= max_price
+                return ok
+            ranges.append((self.price_index.range(min_price, max_price), price_test))
+
+        days_range = DAYS_FILTERS.get(filters.get('days_filter', 'all'))
+        if days_range:
+            min_days, max_days = days_range
+            # days_on_market = today - ordinal, so a days range is an ordinal range.
+            # Rows without an off-market date count as 0 days.
+            rows = self.off_market_index.range(max(today - max_days, 0), today - min_days)
+            if min_days <= 0 <= max_days:
+                rows = np.concatenate([rows, self.off_market_index.range(-1, -1)])
+
+            def days_test(rows):
+                days = np.where(self.off_market[rows] >= 0, today - self.off_market[rows], 0)
+                return (days >= min_days) & (days <= max_days)
+            ranges.append((rows, days_test))
+
+        years_range = last_off_market_days(filters.get('last_off_market'))
+        if years_range:
+            min_age, max_age = years_range
+            # Unlike days_filter, listings without an off-market date never match
+            rows = self.off_market_index.range(max(today - max_age, 0), today - min_age)
+
+            def years_test(rows):
+                off_market = self.off_market[rows]
+                age = today - off_market
+                return (off_market >= 0) & (age >= min_age) & (age <= max_age)
+            ranges.append((rows, years_test))
+
+        month_start = filters.get('offmarket_month_start')
+        month_end = filters.get('offmarket_month_end')
+        if month_start and month_end:
+            if month_start <= month_end:
+                rows = self.month_index.range(month_start, month_end)
+            else:
+                # Wrap around year (e.g., Nov to Feb)
+                rows = np.concatenate([self.month_index.range(month_start, 12), self.month_index.range(1, month_end)])
+
+            def month_test(rows):
+                month = self.month[rows]
+                if month_start <= month_end:
+                    return (month >= month_start) & (month <= month_end)
+                return (month > 0) & ((month >= month_start) | (month <= month_end))
+            ranges.append((rows, month_test))
+
+        bbox = filters.get('bbox')
+        if bbox:
+            south, west, north, east = bbox
+
+            def bbox_test(rows):
+                lat, lon = self.latitude[rows], self.longitude[rows]
+                return (lat >= south) & (lat <= north) & (lon >= west) & (lon <= east)
+            ranges.append((self.grid_index.range(south, west, north, east), bbox_test))
+
+        return ranges
+
+    def select(self, filters, today=None, sort=None):
+        """
+        Row numbers of the listings matching the filters.
+
+        Rows are in view order, or ordered by one of SORT_KEYS ('-' prefix for
+        descending) using the presorted indexes instead of sorting the result.
+        """
+        bits = self.categorical_bits(filters)
+        ranges = self._range_filters(filters, today)
+        if ranges:
+            # Drive the query from the most selective range, then check the rest
+            ranges.sort(key=lambda r: len(r[0]))
+            rows = ranges[0][0]
+            if bits is not None:
+                rows = rows[(bits[rows >> 3] >> (7 - (rows & 7))) & 1 == 1]
+            for _, test in ranges[1:]:
+                rows = rows[test(rows)]
+            rows = np.sort(rows)
+        elif bits is not None:
+            rows = np.flatnonzero(self.bitmaps.to_mask(bits))
+        else:
+            rows = np.arange(self.size)
+
+        if sort:
+            rows = self.sort_rows(rows, sort)
+        return rows
+
+    def sort_rows(self, rows, sort):
+        """Reorder rows by a presorted index; unknown sort keys leave the order unchanged"""
+        index = self.sort_indexes.get(sort.lstrip('-'))
+        if index is None:
+            return rows
+        if len(rows) * 16 < self.size:
+            ordered = rows[np.argsort(index.rank[rows], kind='stable')]
+        else:
+            mask = np.zeros(self.size, dtype=bool)
+            mask[rows] = True
+            ordered = index.order[mask[index.order]]
+        return ordered[::-1] if sort.startswith('-') else ordered
+
+    def mask(self, filters, today=None):
+        """Boolean mask of the rows matching the /api/listings filters"""
+        mask = np.zeros(self.size, dtype=bool)
+        mask[self.select(filters, today)] = True
+        return mask
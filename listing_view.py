@@ -0,0 +1,284 @@
+import json
+import threading
+from datetime import date, datetime
+
+UNAVAILABLE_STATUSES = {
+    'NO_LONGER_AVAILABLE', 'RENTED', 'DELISTED', 'IN_CONTRACT', 'TEMPORARILY_OFF_MARKET', 'PAUSED'
+}
+
+# Ordinal used for missing or unparseable dates (same as datetime.min)
+MIN_ORDINAL = datetime.min.toordinal()
+
+
+class _DateParser:
+    """Parses YYYY-MM-DD strings to ordinals, memoizing since dates repeat a lot"""
+
+    def __init__(self):
+        self._cache = {}
+
+    def ordinal(self, value):
+        """Ordinal for a date string, or None if it is missing or malformed"""
+        try:
+            return self._cache[value]
+        except (KeyError, TypeError):
+            pass
+        try:
+            result = datetime.strptime(value, '%Y-%m-%d').toordinal()
+        except Exception:
+            result = None
+        try:
+            self._cache[value] = result
+        except TypeError:
+            pass
+        return result
+
+
+def most_recent_per_unit(listings, parser=None):
+    """
+    Keep only the most relevant listing per unit (building_slug + displayUnit).
+
+    Available listings win over unavailable ones; among available listings the
+    latest onMarketAt/availableAt wins, among unavailable ones the latest
+    offMarketAt. Accepts any iterable, so listings can be streamed in.
+    """
+    parser = parser or _DateParser()
+    best = {}
+    for listing in listings:
+        key = (listing.get('building_slug', ''), listing.get('displayUnit', ''))
+        status = listing.get('status', '')
+        off_market = listing.get('offMarketAt')
+        off_market_ord = (parser.ordinal(off_market) if off_market else None) or MIN_ORDINAL
+        current = best.get(key)
+        if current is None:
+            best[key] = (off_market_ord, listing)
+            continue
+        current_ord, current_listing = current
+        current_status = current_listing.get('status', '')
+        # Prefer available listings
+        if current_status in UNAVAILABLE_STATUSES and status not in UNAVAILABLE_STATUSES:
+            best[key] = (off_market_ord, listing)
+        # If both are available, prefer the latest onMarketAt or availableAt, else offMarketAt
+        elif status not in UNAVAILABLE_STATUSES and current_status not in UNAVAILABLE_STATUSES:
+            this_on = listing.get('onMarketAt') or listing.get('availableAt') or off_market
+            curr_on = (current_listing.get('onMarketAt') or current_listing.get('availableAt')
+                       or current_listing.get('offMarketAt'))
+            if (parser.ordinal(this_on) or MIN_ORDINAL) > (parser.ordinal(curr_on) or MIN_ORDINAL):
+                best[key] = (off_market_ord, listing)
+        # If both are unavailable, prefer the latest offMarketAt
+        elif status in UNAVAILABLE_STATUSES and current_status in UNAVAILABLE_STATUSES:
+            if off_market_ord > current_ord:
+                best[key] = (off_market_ord, listing)
+    return [listing for _, listing in best.values()]
+
+
+def transform_listing(listing):
+    """Map a scraped listing to the format the frontend expects (minus days_on_market)"""
+    return {
+        'id': listing.get('id', ''),
+        'price': listing.get('price', 0),
+        'beds': str(listing.get('bedroomCount', 0)),
+        'baths': str(listing.get('fullBathroomCount', 0) + (0.5 * listing.get('halfBathroomCount', 0))),
+        'sqft': listing.get('sqft', listing.get('livingAreaSize', 0)),
+        'unit': listing.get('displayUnit', 'N/A'),
+        'address': listing.get('building_address', ''),
+        'building_slug': listing.get('building_slug', ''),
+        'building_id': listing.get('building_id', ''),
+        'building_year_built': listing.get('building_year_built', 'N/A'),
+        'building_total_units': listing.get('building_total_units', 'N/A'),
+        'laundry_type': 'In building' if listing.get('laundryInBuilding', False) else 'None',
+        'pets_allowed': listing.get('petFriendly', False),
+        'private_outdoor_space': listing.get('privateOutdoorSpace', False),
+        'offMarketAt': listing.get('offMarketAt'),
+        'url': f"https://streeteasy.com/rental/{listing.get('id', '')}",
+        'agent_name': listing.get('agentName', 'Owner'),
+        'agent_phone': listing.get('agentPhone', 'N/A'),
+        'agent_email': listing.get('agentEmail', 'N/A'),
+        'likely_stabilized': listing.get('likely_stabilized', False),
+        'stabilization_confidence': listing.get('stabilization_confidence', ''),
+        'stabilization_evidence': listing.get('stabilization_evidence', ''),
+        'is_owner': listing.get('is_owner', False),
+        'latitude': listing.get('latitude', None),
+        'longitude': listing.get('longitude', None),
+        'source_area': listing.get('source_area', '')
+    }
+
+
+def frontend_listing(listing, today=None):
+    """transform_listing plus days_on_market as of today, for listings outside a ListingView"""
+    row = transform_listing(listing)
+    off_market = _DateParser().ordinal(listing.get('offMarketAt'))
+    row['days_on_market'] = (today or date.today()).toordinal() - off_market if off_market is not None else 0
+    return row
+
+
+# Every field of a materialized listing, for fields= projections
+LISTING_FIELDS = tuple(transform_listing({})) + ('days_on_market',)
+
+# Projections whose per-listing JSON is serialized once per snapshot: the full cards,
+# and the lightweight marker set (coordinates, price and the fields map popups and the
+# stats bar use) that /api/listings clients request for maps
+FIELD_PROFILES = {
+    'full': LISTING_FIELDS,
+    'marker': ('id', 'latitude', 'longitude', 'price', 'address', 'offMarketAt', 'likely_stabilized'),
+}
+
+_DAYS_PLACEHOLDER = b'"days_on_market":0'
+
+
+def serialize(obj):
+    """JSON bytes in the same form as Flask's jsonify (compact, sorted keys)"""
+    return json.dumps(obj, sort_keys=True, separators=(',', ':')).encode()
+
+
+def profile_for(fields):
+    """Name of the FIELD_PROFILES entry covering exactly these fields, if any"""
+    if not fields:
+        return 'full'
+    for name, profile_fields in FIELD_PROFILES.items():
+        if set(fields) == set(profile_fields):
+            return name
+    return None
+
+
+class _DaySequence:
+    """Read-only sequence whose items are computed on access, instead of materializing a per-day copy"""
+
+    def __init__(self, size, item):
+        self._size = size
+        self._item = item
+
+    def __len__(self):
+        return self._size
+
+    def __getitem__(self, i):
+        if not -self._size <= i < self._size:
+            raise IndexError(i)
+        return self._item(i % self._size)
+
+    def __iter__(self):
+        return map(self._item, range(self._size))
+
+
+class ListingView:
+    """
+    The deduplicated, frontend-shaped listings for one snapshot version.
+
+    Nothing here depends on request filters, so it is built once when a
+    snapshot is loaded. days_on_market is the only time-dependent field; it is
+    derived from the stored off-market date ordinal and the materialized rows
+    are rebuilt at most once per day.
+
+    Each row is also serialized once per FIELD_PROFILES entry, so responses
+    can be assembled by joining JSON fragments. Profiles that include
+    days_on_market are stored as a prefix/suffix pair around that value.
+
+    A view unpickled from a shared memory-mapped snapshot (see
+    mapped_snapshot) doesn't materialize per-day copies; its rows and
+    fragments are computed on access.
+    """
+
+    def __init__(self, listings):
+        parser = _DateParser()
+        self.rows = []
+        self.off_market_ordinals = []
+        self.statuses = []
+        for listing in most_recent_per_unit(listings, parser):
+            self.rows.append(transform_listing(listing))
+            self.off_market_ordinals.append(parser.ordinal(listing.get('offMarketAt')))
+            self.statuses.append(listing.get('status') or '')
+        self._lock = threading.Lock()
+        self._materialized = (None, None)
+        self._fragment_parts = {name: self._serialize_profile(fields) for name, fields in FIELD_PROFILES.items()}
+        self._fragments = {}
+        self.materialize = True
+
+    def __getstate__(self):
+        state = dict(self.__dict__)
+        for name in ('_lock', '_materialized', '_fragments'):
+            del state[name]
+        return state
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self._lock = threading.Lock()
+        self._materialized = (None, None)
+        self._fragments = {}
+        self.materialize = False
+
+    def _serialize_profile(self, fields):
+        if 'days_on_market' not in fields:
+            return [serialize({f: row[f] for f in fields}) for row in self.rows], None
+        prefixes, suffixes = [], []
+        for row in self.rows:
+            fragment = serialize(dict({f: row[f] for f in fields if f != 'days_on_market'}, days_on_market=0))
+            prefix, _, suffix = fragment.partition(_DAYS_PLACEHOLDER)
+            prefixes.append(prefix + b'"days_on_market":')
+            suffixes.append(suffix)
+        return prefixes, suffixes
+
+    def __len__(self):
+        return len(self.rows)
+
+    @staticmethod
+    def _days(off_market_ordinal, today_ordinal):
+        return today_ordinal - off_market_ordinal if off_market_ordinal is not None else 0
+
+    def days_on_market(self, today=None):
+        """Days since each listing went off market, relative to today"""
+        today = (today or date.today()).toordinal()
+        return [self._days(o, today) for o in self.off_market_ordinals]
+
+    def listings(self, today=None):
+        """Complete frontend dicts, including days_on_market as of today"""
+        today = today or date.today()
+        if not self.materialize:
+            ordinal = today.toordinal()
+            return _DaySequence(len(self.rows), lambda i: dict(
+                self.rows[i], days_on_market=self._days(self.off_market_ordinals[i], ordinal)))
+        day, rows = self._materialized
+        if day == today:
+            return rows
+        with self._lock:
+            day, rows = self._materialized
+            if day != today:
+                rows = [dict(row, days_on_market=days)
+                        for row, days in zip(self.rows, self.days_on_market(today))]
+                self._materialized = (today, rows)
+        return rows
+
+    def project(self, indices, fields, today=None):
+        """Dicts of the given fields for the rows at indices; each row is read once"""
+        rows = self.rows
+        if 'days_on_market' not in fields:
+            return [{f: row[f] for f in fields} for row in map(rows.__getitem__, indices)]
+        today = (today or date.today()).toordinal()
+        ordinals = self.off_market_ordinals
+        fields = [f for f in fields if f != 'days_on_market']
+        projected = []
+        for i in indices:
+            row = rows[i]
+            item = {f: row[f] for f in fields}
+            item['days_on_market'] = self._days(ordinals[i], today)
+            projected.append(item)
+        return projected
+
+    def fragments(self, profile, today=None):
+        """Per-row JSON bytes for a FIELD_PROFILES entry, with days_on_market as of today"""
+        prefixes, suffixes = self._fragment_parts[profile]
+        if suffixes is None:
+            return prefixes
+        today = today or date.today()
+        if not self.materialize:
+            ordinal = today.toordinal()
+            return _DaySequence(len(prefixes), lambda i: b'%s%d%s' % (
+                prefixes[i], self._days(self.off_market_ordinals[i], ordinal), suffixes[i]))
+        day, fragments = self._fragments.get(profile, (None, None))
+        if day == today:
+            return fragments
+        with self._lock:
+            day, fragments = self._fragments.get(profile, (None, None))
+            if day != today:
+                fragments = [b'%s%d%s' % (p, days, s)
+                             for p, days, s in zip(prefixes, self.days_on_market(today), suffixes)]
+                self._fragments[profile] = (today, fragments)
+        return fragments
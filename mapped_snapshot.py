@@ -0,0 +1,341 @@
+import json
+import mmap
+import os
+import pickle
+import struct
+import threading
+import time
+
+import numpy as np
+
+from listing_changes import changes_between
+from snapshot import SnapshotManager
+
+SNAPSHOT_DIR = os.environ.get('SNAPSHOT_DIR', 'snapshots')
+
+# Names the current snapshot file; rewritten atomically whenever a new version is published
+VERSION_FILE = 'CURRENT'
+
+# Published files kept besides the current one, for workers still switching over
+KEEP_FILES = 2
+
+# Seconds between checks for a newly published version (workers) or new data (publisher)
+CHECK_INTERVAL = 1
+
+MAGIC = b'LXSNAP1\n'
+_HEADER = struct.Struct('<8sQ')
+_ALIGN = 64
+
+# Lists at least this long are stored as mapped tables instead of pickled objects
+MIN_TABLE_LENGTH = 256
+
+_NO_INT = int(np.iinfo(np.int64).min)
+
+
+class _Table:
+    """Read-only sequence over a mapped table of variable-length items"""
+
+    def __init__(self, offsets, data):
+        # memoryviews index faster than arrays and hand back plain ints and bytes
+        self._offsets = memoryview(offsets)
+        self._data = memoryview(data)
+        self._size = len(offsets) - 1
+
+    def __len__(self):
+        return self._size
+
+    def __getitem__(self, i):
+        if i < 0:
+            i += self._size
+        if not 0 <= i < self._size:
+            raise IndexError(i)
+        return self._decode(self._data[self._offsets[i]:self._offsets[i + 1]])
+
+    def __iter__(self):
+        return map(self.__getitem__, range(self._size))
+
+    @staticmethod
+    def _decode(raw):
+        return raw.tobytes()
+
+
+class _Strings(_Table):
+    @staticmethod
+    def _decode(raw):
+        return str(raw, 'utf-8')
+
+
+class _Rows(_Table):
+    """
+    Mapped row dicts, each parsed on first access and kept, so a worker
+    parses a row at most once per snapshot rather than once per request.
+    Rows that are never read (e.g. those only served as pre-serialized
+    fragments) stay in the shared pages.
+    """
+
+    def __init__(self, offsets, data):
+        super().__init__(offsets, data)
+        self._parsed = [None] * self._size
+
+    def __getitem__(self, i):
+        row = self._parsed[i]
+        if row is None:
+            # Racing threads may both parse a row; either result is the same
+            row = self._parsed[i] = super().__getitem__(i)
+        return row
+
+    @staticmethod
+    def _decode(raw):
+        return json.loads(raw.tobytes())
+
+
+class _OptionalInts:
+    """Read-only sequence of ints or None over a mapped int64 column"""
+
+    def __init__(self, values):
+        self._values = memoryview(values)
+
+    def __len__(self):
+        return len(self._values)
+
+    def __getitem__(self, i):
+        value = self._values[i]
+        return None if value == _NO_INT else value
+
+    def __iter__(self):
+        return map(self.__getitem__, range(len(self)))
+
+
+_ENCODERS = (
+    ('bytes', lambda item: type(item) is bytes, lambda item: item, _Table),
+    ('str', lambda item: type(item) is str, lambda item: item.encode('utf-8'), _Strings),
+    ('rows', lambda item: type(item) is dict, lambda item: json.dumps(item).encode(), _Rows),
+)
+
+
+class _Writer(pickle.Pickler):
+    """
+    Pickles a snapshot with its bulk data moved out of line: numpy arrays
+    and long homogeneous lists go to an aligned data section that readers
+    map instead of unpickling.
+    """
+
+    def __init__(self, file):
+        super().__init__(file, protocol=pickle.HIGHEST_PROTOCOL)
+        self.sections = []
+        self.size = 0
+
+    def _array(self, array):
+        array = np.ascontiguousarray(array)
+        self.size += -self.size % _ALIGN
+        offset = self.size
+        self.sections.append((offset, array))
+        self.size += array.nbytes
+        return ('array', array.dtype.str, array.shape, offset)
+
+    def persistent_id(self, obj):
+        if isinstance(obj, np.ndarray) and obj.dtype.kind not in 'OV':
+            return self._array(obj)
+        if type(obj) is not list or len(obj) < MIN_TABLE_LENGTH:
+            return None
+        if all(item is None or type(item) is int for item in obj):
+            return ('ints', self._array(np.array([_NO_INT if item is None else item for item in obj], dtype=np.int64)))
+        for kind, accepts, encode, _ in _ENCODERS:
+            if all(accepts(item) for item in obj):
+                items = [encode(item) for item in obj]
+                offsets = np.zeros(len(items) + 1, dtype=np.int64)
+                np.cumsum([len(item) for item in items], out=offsets[1:])
+                data = np.frombuffer(b''.join(items), dtype=np.uint8)
+                return (kind, self._array(offsets), self._array(data))
+        return None
+
+
+class _Reader(pickle.Unpickler):
+    def __init__(self, file, buffer, data_offset):
+        super().__init__(file)
+        self.buffer = buffer
+        self.data_offset = data_offset
+
+    def _array(self, pid):
+        _, dtype, shape, offset = pid
+        dtype = np.dtype(dtype)
+        count = int(np.prod(shape))
+        return np.frombuffer(self.buffer, dtype, count, self.data_offset + offset).reshape(shape)
+
+    def persistent_load(self, pid):
+        if pid[0] == 'array':
+            return self._array(pid)
+        if pid[0] == 'ints':
+            return _OptionalInts(self._array(pid[1]))
+        for kind, _, _, table in _ENCODERS:
+            if pid[0] == kind:
+                return table(self._array(pid[1]), self._array(pid[2]))
+        raise pickle.UnpicklingError(f"Unknown persistent id {pid[0]!r}")
+
+
+def write_snapshot(path, snapshot, changes=None):
+    """
+    Write a snapshot, plus its {version: (previous, diff)} change history,
+    as a mappable file. Written to a temp file and renamed into place.
+    """
+    temp_path = f"{path}.{os.getpid()}.tmp"
+    with open(temp_path, 'wb') as f:
+        f.write(_HEADER.pack(MAGIC, 0))
+        writer = _Writer(f)
+        writer.dump({'snapshot': snapshot, 'changes': changes or {}})
+        data_offset = f.tell() + (-f.tell() % _ALIGN)
+        for offset, array in writer.sections:
+            f.seek(data_offset + offset)
+            f.write(array.data)
+        f.seek(0)
+        f.write(_HEADER.pack(MAGIC, data_offset))
+    os.replace(temp_path, path)
+
+
+def read_snapshot(path):
+    """(snapshot, change history) from a file written by write_snapshot, sharing its pages read-only"""
+    with open(path, 'rb') as f:
+        buffer = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        magic, data_offset = _HEADER.unpack_from(buffer)
+        if magic != MAGIC or not data_offset:
+            raise ValueError(f"{path} is not a complete snapshot file")
+        f.seek(_HEADER.size)
+        state = _Reader(f, buffer, data_offset).load()
+    return state['snapshot'], state['changes']
+
+
+def _write_version_file(directory, name):
+    path = os.path.join(directory, VERSION_FILE)
+    temp_path = f"{path}.{os.getpid()}.tmp"
+    with open(temp_path, 'w') as f:
+        f.write(name)
+    os.replace(temp_path, path)
+
+
+class SnapshotPublisher:
+    """
+    Builds snapshots once, in one process, and publishes them for
+    MappedSnapshots readers: each new version is written to the snapshot
+    directory and then named in its version file.
+    """
+
+    def __init__(self, directory=SNAPSHOT_DIR, manager=None):
+        self.directory = directory
+        self.manager = manager or SnapshotManager()
+        self.published = None
+        self._thread = None
+
+    def publish(self):
+        """Load the latest data and publish it if it is a new version; returns the current file name"""
+        snapshot = self.manager.refresh()
+        if self.published is not None and snapshot.version == self.published[0]:
+            return self.published[1]
+        os.makedirs(self.directory, exist_ok=True)
+        name = f"snapshot-{snapshot.version}-{int(time.time())}.bin"
+        write_snapshot(os.path.join(self.directory, name), snapshot, self.manager.change_history())
+        _write_version_file(self.directory, name)
+        self.published = (snapshot.version, name)
+        print(f"Published snapshot {snapshot.version} ({len(snapshot.view)} listings) to {name}")
+        self._prune(name)
+        return name
+
+    def _prune(self, current):
+        files = sorted((f for f in os.listdir(self.directory) if f.startswith('snapshot-') and f.endswith('.bin')),
+                       key=lambda f: os.path.getmtime(os.path.join(self.directory, f)))
+        for name in [f for f in files if f != current][:-KEEP_FILES or None]:
+            # Readers that still map an old file keep its pages until they let go of it
+            os.remove(os.path.join(self.directory, name))
+
+    def run(self, interval=CHECK_INTERVAL):
+        """Keep publishing new versions, checking every interval seconds"""
+        while True:
+            time.sleep(interval)
+            try:
+                self.publish()
+            except Exception as e:
+                print(f"Error publishing snapshot: {e}")
+
+    def start(self, interval=CHECK_INTERVAL):
+        """Publish the current data now, then keep publishing new versions from a background thread"""
+        self.publish()
+        self._thread = threading.Thread(target=self.run, args=(interval,))
+        self._thread.daemon = True
+        self._thread.start()
+
+
+class MappedSnapshots:
+    """
+    SnapshotManager counterpart for multi-process serving: snapshots are
+    not parsed here but mapped read-only from the files a SnapshotPublisher
+    writes, so all worker processes share one copy of the data. When the
+    version file names a new file, it is mapped and swapped in with a
+    single assignment.
+
+    Like SnapshotManager, version checks move off the request path once
+    watch() has been started.
+    """
+
+    def __init__(self, directory=SNAPSHOT_DIR):
+        self.directory = directory
+        self._lock = threading.Lock()
+        # (file name, snapshot, change history), replaced as a whole
+        self._current = (None, None, {})
+        self._watcher = None
+
+    def _check(self):
+        """Map the published snapshot if the version file names a new one"""
+        with self._lock:
+            try:
+                with open(os.path.join(self.directory, VERSION_FILE)) as f:
+                    name = f.read().strip()
+                if name != self._current[0]:
+                    snapshot, changes = read_snapshot(os.path.join(self.directory, name))
+                    self._current = (name, snapshot, changes)
+            except FileNotFoundError:
+                pass
+            except Exception as e:
+                print(f"Error mapping published snapshot: {e}")
+
+    def get(self, block=True):
+        """
+        The current published snapshot, or None before the first one is
+        published; there is nothing to load here, so block makes no difference
+        """
+        if self._watcher is None or self._current[1] is None:
+            self._check()
+        return self._current[1]
+
+    def refresh(self):
+        self._check()
+        return self.get()
+
+    def watch(self, interval=CHECK_INTERVAL):
+        """Start checking the version file in a background thread"""
+        with self._lock:
+            if self._watcher is not None:
+                return
+            self._watcher = threading.Thread(target=self._watch, args=(interval,))
+            self._watcher.daemon = True
+        self._watcher.start()
+
+    def _watch(self, interval):
+        while True:
+            self._check()
+            time.sleep(interval)
+
+    def changes_since(self, version):
+        """Same as SnapshotManager.changes_since, from the published change history"""
+        _, snapshot, changes = self._current
+        if snapshot is None:
+            return None, None
+        return snapshot, changes_between(changes, version, snapshot.version)
+
+
+if __name__ == '__main__':
+    # The publisher process gunicorn.conf.py starts next to the workers
+    publisher = SnapshotPublisher()
+    try:
+        publisher.publish()
+    except Exception as e:
+        print(f"Error publishing snapshot: {e}")
+    publisher.run()
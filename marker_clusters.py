@@ -0,0 +1,78 @@
+import numpy as np
+
+# Deepest zoom level the grid resolves; higher zooms cluster like this one
+MAX_ZOOM = 18
+
+# Cluster cell size in screen pixels; a power of two, so each level's cells nest in the next
+CELL_PIXELS = 64
+
+# Column order of a cluster in /api/markers responses. id is only set for single-listing clusters.
+CLUSTER_FIELDS = ('latitude', 'longitude', 'count', 'min_price', 'median_price', 'id')
+
+_CELL_SHIFT = CELL_PIXELS.bit_length() - 1
+
+
+def _price(value):
+    if np.isnan(value):
+        return None
+    return int(value) if float(value).is_integer() else float(value)
+
+
+class MarkerClusters:
+    """
+    Hierarchical grid for clustering map markers.
+
+    Each listing's Web Mercator pixel position at MAX_ZOOM is computed once
+    per snapshot. Its cluster cell at a lower zoom is that position shifted
+    right, so the cells of one zoom level split evenly into the next, and
+    clustering a set of rows is a single grouping pass.
+    """
+
+    def __init__(self, index, ids):
+        self.index = index
+        self.ids = ids
+        latitude, longitude = index.latitude, index.longitude
+        self.valid = ~(np.isnan(latitude) | np.isnan(longitude))
+        world = 256 << MAX_ZOOM
+        sin_lat = np.sin(np.radians(np.clip(np.nan_to_num(latitude), -85.05112878, 85.05112878)))
+        x = (np.nan_to_num(longitude) + 180) / 360 * world
+        y = (0.5 - np.log((1 + sin_lat) / (1 - sin_lat)) / (4 * np.pi)) * world
+        self.x = np.clip(x, 0, world - 1).astype(np.int64)
+        self.y = np.clip(y, 0, world - 1).astype(np.int64)
+
+    def clusters(self, rows, zoom):
+        """Clusters of the given rows at a zoom level, as lists in CLUSTER_FIELDS order"""
+        rows = rows[self.valid[rows]]
+        if not len(rows):
+            return []
+        shift = MAX_ZOOM - min(max(zoom, 0), MAX_ZOOM) + _CELL_SHIFT
+        keys = ((self.y[rows] >> shift) << 32) | (self.x[rows] >> shift)
+        cells, groups = np.unique(keys, return_inverse=True)
+        groups = groups.ravel()
+        n = len(cells)
+        count = np.bincount(groups, minlength=n)
+        latitude = np.bincount(groups, weights=self.index.latitude[rows], minlength=n) / count
+        longitude = np.bincount(groups, weights=self.index.longitude[rows], minlength=n) / count
+
+        # Min and median price per cell, from prices sorted within each cell
+        price = self.index.price[rows]
+        priced = ~np.isnan(price)
+        order = np.lexsort((price[priced], groups[priced]))
+        sorted_groups, sorted_prices = groups[priced][order], price[priced][order]
+        starts = np.searchsorted(sorted_groups, np.arange(n), 'left')
+        ends = np.searchsorted(sorted_groups, np.arange(n), 'right')
+        padded = np.append(sorted_prices, np.nan)
+        has_price = ends > starts
+        min_price = np.where(has_price, padded[starts], np.nan)
+        lower, upper = (starts + ends - 1) // 2, (starts + ends) // 2
+        median_price = np.where(has_price, (padded[lower] + padded[np.minimum(upper, len(sorted_prices))]) / 2, np.nan)
+
+        # A listing id for cells holding a single listing, so it can be drawn as a plain marker
+        first = np.empty(n, dtype=np.int64)
+        first[groups[::-1]] = rows[::-1]
+
+        return [
+            [round(float(latitude[c]), 6), round(float(longitude[c]), 6), int(count[c]),
+             _price(min_price[c]), _price(median_price[c]), self.ids[first[c]] if count[c] == 1 else None]
+            for c in range(n)
+        ]
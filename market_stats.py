@@ -0,0 +1,139 @@
+import numpy as np
+
+from listing_index import bedroom_keys, normalize_filters
+from storage import normalize_area
+
+# Log-spaced price bins, each about 2.5% wide; percentiles are estimated to within one bin
+PRICE_EDGES = np.geomspace(250, 100000, 244)
+
+PERCENTILES = (('p10', 0.1), ('p50', 0.5), ('p90', 0.9))
+
+# Filters the precomputed buckets can answer; any other filter needs the rows themselves
+BUCKET_FILTERS = {'area', 'bedrooms', 'offmarket_month_start', 'offmarket_month_end'}
+
+# Off-market month 1-12, or 0 when the date is unknown
+_MONTHS = 13
+
+
+def _aggregate(groups, n_groups, prices, stabilized):
+    """Per-group count, stabilized count, price count/sum/min/max and price histogram"""
+    valid = ~np.isnan(prices)
+    priced_groups, priced = groups[valid], prices[valid]
+    mins = np.full(n_groups, np.inf)
+    maxs = np.full(n_groups, -np.inf)
+    np.minimum.at(mins, priced_groups, priced)
+    np.maximum.at(maxs, priced_groups, priced)
+    n_bins = len(PRICE_EDGES) + 1
+    bins = np.searchsorted(PRICE_EDGES, priced, 'right')
+    return {
+        'count': np.bincount(groups, minlength=n_groups),
+        'stabilized': np.bincount(groups, weights=stabilized, minlength=n_groups),
+        'priced': np.bincount(priced_groups, minlength=n_groups),
+        'price_sum': np.bincount(priced_groups, weights=priced, minlength=n_groups),
+        'min': mins,
+        'max': maxs,
+        'histogram': np.bincount(priced_groups * n_bins + bins,
+                                 minlength=n_groups * n_bins).reshape(n_groups, n_bins),
+    }
+
+
+def _number(value):
+    """JSON-friendly price: whole numbers as int"""
+    value = float(value)
+    return int(value) if value.is_integer() else value
+
+
+def _percentile(histogram, q, low, high):
+    """Estimate a percentile from a price histogram, interpolating geometrically within the bin"""
+    counts = np.cumsum(histogram)
+    rank = q * (counts[-1] - 1)
+    b = int(np.searchsorted(counts, rank, 'right'))
+    before = counts[b - 1] if b else 0
+    lo = PRICE_EDGES[b - 1] if b else low
+    hi = PRICE_EDGES[b] if b < len(PRICE_EDGES) else high
+    lo, hi = max(lo, low), min(hi, high)
+    fraction = (rank - before + 0.5) / histogram[b]
+    return min(max(lo * (hi / lo) ** fraction if lo > 0 else lo + (hi - lo) * fraction, low), high)
+
+
+class MarketStatistics:
+    """
+    Market aggregates for one snapshot, bucketed by source_area, bedroom
+    count and off-market month.
+
+    Each bucket keeps counts, price totals, min/max and a price histogram,
+    so statistics for any combination of area/bedrooms/month filters are a
+    sum over a bounded number of buckets, independent of the number of
+    listings. Queries with other /api/listings filters are computed from the
+    matching rows of the index.
+    """
+
+    def __init__(self, index):
+        self.index = index
+        n_beds = max(len(index.beds_values), 1)
+        keys = (index.area.astype(np.int64) * n_beds + index.beds) * _MONTHS + index.month
+        keys, groups = np.unique(keys, return_inverse=True)
+        self.bucket_area = keys // (_MONTHS * n_beds)
+        self.bucket_beds = keys // _MONTHS % n_beds
+        self.bucket_month = keys % _MONTHS
+        self.buckets = _aggregate(groups.ravel(), len(keys), index.price, index.stabilized)
+
+    def _bucket_mask(self, filters):
+        index = self.index
+        mask = np.ones(len(self.bucket_area), dtype=bool)
+
+        area = filters.get('area')
+        if area and area != 'all':
+            area = normalize_area(area)
+            codes = [c for c, value in enumerate(index.area_values) if area and normalize_area(value) == area]
+            mask &= np.isin(self.bucket_area, codes)
+
+        bedrooms = filters.get('bedrooms', 'all')
+        if bedrooms != 'all':
+            keys = set(bedroom_keys(bedrooms, index.beds_values))
+            mask &= np.isin(self.bucket_beds, [c for c, value in enumerate(index.beds_values) if value in keys])
+
+        month_start = filters.get('offmarket_month_start')
+        month_end = filters.get('offmarket_month_end')
+        if month_start and month_end:
+            month = self.bucket_month
+            if month_start <= month_end:
+                mask &= (month >= month_start) & (month <= month_end)
+            else:
+                # Wrap around year (e.g., Nov to Feb)
+                mask &= (month > 0) & ((month >= month_start) | (month <= month_end))
+        return mask
+
+    def query(self, filters, today=None):
+        """Statistics for the listings matching a /api/listings filter dict"""
+        if any(field not in BUCKET_FILTERS for field, _ in normalize_filters(filters)):
+            rows = self.index.select(filters, today)
+            aggregate = _aggregate(np.zeros(len(rows), dtype=np.int64), 1,
+                                   self.index.price[rows], self.index.stabilized[rows])
+            return self._summarize(aggregate, slice(None))
+        return self._summarize(self.buckets, self._bucket_mask(filters))
+
+    def _summarize(self, aggregate, selected):
+        count = int(aggregate['count'][selected].sum())
+        priced = int(aggregate['priced'][selected].sum())
+        if not priced:
+            return {
+                'total_listings': count,
+                'average_price': 0,
+                'median_price': 0,
+                'percentiles': {name: 0 for name, _ in PERCENTILES},
+                'price_range': {'min': 0, 'max': 0},
+                'stabilized_share': float(aggregate['stabilized'][selected].sum() / count) if count else 0,
+            }
+        low = aggregate['min'][selected].min()
+        high = aggregate['max'][selected].max()
+        histogram = aggregate['histogram'][selected].sum(axis=0)
+        percentiles = {name: round(_percentile(histogram, q, low, high)) for name, q in PERCENTILES}
+        return {
+            'total_listings': count,
+            'average_price': float(aggregate['price_sum'][selected].sum() / priced),
+            'median_price': percentiles['p50'],
+            'percentiles': percentiles,
+            'price_range': {'min': _number(low), 'max': _number(high)},
+            'stabilized_share': float(aggregate['stabilized'][selected].sum() / count),
+        }
@@ -0,0 +1,24 @@
+import threading
+
+
+class Pending:
+    """
+    A result that one thread (the owner) computes while others wait for it,
+    as used to coalesce concurrent requests for the same key. The owner sets
+    value or error and then calls done().
+    """
+
+    def __init__(self):
+        self.event = threading.Event()
+        self.value = None
+        self.error = None
+
+    def done(self):
+        self.event.set()
+
+    def wait(self):
+        """The owner's value, or its error raised here"""
+        self.event.wait()
+        if self.error is not None:
+            raise self.error
+        return self.value
@@ -0,0 +1,128 @@
+import json
+import os
+import uuid
+
+CHUNK_SIZE = 1 << 16
+
+_WHITESPACE = ' \t\n\r'
+_NUMBER_CHARS = '0123456789.eE+-'
+
+
+class _Reader:
+    """Buffered character stream over a text file, decoding one JSON value at a time"""
+
+    def __init__(self, f):
+        self._file = f
+        self._buffer = ''
+        self._pos = 0
+        self._eof = False
+        self._decoder = json.JSONDecoder()
+
+    def _fill(self):
+        """Read another chunk, dropping the consumed part of the buffer; False at end of file"""
+        if self._eof:
+            return False
+        chunk = self._file.read(CHUNK_SIZE)
+        self._buffer = self._buffer[self._pos:] + chunk
+        self._pos = 0
+        self._eof = not chunk
+        return bool(chunk)
+
+    def peek(self):
+        """Next non-whitespace character, or '' at end of file"""
+        while True:
+            while self._pos < len(self._buffer) and self._buffer[self._pos] in _WHITESPACE:
+                self._pos += 1
+            if self._pos < len(self._buffer):
+                return self._buffer[self._pos]
+            if not self._fill():
+                return ''
+
+    def expect(self, char):
+        if self.peek() != char:
+            raise ValueError(f"Expected {char!r} at offset {self._pos} of the current chunk")
+        self._pos += 1
+
+    def value(self):
+        """Decode the next complete JSON value"""
+        self.peek()
+        while True:
+            try:
+                value, end = self._decoder.raw_decode(self._buffer, self._pos)
+                # A number cut off by the end of the buffer may continue in the next chunk
+                if self._eof or (end < len(self._buffer) and self._buffer[end] not in _NUMBER_CHARS):
+                    self._pos = end
+                    return value
+            except json.JSONDecodeError:
+                if self._eof:
+                    raise
+            self._fill()
+
+    def array(self):
+        """Decode the elements of the array starting here, one at a time"""
+        self.expect('[')
+        if self.peek() == ']':
+            self._pos += 1
+            return
+        while True:
+            yield self.value()
+            if self.peek() == ',':
+                self._pos += 1
+                continue
+            self.expect(']')
+            return
+
+
+def iter_rentals(path, metadata=None):
+    """
+    Yield the listings of a rentals file one at a time without loading the
+    whole document.
+
+    Accepts both the {"metadata": ..., "listings": [...]} format and the
+    legacy bare array. If a metadata dict is given, it is filled in from the
+    file's metadata as soon as that has been read.
+    """
+    with open(path, 'r', encoding='utf-8') as f:
+        reader = _Reader(f)
+        if reader.peek() == '[':
+            yield from reader.array()
+            return
+
+        reader.expect('{')
+        if reader.peek() == '}':
+            return
+        while True:
+            key = reader.value()
+            reader.expect(':')
+            if key == 'listings' and reader.peek() == '[':
+                yield from reader.array()
+            else:
+                value = reader.value()
+                if key == 'metadata' and metadata is not None and isinstance(value, dict):
+                    metadata.update(value)
+            if reader.peek() == ',':
+                reader.expect(',')
+                continue
+            reader.expect('}')
+            return
+
+
+def write_rentals(path, metadata, listings):
+    """
+    Write a rentals file atomically: the data goes to a temporary file next
+    to path, which is then renamed over it, so readers see either the old
+    file or the complete new one. metadata gets a unique "version" stamp.
+    """
+    metadata = dict(metadata, version=uuid.uuid4().hex)
+    temp_path = f"{path}.{os.getpid()}.tmp"
+    try:
+        with open(temp_path, 'w', encoding='utf-8') as f:
+            json.dump({"metadata": metadata, "listings": listings}, f, indent=2, ensure_ascii=False)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(temp_path, path)
+    except BaseException:
+        if os.path.exists(temp_path):
+            os.remove(temp_path)
+        raise
+    return metadata['version']
@@ -0,0 +1,92 @@
+import gzip
+import threading
+from collections import OrderedDict
+
+from pending import Pending
+
+# Bodies smaller than this aren't worth compressing
+GZIP_MIN_BYTES = 1024
+
+
+class CachedResponse:
+    """
+    A serialized response body plus the headers that go with it. Larger
+    bodies also keep a precompressed gzip copy so cache hits don't pay for
+    compression again.
+    """
+
+    def __init__(self, body, headers=None):
+        self.body = body
+        self.headers = headers or {}
+        self.gzip_body = gzip.compress(body, compresslevel=5) if len(body) >= GZIP_MIN_BYTES else None
+
+    @property
+    def size(self):
+        size = len(self.body) + sum(len(k) + len(v) for k, v in self.headers.items())
+        return size + len(self.gzip_body) if self.gzip_body is not None else size
+
+
+class ResponseCache:
+    """
+    LRU cache of serialized responses, bounded by the total size of the
+    cached bodies.
+
+    Concurrent requests for the same key are coalesced: the first caller
+    computes the response and the others wait for its result instead of
+    repeating the work.
+    """
+
+    def __init__(self, max_bytes):
+        self.max_bytes = max_bytes
+        self._entries = OrderedDict()
+        self._size = 0
+        self._inflight = {}
+        self._lock = threading.Lock()
+
+    def get_or_compute(self, key, compute):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                self._entries.move_to_end(key)
+                return entry
+            pending = self._inflight.get(key)
+            owner = pending is None
+            if owner:
+                pending = self._inflight[key] = Pending()
+
+        if not owner:
+            return pending.wait()
+
+        try:
+            pending.value = compute()
+        except Exception as e:
+            pending.error = e
+            raise
+        finally:
+            with self._lock:
+                del self._inflight[key]
+                if pending.error is None:
+                    self._put(key, pending.value)
+            pending.done()
+        return pending.value
+
+    def _put(self, key, entry):
+        # Responses larger than the whole budget are served but never cached
+        if entry.size > self.max_bytes:
+            return
+        old = self._entries.pop(key, None)
+        if old is not None:
+            self._size -= old.size
+        self._entries[key] = entry
+        self._size += entry.size
+        while self._size > self.max_bytes:
+            _, evicted = self._entries.popitem(last=False)
+            self._size -= evicted.size
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._size = 0
+
+    def __len__(self):
+        return len(self._entries)
@@ -1,17 +1,21 @@
 import requests
 import json
+import hashlib
 from concurrent.futures import ThreadPoolExecutor
 import undetected_chromedriver as uc
 from webdriver_manager.chrome import ChromeDriverManager
 from selenium.webdriver.support.ui import WebDriverWait
 import time
 import re
-from selenium.webdriver.common.by import By
 from datetime import datetime
 import os
 import argparse
-from selenium.webdriver.support import expected_conditions as EC
-from selenium.common.exceptions import TimeoutException, NoSuchElementException
+import threading
+
+from building_pages import CAPTCHA_MARKER, parse_building_page
+from rentals_json import iter_rentals, write_rentals
+from graphql_batch import HistoryLoader, ResolveError, SlugResolver, building_type_name, nested_history_field
+from storage import ListingStore, format_building_address, listing_date, listing_priority, normalize_unit
 
 # Try to import beepy, set availability flag
 try:
@@ -20,22 +24,6 @@ try:
 except ImportError:
     BEEPY_AVAILABLE = False
 
-def normalize_unit(unit_str):
-    """Normalize unit numbers for deduplication (e.g., '3A', '3a', '3-A' -> '3A')"""
-    if not unit_str or unit_str is None:
-        return ''
-    
-    # Convert to string and strip whitespace, handle None values explicitly
-    try:
-        unit_str = str(unit_str).strip().upper()
-    except (AttributeError, TypeError):
-        return ''
-    
-    # Remove common separators and normalize
-    unit_str = re.sub(r'[-_\s]+', '', unit_str)
-    
-    return unit_str
-
 def filter_delisted_listings(listings):
     """Filter out listings with DELISTED status to prevent saving them"""
     if not listings:
@@ -56,8 +44,30 @@ def filter_delisted_listings(listings):
     
     return filtered_listings
 
+# Set by the server when it launches the scraper: progress goes over this pipe instead of the status file
+PROGRESS_FD_ENV = 'SCRAPER_PROGRESS_FD'
+_progress_pipe = None
+_progress_lock = threading.Lock()
+
+def _send_progress(status_data):
+    """Send a status line over the server's progress pipe; False if there is none"""
+    global _progress_pipe
+    fd = os.environ.get(PROGRESS_FD_ENV)
+    if not fd:
+        return False
+    with _progress_lock:
+        try:
+            if _progress_pipe is None:
+                _progress_pipe = os.fdopen(int(fd), 'w', buffering=1)
+            _progress_pipe.write(json.dumps(status_data) + '\n')
+            return True
+        except (OSError, ValueError):
+            # Server went away; fall back to the status file from now on
+            os.environ.pop(PROGRESS_FD_ENV, None)
+            return False
+
 def write_status(status, progress=None, message=None):
-    """Write scraper status to status file for server monitoring"""
+    """Report scraper status to the server: over its progress pipe if it launched us, else the status file"""
     try:
         status_data = {
             'status': status,
@@ -67,6 +77,8 @@ def write_status(status, progress=None, message=None):
             status_data['progress'] = progress
         if message is not None:
             status_data['message'] = message
+        if _send_progress(status_data):
+            return
         
         # Use atomic write to prevent JSON corruption during concurrent access
         temp_file = 'scraper_status.json.tmp'
@@ -87,6 +99,46 @@ def write_status(status, progress=None, message=None):
         except:
             pass  # Silent fail to prevent scraper crashes
 
+# Area pages are fetched over HTTP this many at a time, with the browser's cookies
+DISCOVERY_WORKERS = 8
+DISCOVERY_TIMEOUT = 20
+
+# Area pages are HTML; drop the session's JSON API headers for them
+HTML_HEADERS = {
+    'Accept': 'text/html,application/xhtml+xml,application/xml;q=0.9,*/*;q=0.8',
+    'Content-Type': None,
+    'X-Requested-With': None,
+}
+
+# Paginated building search used to enumerate an area's buildings in bulk. It is only
+# used once introspection shows the field and its input type on Query (see --introspect)
+BUILDING_SEARCH_FIELD = 'searchBuildings'
+BUILDING_SEARCH_INPUT = 'SearchBuildingsInput'
+BUILDING_SEARCH_INPUT_FIELDS = ('areas', 'page', 'perPage')
+BUILDING_SEARCH_QUERY = """
+query SearchBuildings($input: SearchBuildingsInput!) {
+    searchBuildings(input: $input) {
+        totalCount
+        edges {
+            node {
+                id
+                slug
+                name
+                geoCenter { latitude longitude }
+                address { street city state zipCode }
+            }
+        }
+    }
+}
+"""
+BUILDING_SEARCH_PAGE_SIZE = 500
+
+# Selection of an introspected type reference, deep enough for e.g. [Rental!]!
+TYPE_REF = 'name kind ofType { name kind ofType { name kind ofType { name kind } } }'
+
+# Repeat runs of an area within this many hours reuse its cataloged buildings instead of rediscovering them
+BUILDING_CATALOG_TTL_HOURS = float(os.environ.get('BUILDING_CATALOG_TTL_HOURS', 24))
+
 def check_stop_signal():
     """Check if a stop signal has been sent via the web interface"""
     return os.path.exists('scraper_stop_signal.txt')
@@ -99,6 +151,8 @@ class RentalCollector:
         
         # Initialize listings attribute
         self.listings = []
+        # introspect_type results, by type name
+        self._introspected_types = {}
         
         # Initialize undetected-chromedriver
         self.driver = uc.Chrome(
@@ -123,11 +177,11 @@ class RentalCollector:
                 'X-Requested-With': 'XMLHttpRequest'
             }
             self.session.headers.update(self.headers)
+            adapter = requests.adapters.HTTPAdapter(pool_maxsize=DISCOVERY_WORKERS)
+            self.session.mount('https://', adapter)
             
-            # Get cookies from Selenium and add to requests session
-            selenium_cookies = self.driver.get_cookies()
-            for cookie in selenium_cookies:
-                self.session.cookies.set(cookie['name'], cookie['value'])
+            # Get cookies from Selenium and add to requests session; Chrome is only needed for these
+            self._harvest_cookies()
             
         except Exception as e:
             print(f"Warning: Error during initialization: {e}")
@@ -137,6 +191,11 @@ class RentalCollector:
                 self.building_info = json.load(f)
         except FileNotFoundError:
             self.building_info = {}
+
+        # Listing database shared with the server; progress is upserted as it comes in
+        self.store = ListingStore()
+        self.run_id = None
+        self._stored_count = 0
     
     def save_listings_to_json(self, listings, filename=None):
         """Save listings to JSON file with timestamp and metadata"""
@@ -147,20 +206,15 @@ class RentalCollector:
         # Filter out delisted listings before saving
         listings = filter_delisted_listings(listings)
         
-        # Create data structure with metadata
-        data_to_save = {
-            "metadata": {
-                "timestamp": datetime.now().isoformat(),
-                "total_listings": len(listings),
-                "collection_method": "api",
-                "area": getattr(self, 'current_area', 'unknown')
-            },
-            "listings": listings
+        metadata = {
+            "timestamp": datetime.now().isoformat(),
+            "total_listings": len(listings),
+            "collection_method": "api",
+            "area": getattr(self, 'current_area', 'unknown')
         }
         
         try:
-            with open(filename, 'w', encoding='utf-8') as f:
-                json.dump(data_to_save, f, indent=2, ensure_ascii=False)
+            write_rentals(filename, metadata, listings)
             
             print(f"✅ Successfully saved {len(listings)} listings to {filename}")
             
@@ -174,33 +228,40 @@ class RentalCollector:
             return None
 
     def save_progress_backup(self, listings, area=None):
-        """Save progress backup that can be recovered if scraper is interrupted"""
+        """
+        Upsert the listings collected since the last backup into the listing
+        database, so progress survives an interrupted scraper and the server
+        sees new listings while the run is still going
+        """
         try:
+            if self.run_id is None:
+                self.run_id = self.store.begin_run(area)
             # Filter out delisted listings before saving backup
-            listings = filter_delisted_listings(listings)
+            new_listings = filter_delisted_listings(listings[self._stored_count:])
+            self.store.upsert_buildings(self.building_info, area)
+            self.store.upsert_listings(new_listings, self.run_id)
+            self._stored_count = len(listings)
             
-            data_to_save = {
-                "metadata": {
-                    "timestamp": datetime.now().isoformat(),
-                    "total_listings": len(listings),
-                    "collection_method": "api",
-                    "area": area,
-                    "is_backup": True
-                },
-                "listings": listings
-            }
-            
-            with open('rentals_backup.json', 'w', encoding='utf-8') as f:
-                json.dump(data_to_save, f, indent=2, ensure_ascii=False)
-            
-            # Also immediately update the latest file
-            with open('rentals_latest.json', 'w', encoding='utf-8') as f:
-                json.dump(data_to_save, f, indent=2, ensure_ascii=False)
-                
-            print(f"💾 Progress backup saved: {len(listings)} listings")
+            print(f"💾 Progress backup saved: {len(new_listings)} new listings ({len(listings)} collected)")
             
         except Exception as e:
             print(f"⚠️  Could not save progress backup: {e}")
+
+    def save_listings_to_store(self, listings, area=None):
+        """Write a run's final listings to the listing database and close the run"""
+        try:
+            if self.run_id is None:
+                self.run_id = self.store.begin_run(area)
+            listings = filter_delisted_listings(listings)
+            self.store.upsert_buildings(self.building_info, area)
+            self.store.upsert_listings(listings, self.run_id, replace=True)
+            self.store.finish_run(self.run_id, listings)
+            print(f"✅ Saved {len(listings)} listings to {self.store.path}")
+        except Exception as e:
+            print(f"❌ Error saving listings to database: {e}")
+        finally:
+            self.run_id = None
+            self._stored_count = 0
     
     def _cleanup_old_files(self):
         """Keep only the 5 most recent timestamped rental files"""
@@ -229,15 +290,12 @@ class RentalCollector:
             print(f"⚠️  Error during cleanup: {e}")
     
     def load_previous_listings(self, filename):
-        """Load previously saved listings from JSON file"""
+        """Load previously saved listings from JSON file (metadata format or old bare array)"""
         try:
-            with open(filename, 'r', encoding='utf-8') as f:
-                data = json.load(f)
-                if isinstance(data, dict) and 'listings' in data:
-                    return data['listings'], data.get('metadata', {})
-                else:
-                    # Handle old format (just array of listings)
-                    return data, {}
+            # Streamed, so the raw document is never held in memory next to the parsed listings
+            metadata = {}
+            listings = list(iter_rentals(filename, metadata))
+            return listings, metadata
         except FileNotFoundError:
             print(f"No previous file found: {filename}")
             return [], {}
@@ -245,10 +303,230 @@ class RentalCollector:
             print(f"Error loading previous listings: {e}")
             return [], {}
 
-    def get_building_ids_from_area(self, area):
-        """Get building IDs from area page with progress tracking"""
+    def _harvest_cookies(self):
+        """Copy the browser's cookies and user agent into the HTTP session"""
+        for cookie in self.driver.get_cookies():
+            self.session.cookies.set(cookie['name'], cookie['value'])
+        try:
+            self.session.headers['User-Agent'] = self.driver.execute_script('return navigator.userAgent')
+        except Exception:
+            pass
+
+    def _wait_for_captcha(self, where):
+        """Alert the user and wait for them to solve a captcha in the browser"""
+        print(f"\n\n🚨 CAPTCHA DETECTED {where}! 🚨\n\n")
+        if BEEPY_AVAILABLE:
+            for _ in range(5):
+                beepy.beep(sound=1)
+                time.sleep(0.5)
+        else:
+            for _ in range(5):
+                print('\a', end='', flush=True)
+                time.sleep(0.5)
+        input("Please solve the captcha manually and press Enter to continue...")
+        self.driver.refresh()
+        time.sleep(1)
+
+    def _fetch_building_page(self, url):
+        """HTML of an area page over the HTTP session, or None if it needs the browser (captcha or HTTP failure)"""
+        try:
+            resp = self.session.get(url, headers=HTML_HEADERS, timeout=DISCOVERY_TIMEOUT)
+            if resp.ok and CAPTCHA_MARKER not in resp.text:
+                return resp.text
+            print(f"⚠️  {url} needs the browser (HTTP {resp.status_code})")
+        except requests.RequestException as e:
+            print(f"⚠️  {url} needs the browser: {e}")
+        return None
+
+    def _browser_building_page(self, url, where):
+        """HTML of an area page loaded in Chrome, after any captcha is solved"""
+        self.driver.get(url)
+        time.sleep(1)
+        if CAPTCHA_MARKER in self.driver.page_source:
+            self._wait_for_captcha(where)
+            # Solving the captcha refreshes the clearance cookies the remaining requests need
+            self._harvest_cookies()
+        return self.driver.page_source
+
+    def _search_buildings_page(self, area_slug, page):
+        """(buildings, total count) for one page of the area's building search"""
+        query = {
+            "query": BUILDING_SEARCH_QUERY,
+            "variables": {"input": {"areas": [area_slug], "page": page, "perPage": BUILDING_SEARCH_PAGE_SIZE}}
+        }
+        response = self.session.post(self.api_url, json=query, timeout=DISCOVERY_TIMEOUT)
+        response.raise_for_status()
+        data = response.json()
+        if data.get('errors') or not (data.get('data') or {}).get('searchBuildings'):
+            raise ValueError(f"building search failed: {data.get('errors')}")
+        result = data['data']['searchBuildings']
+        return [edge['node'] for edge in result.get('edges') or []], result.get('totalCount') or 0
+
+    def building_search_available(self):
+        """
+        Whether the API's Query type has the building search field, taking an
+        input of BUILDING_SEARCH_INPUT with the fields the search sends.
+        Checked by introspection once per scraper.
+        """
+        if getattr(self, '_building_search_available', None) is None:
+            self._building_search_available = False
+            query_type = self._introspected('Query')
+            field = next((f for f in query_type.get('fields') or [] if f.get('name') == BUILDING_SEARCH_FIELD), None)
+            argument = next((a for a in (field or {}).get('args') or [] if a.get('name') == 'input'), None)
+            argument_type = (argument or {}).get('type') or {}
+            if (argument_type.get('ofType') or argument_type).get('name') == BUILDING_SEARCH_INPUT:
+                input_type = self._introspected(BUILDING_SEARCH_INPUT)
+                input_fields = {f.get('name') for f in input_type.get('inputFields') or []}
+                self._building_search_available = set(BUILDING_SEARCH_INPUT_FIELDS) <= input_fields
+        return self._building_search_available
+
+    def _introspected(self, type_name):
+        """introspect_type result for a type, fetched once per scraper ({} if it failed)"""
+        if type_name not in self._introspected_types:
+            self._introspected_types[type_name] = self.introspect_type(type_name, verbose=False) or {}
+        return self._introspected_types[type_name]
+
+    def nested_history_field(self):
+        """
+        The building type's rental history field, if introspection shows one
+        (see graphql_batch.nested_history_field), so slug lookups can fetch
+        histories in the same request; None otherwise.
+        """
+        query_type = self._introspected('Query')
+        building_type = building_type_name(query_type)
+        if not building_type:
+            return None
+        return nested_history_field(query_type, self._introspected(building_type))
+
+    def search_building_ids(self, area):
+        """
+        Enumerate an area's buildings through the GraphQL building search,
+        storing each one's ID, address and geoCenter in building_info so no
+        per-slug lookup is needed later. Returns None if the API has no
+        building search or it fails; stops early on the stop signal.
+        """
+        if not self.building_search_available():
+            print(f"ℹ️  The API has no {BUILDING_SEARCH_FIELD}({BUILDING_SEARCH_INPUT}) field, using area pages")
+            return None
+        area_slug = area.lower().replace(' ', '-').replace('&', 'and')
+        print("🔍 Enumerating buildings through the building search API...")
+        try:
+            first_page, total_count = self._search_buildings_page(area_slug, 1)
+        except Exception as e:
+            print(f"⚠️  Building search unavailable ({e}), falling back to area pages")
+            return None
+        if not first_page:
+            print(f"⚠️  Building search found nothing for {area}, falling back to area pages")
+            return None
+
+        total_pages = max(1, -(-total_count // BUILDING_SEARCH_PAGE_SIZE))
+        print(f"📄 {total_count} buildings in {total_pages} search pages")
+        write_status('running', 
+                    {'pages': {'current': 0, 'total': total_pages, 'phase': 'scraping_buildings'}}, 
+                    f"Searching {total_pages} pages of buildings")
+
+        building_ids = []
+        seen = set()
+        with ThreadPoolExecutor(max_workers=DISCOVERY_WORKERS) as executor:
+            fetches = {page: executor.submit(self._search_buildings_page, area_slug, page)
+                       for page in range(2, total_pages + 1)}
+            for page in range(1, total_pages + 1):
+                if getattr(self, 'stop_requested', False) or check_stop_signal():
+                    print(f"🔄 Scraping stopped by user after page {page-1}. Collected {len(building_ids)} buildings so far.")
+                    if check_stop_signal():
+                        # Clean up the stop signal file
+                        try:
+                            os.remove('scraper_stop_signal.txt')
+                        except:
+                            pass
+                    for fetch in fetches.values():
+                        fetch.cancel()
+                    # discovery_complete stays False, so the partial list isn't cataloged
+                    return building_ids
+                try:
+                    buildings = first_page if page == 1 else fetches[page].result()[0]
+                except Exception as e:
+                    # A partial enumeration would silently drop buildings; let the area pages do it all
+                    print(f"⚠️  Building search page {page} failed ({e}), falling back to area pages")
+                    for fetch in fetches.values():
+                        fetch.cancel()
+                    return None
+                for building in buildings:
+                    slug = building.get('slug')
+                    if not slug or slug in seen:
+                        continue
+                    seen.add(slug)
+                    building_ids.append(slug)
+                    self.building_info.setdefault(slug, {}).update({
+                        'href': f"https://streeteasy.com/building/{slug}",
+                        'address': format_building_address(building, slug),
+                        'building_id': building.get('id'),
+                        'geoCenter': building.get('geoCenter'),
+                    })
+                write_status('running', 
+                            {'pages': {'current': page, 'total': total_pages, 'phase': 'scraping_buildings'}}, 
+                            f"Searching page {page}/{total_pages} - found {len(building_ids)} buildings so far")
+
+        self.discovery_complete = True
+        print(f"✅ Building discovery complete! Found {len(building_ids)} total buildings to process")
+        write_status('running', 
+                    {'pages': {'current': total_pages, 'total': total_pages, 'phase': 'completed_discovery'}}, 
+                    f"Building discovery complete - found {len(building_ids)} buildings")
+        return building_ids
+
+    def get_building_ids_from_area(self, area, refresh=False, catalog_ttl=BUILDING_CATALOG_TTL_HOURS * 3600):
+        """
+        Get building IDs for an area: from the building catalog if the area
+        was discovered within catalog_ttl seconds (unless refresh is set),
+        else from the building search API, or the area pages if the API has
+        no building search or it fails. Completed discoveries are saved to
+        the catalog.
+        """
+        if not refresh:
+            catalog = self.store.area_buildings(area, catalog_ttl)
+            if catalog:
+                print(f"📚 Using {len(catalog)} cataloged buildings for {area} (use --refresh-buildings to rediscover)")
+                for slug, info in catalog.items():
+                    self.building_info.setdefault(slug, {}).update(info)
+                write_status('running', 
+                            {'pages': {'current': 1, 'total': 1, 'phase': 'completed_discovery'}}, 
+                            f"Building discovery complete - {len(catalog)} cataloged buildings")
+                return list(catalog)
+        
+        # Create a stop handler to handle Ctrl+C
+        import signal
+        
+        def signal_handler(sig, frame):
+            print('\n🔄 Gracefully stopping scraper...')
+            # Set stop flag
+            with open('scraper_stop_signal.txt', 'w') as f:
+                f.write('stop')
+            print('Stop signal sent. The scraper will finish the current page and then stop.')
+            
+        signal.signal(signal.SIGINT, signal_handler)
+        
+        self.discovery_complete = False
+        building_ids = self.search_building_ids(area)
+        if building_ids is None:
+            building_ids = self.scrape_building_ids(area)
+        if self.discovery_complete and building_ids:
+            try:
+                self.store.save_area_buildings(area, building_ids, self.building_info)
+            except Exception as e:
+                print(f"⚠️  Could not save building catalog: {e}")
+        return building_ids
+
+    def scrape_building_ids(self, area):
+        """
+        Get building IDs from area page with progress tracking.
+
+        Pages are fetched over the HTTP session with the browser's cookies,
+        all pages after the first concurrently; Chrome only loads a page
+        when the HTTP fetch is blocked.
+        """
         building_ids = []
-        self.building_info = {}
+        seen = set()
+        total_pages = 1
         
         try:
             # Convert area name to URL slug format
@@ -257,217 +535,71 @@ class RentalCollector:
             
             # First, discover total number of pages
             print("🔍 Discovering total number of pages...")
-            self.driver.get(base_url)
-            time.sleep(2)
-            
-            # Check if we're blocked or redirected
-            current_url = self.driver.current_url
-            page_title = self.driver.title.lower()
-            page_source = self.driver.page_source.lower()
-            
-            # Handle any captcha that appears during discovery
-            if "Press & Hold to confirm" in self.driver.page_source:
-                print("\n\n🚨 CAPTCHA DETECTED DURING PAGE DISCOVERY! 🚨\n\n")
-                if BEEPY_AVAILABLE:
-                    for _ in range(5):
-                        beepy.beep(sound=1)
-                        time.sleep(0.5)
-                else:
-                    for _ in range(5):
-                        print('\a', end='', flush=True)
-                        time.sleep(0.5)
-                input("Please solve the captcha manually and press Enter to continue...")
-                self.driver.refresh()
-                time.sleep(1)
-            
-            # Find total pages by looking at pagination
-            total_pages = 1
-            try:
-                # Look for pagination info - try multiple selectors
-                pagination_selectors = [
-                    ".pagination li:nth-last-child(2) a",  # Second to last pagination item
-                    ".pagination .page-numbers:not(.next):not(.prev):last-of-type",
-                    ".pagination a[href*='page=']:last-of-type"
-                ]
-                
-                for selector in pagination_selectors:
-                    try:
-                        last_page_elements = self.driver.find_elements(By.CSS_SELECTOR, selector)
-                        if last_page_elements:
-                            last_page_text = last_page_elements[-1].text.strip()
-                            if last_page_text.isdigit():
-                                total_pages = int(last_page_text)
-                                break
-                            # Extract page number from href if text isn't a number
-                            href = last_page_elements[-1].get_attribute('href')
-                            if href and 'page=' in href:
-                                page_match = re.search(r'page=(\d+)', href)
-                                if page_match:
-                                    total_pages = int(page_match.group(1))
-                                    break
-                    except Exception:
-                        continue
-                
-            except Exception as e:
-                # Default to single page if unable to determine
-                total_pages = 1
+            html = self._fetch_building_page(base_url) or self._browser_building_page(base_url, "DURING PAGE DISCOVERY")
+            first_page, total_pages = parse_building_page(html, base_url)
 
             print(f"📄 Total pages to scrape: {total_pages}")
-            
-
                     
             # Write initial status
             write_status('running', 
                         {'pages': {'current': 0, 'total': total_pages, 'phase': 'scraping_buildings'}}, 
                         f"Starting to scrape {total_pages} pages of buildings")
             
-            # Create a stop handler to handle Ctrl+C
-            import signal
+            # Fetch the remaining pages concurrently; they are still processed in page order
+            page_urls = {page: f"{base_url}?page={page}" for page in range(2, total_pages + 1)}
+            executor = ThreadPoolExecutor(max_workers=DISCOVERY_WORKERS)
+            fetches = {page: executor.submit(self._fetch_building_page, url) for page, url in page_urls.items()}
             
-            def signal_handler(sig, frame):
-                print('\n🔄 Gracefully stopping scraper...')
-                # Set stop flag
-                with open('scraper_stop_signal.txt', 'w') as f:
-                    f.write('stop')
-                print('Stop signal sent. The scraper will finish the current page and then stop.')
-                
-            signal.signal(signal.SIGINT, signal_handler)
-            
-            # Go through each page
             page = 1
-            
-            while page <= total_pages:
-                
-                # Check if user requested stop
-                if getattr(self, 'stop_requested', False) or check_stop_signal():
-                    print(f"🔄 Scraping stopped by user after page {page-1}. Collected {len(building_ids)} buildings so far.")
-                    if check_stop_signal():
-                        # Clean up the stop signal file
-                        try:
-                            os.remove('scraper_stop_signal.txt')
-                        except:
-                            pass
-                    break
-                    
-                try:
-                    url = f"{base_url}?page={page}" if page > 1 else base_url
-                    self.driver.get(url)
-                    time.sleep(1)
-                    
-                    # Check for captcha on each page
-                    if "Press & Hold to confirm" in self.driver.page_source:
-                        print(f"\n\n🚨 CAPTCHA DETECTED ON PAGE {page}! 🚨\n\n")
-                        if BEEPY_AVAILABLE:
-                            for _ in range(5):
-                                beepy.beep(sound=1)
-                                time.sleep(0.5)
-                        else:
-                            for _ in range(5):
-                                print('\a', end='', flush=True)
-                                time.sleep(0.5)
-                        input("Please solve the captcha manually and press Enter to continue...")
-                        self.driver.refresh()
-                        time.sleep(1)
-                    
-                    # Find building links from actual building listings (avoid navigation/menu links)
-                    # Use semantic structure instead of hardcoded hash-based class names
-                    
-                    # Method 1: Target building cards with semantic class patterns
-                    building_cards = self.driver.find_elements(By.CSS_SELECTOR, 
-                        ".item.building, [class*='building-card'], [class*='property-card'], [class*='BuildingCard']")
-                    building_links = []
-                    for card in building_cards:
-                        links = card.find_elements(By.CSS_SELECTOR, "a[href*='/building/']")
-                        building_links.extend(links)
+            try:
+                while page <= total_pages:
                     
-                    # Method 2: If no building cards found, filter links by context
-                    if not building_links:
-                        all_links = self.driver.find_elements(By.CSS_SELECTOR, "a[href*='/building/']")
-                        building_links = []
-                        for link in all_links:
+                    # Check if user requested stop
+                    if getattr(self, 'stop_requested', False) or check_stop_signal():
+                        print(f"🔄 Scraping stopped by user after page {page-1}. Collected {len(building_ids)} buildings so far.")
+                        if check_stop_signal():
+                            # Clean up the stop signal file
                             try:
-                                # Check if link is in a navigation context (avoid menu/nav items)
-                                parent = link.find_element(By.XPATH, "..")
-                                grandparent = parent.find_element(By.XPATH, "..")
-                                
-                                parent_class = (parent.get_attribute('class') or '').lower()
-                                grandparent_class = (grandparent.get_attribute('class') or '').lower()
-                                
-                                # Skip if it looks like navigation/menu structure
-                                nav_indicators = ['nav', 'menu', 'header', 'listitem', 'list_list']
-                                is_nav_link = any(indicator in parent_class or indicator in grandparent_class 
-                                                for indicator in nav_indicators)
-                                
-                                # Include if it looks like building content
-                                building_indicators = ['item', 'building', 'property', 'card', 'photo', 'details']
-                                is_building_link = any(indicator in parent_class or indicator in grandparent_class 
-                                                     for indicator in building_indicators)
-                                
-                                if not is_nav_link or is_building_link:
-                                    building_links.append(link)
-                                    
+                                os.remove('scraper_stop_signal.txt')
                             except:
-                                building_links.append(link)  # Include if we can't determine context
-                    
-                    print(f"🏢 Found {len(building_links)} building links on page {page} (Total collected: {len(building_ids)})")
-                    
-                    # Update progress status
-                    write_status('running', 
-                                {'pages': {'current': page, 'total': total_pages, 'phase': 'scraping_buildings'}}, 
-                                f"Scraping page {page}/{total_pages} - found {len(building_ids)} buildings so far")
-                    
-                    for link_element in building_links:
-                        try:
-                            href = link_element.get_attribute("href")
-                            
-                            # Extract the slug from the URL
-                            match = re.search(r'/building/([^/]+)', href)
-                            if match:
-                                slug = match.group(1)
-                                
-                                # Skip duplicates (in case same building appears multiple times on page)
-                                if slug in building_ids:
-                                    continue
-                                    
-                                building_ids.append(slug)
-                                
-                                # Try to get the address text from the link or nearby elements
-                                address = f"Building {slug}"  # default
-                                try:
-                                    # First try the link text itself
-                                    link_text = link_element.text.strip()
-                                    if link_text and len(link_text) > 3:  # Avoid empty or very short text
-                                        address = link_text
-                                    else:
-                                        # Try to find address in parent or sibling elements
-                                        parent = link_element.find_element(By.XPATH, "..")
-                                        address_selectors = ["h3", ".address", ".title", "[class*='address']", "[class*='Address']"]
-                                        for selector in address_selectors:
-                                            try:
-                                                address_element = parent.find_element(By.CSS_SELECTOR, selector)
-                                                text = address_element.text.strip()
-                                                if text and len(text) > 3:
-                                                    address = text
-                                                    break
-                                            except:
-                                                continue
-                                except:
-                                    pass
-                                
-                                # Store additional info
-                                self.building_info[slug] = {
-                                    'href': href,
-                                    'address': address
-                                }
-
-                        except Exception as e:
-                            continue
-                    
-                    # Move to next page
-                    page += 1
+                                pass
+                        break
                         
-                except Exception as e:
-                    break
+                    try:
+                        if page == 1:
+                            buildings = first_page
+                        else:
+                            url = page_urls[page]
+                            html = fetches[page].result() or self._browser_building_page(url, f"ON PAGE {page}")
+                            buildings, _ = parse_building_page(html, url)
+                        
+                        print(f"🏢 Found {len(buildings)} building links on page {page} (Total collected: {len(building_ids)})")
+                        
+                        # Update progress status
+                        write_status('running', 
+                                    {'pages': {'current': page, 'total': total_pages, 'phase': 'scraping_buildings'}}, 
+                                    f"Scraping page {page}/{total_pages} - found {len(building_ids)} buildings so far")
+                        
+                        for slug, href, address in buildings:
+                            # Skip duplicates (in case same building appears on several pages)
+                            if slug in seen:
+                                continue
+                            seen.add(slug)
+                            building_ids.append(slug)
+                            self.building_info.setdefault(slug, {}).update({
+                                'href': href,
+                                'address': address
+                            })
+                        
+                        # Move to next page
+                        page += 1
+                            
+                    except Exception as e:
+                        print(f"Error scraping page {page} of {area}: {e}")
+                        break
+            finally:
+                executor.shutdown(wait=False, cancel_futures=True)
+            self.discovery_complete = page > total_pages
             
             if getattr(self, 'stop_requested', False) or check_stop_signal():
                 print(f"🔄 Scraping stopped by user after page {page-1}. Collected {len(building_ids)} buildings so far.")
@@ -481,15 +613,6 @@ class RentalCollector:
             
         except Exception as e:
             print(f"Error discovering buildings for {area}: {e}")
-            # Ensure variables are properly initialized in case of exception
-            if 'total_pages' not in locals():
-                total_pages = 1
-            if building_ids is None:
-                building_ids = []
-        
-        # Defensive check to ensure building_ids is never None
-        if building_ids is None:
-            building_ids = []
             
         print(f"✅ Building discovery complete! Found {len(building_ids)} total buildings to process")
         
@@ -517,12 +640,15 @@ class RentalCollector:
         cookies: dict = None,
         cookie_string: str = None,
         save_to_file: bool = True,
-        output_filename: str = None
+        output_filename: str = None,
+        refresh_buildings: bool = False,
+        catalog_ttl_hours: float = BUILDING_CATALOG_TTL_HOURS
     ):
         # Store the area being scraped for use in data saving
         self.current_area = area
         """Get all rental listings using advanced GraphQL API queries with full building scraping"""
-        building_ids = self.get_building_ids_from_area(area)
+        building_ids = self.get_building_ids_from_area(area, refresh=refresh_buildings,
+                                                       catalog_ttl=catalog_ttl_hours * 3600)
         if not building_ids:
             print("No buildings discovered – aborting API mode.")
             return None
@@ -547,6 +673,80 @@ class RentalCollector:
         
         listings_out: list[dict] = []
         listings_out.clear()  # Ensure no accumulation from previous runs
+        self.run_id = self.store.begin_run(area)
+        self._stored_count = 0
+
+        lookup_headers = {
+            'Content-Type': 'application/json',
+            'User-Agent': 'Mozilla/5.0 (Macintosh; Intel Mac OS X 10_15_7) AppleWebKit/537.36',
+            'Accept': 'application/json',
+            'Referer': 'https://streeteasy.com/',
+        }
+
+        def _record_building(slug, building):
+            """Store a buildingBySlug result's ID and geoCenter in building_info; returns (building ID, title)"""
+            info = self.building_info.setdefault(slug, {})
+            info['geoCenter'] = building.get('geoCenter')
+            info['building_id'] = building['id']
+            return building['id'], format_building_address(building, slug)
+
+        def _post_lookup_batch(query):
+            response = requests.post(
+                'https://api-v6.streeteasy.com/',
+                json=query,
+                headers=lookup_headers,
+                cookies=session_cookies,
+                timeout=20
+            )
+            response.raise_for_status()
+            return response.json()
+
+        def _post_slug_batch(query):
+            data = _post_lookup_batch(query)
+            if history_field:
+                return data
+            # Queue the histories of the buildings just resolved, so they are fetched in batches too
+            results = data.get('data') if isinstance(data.get('data'), dict) else {}
+            histories.prefetch([building['id'] for building in results.values() if building and building.get('id')])
+            return data
+
+        def _stopped():
+            return getattr(self, 'stop_requested', False) or check_stop_signal()
+
+        # Slug lookups and rental histories go out in batches of aliased fields instead of one request each.
+        # If the building type has a history field, lookups fetch histories too: one round trip per building.
+        history_field = self.nested_history_field()
+        if history_field:
+            print(f"🔗 Fetching rental histories with slug lookups (Building.{history_field})")
+        # Histories that came with a slug lookup, by building ID
+        nested_histories = {}
+        resolver = SlugResolver(_post_slug_batch, stopped=_stopped, history_field=history_field)
+        histories = HistoryLoader(_post_lookup_batch, stopped=_stopped)
+
+        def _try_batched_history(slug: str, building_id: str, building_title: str):
+            """Rentals from the batched history queries; None if the building's batch failed"""
+            if building_id in nested_histories:
+                rental_data = nested_histories.pop(building_id)
+            else:
+                try:
+                    rental_data = histories.resolve(building_id)
+                except ResolveError:
+                    return None
+            return _process_rentals(rental_data or [], slug, building_id, building_title, None)
+
+        def _resolve_building(slug: str) -> tuple:
+            """(building ID, title) for a slug from the batched lookups, or a lookup of its own if its batch failed"""
+            try:
+                building = resolver.resolve(slug)
+            except ResolveError as e:
+                print(f"⚠️  Batched lookup failed for {slug} ({e}), looking it up on its own")
+                return _get_building_id_from_slug(slug)
+            if not building:
+                print(f"❌ No building found for slug {slug}")
+                return None, None
+            if history_field and building.get(history_field) is not None:
+                nested_histories[building['id']] = building[history_field]
+            return _record_building(slug, building)
 
         def _get_building_id_from_slug(slug: str) -> tuple:
             """Convert building slug to building ID and get building name and geo using GraphQL"""
@@ -564,17 +764,10 @@ class RentalCollector:
                 "variables": {"slug": slug}
             }
             try:
-                headers = {
-                    'Content-Type': 'application/json',
-                    'User-Agent': 'Mozilla/5.0 (Macintosh; Intel Mac OS X 10_15_7) AppleWebKit/537.36',
-                    'Accept': 'application/json',
-                    'Referer': 'https://streeteasy.com/',
-                }
-                
                 response = requests.post(
                     'https://api-v6.streeteasy.com/',
                     json=query,
-                    headers=headers,
+                    headers=lookup_headers,
                     cookies=session_cookies,
                     timeout=5  # Reduced timeout
                 )
@@ -583,30 +776,7 @@ class RentalCollector:
                     data = response.json()
                     
                     if 'data' in data and data['data']['buildingBySlug']:
-                        building = data['data']['buildingBySlug']
-                        building_id = building['id']
-                        geo_center = building.get('geoCenter')
-                        # Construct display address from address fields
-                        address = building.get('address', {})
-                        if address:
-                            address_parts = []
-                            if address.get('street'):
-                                address_parts.append(address['street'])
-                            if address.get('city'):
-                                address_parts.append(address['city'])
-                            if address.get('state'):
-                                address_parts.append(address['state'])
-                            if address.get('zipCode'):
-                                address_parts.append(address['zipCode'])
-                            building_title = ', '.join(address_parts) if address_parts else building.get('name') or slug.replace('-', ' ').title()
-                        else:
-                            building_title = building.get('name') or slug.replace('-', ' ').title()
-                        # Store geoCenter in building_info
-                        if slug not in self.building_info:
-                            self.building_info[slug] = {}
-                        self.building_info[slug]['geoCenter'] = geo_center
-                        
-                        return building_id, building_title
+                        return _record_building(slug, data['data']['buildingBySlug'])
                     else:
                         print(f"❌ No building found for slug {slug}")
                         return None, None
@@ -620,13 +790,19 @@ class RentalCollector:
         def _fetch_history(slug: str):
             """Fetch building history via API - simplified and faster"""
             print(f"🔍 Processing {slug}...")
-            building_id, building_title = _get_building_id_from_slug(slug)
+            info = self.building_info.get(slug) or {}
+            if info.get('building_id'):
+                # Already known from the building search
+                building_id, building_title = info['building_id'], info['address']
+            else:
+                building_id, building_title = _resolve_building(slug)
             if not building_id:
                 print(f"❌ No building ID for {slug}")
                 return []
             
-            # Simplified strategy: try only the most reliable queries
+            # Simplified strategy: the batched history, then single queries if its batch failed
             approaches = [
+                ("batched_history", _try_batched_history),
                 ("minimal_fields_query", _try_minimal_fields_query),
                 ("full_query", _try_full_query),
             ]
@@ -636,6 +812,11 @@ class RentalCollector:
                     print(f"🔍 Trying {approach_name} for {slug}")
                     rentals = approach_func(slug, building_id, building_title)
                     if rentals is not None:
+                        # Catalog when the building was last seen and what its history looked like
+                        info = self.building_info.setdefault(slug, {})
+                        info['last_seen_at'] = datetime.now().isoformat()
+                        info['history_hash'] = hashlib.sha1(
+                            json.dumps(rentals, sort_keys=True, default=str).encode()).hexdigest()
                         rentals_count = len(rentals) if rentals else 0
                         print(f"✅ {approach_name} worked for {slug}: {rentals_count} rentals")
                         return rentals
@@ -1164,6 +1345,13 @@ class RentalCollector:
         write_status('running', {'buildings': {'current': 0, 'total': total_buildings}}, 
                     f"Processing buildings: 0/{total_buildings}")
         
+        unresolved = [slug for slug in building_ids if not (self.building_info.get(slug) or {}).get('building_id')]
+        histories.prefetch([self.building_info[slug]['building_id'] for slug in building_ids
+                            if (self.building_info.get(slug) or {}).get('building_id')])
+        if unresolved:
+            print(f"🔗 Resolving {len(unresolved)} building slugs in batches...")
+            resolver.prefetch(unresolved)
+        
         with ThreadPoolExecutor(max_workers=workers) as executor:
             # Submit all tasks
             future_to_slug = {executor.submit(_fetch_history, slug): slug for slug in building_ids}
@@ -1218,6 +1406,8 @@ class RentalCollector:
                         self.save_progress_backup(listings_out, area)
                     for remaining_future in future_to_slug:
                         remaining_future.cancel()
+                    resolver.cancel()
+                    histories.cancel()
                     break
 
         # Final statistics
@@ -1226,6 +1416,8 @@ class RentalCollector:
         print(f"   📊 Empty buildings (no rental data): {empty_count}")
         print(f"   ❌ Failed buildings: {error_count}")
         print(f"   📝 Total listings collected: {total_listings}")
+        print(f"   🔗 Slug lookup requests: {resolver.requests} for {len(unresolved)} slugs")
+        print(f"   🔗 Batched history requests: {histories.requests} for {total_buildings} buildings")
         print(f"✅ API scraping complete! Collected {len(listings_out)} total listings from {total_buildings} buildings")
 
         # Group by unit to ensure only one listing per unit (most recent and most relevant)
@@ -1238,40 +1430,9 @@ class RentalCollector:
             else:
                 current_listing = grouped_listings[key]
                 
-                def get_listing_priority(lst):
-                    """Get priority score for listing (higher = better)"""
-                    status = lst.get('status', '') or ''
-                    try:
-                        status = status.upper()
-                    except (AttributeError, TypeError):
-                        status = ''
-                    
-                    # Active listings get highest priority
-                    if status in ['AVAILABLE', 'ON_MARKET']:
-                        return 1000
-                    # Recently off market gets medium priority  
-                    elif status in ['OFF_MARKET', 'RENTED', 'NO_LONGER_AVAILABLE']:
-                        return 500
-                    # Any other status gets low priority
-                    else:
-                        return 100
-                
-                def get_listing_date(lst):
-                    """Get the most relevant date for comparison"""
-                    # Priority: onMarketAt > availableAt > offMarketAt
-                    date_str = (lst.get('onMarketAt') or 
-                               lst.get('availableAt') or 
-                               lst.get('offMarketAt') or '1900-01-01')
-                    
-                    try:
-                        from datetime import datetime
-                        return datetime.strptime(date_str, '%Y-%m-%d') if date_str != '1900-01-01' else datetime(1900, 1, 1)
-                    except:
-                        return datetime(1900, 1, 1)
-                
                 # Compare by priority first, then by date
-                current_priority = get_listing_priority(current_listing)
-                new_priority = get_listing_priority(listing)
+                current_priority = listing_priority(current_listing)
+                new_priority = listing_priority(listing)
                 
                 should_replace = False
                 
@@ -1280,8 +1441,8 @@ class RentalCollector:
                     should_replace = True
                 elif new_priority == current_priority:
                     # Same priority, compare by date
-                    current_date = get_listing_date(current_listing)
-                    new_date = get_listing_date(listing)
+                    current_date = listing_date(current_listing)
+                    new_date = listing_date(listing)
                     
                     if new_date > current_date:
                         should_replace = True
@@ -1310,17 +1471,10 @@ class RentalCollector:
             }
             
             try:
-                headers = {
-                    'Content-Type': 'application/json',
-                    'User-Agent': 'Mozilla/5.0 (Macintosh; Intel Mac OS X 10_15_7) AppleWebKit/537.36',
-                    'Accept': 'application/json',
-                    'Referer': 'https://streeteasy.com/',
-                }
-                
                 response = requests.post(
                     'https://api-v6.streeteasy.com/',
                     json=query,
-                    headers=headers,
+                    headers=lookup_headers,
                     cookies=session_cookies,
                     timeout=10
                 )
@@ -1555,25 +1709,27 @@ class RentalCollector:
                     # Filter out delisted listings before saving latest file
                     filtered_listings = filter_delisted_listings(grouped_listings)
                     
-                    data_to_save = {
-                        "metadata": {
-                            "timestamp": datetime.now().isoformat(),
-                            "total_listings": len(filtered_listings),
-                            "collection_method": "api", 
-                            "area": area
-                        },
-                        "listings": filtered_listings
+                    metadata = {
+                        "timestamp": datetime.now().isoformat(),
+                        "total_listings": len(filtered_listings),
+                        "collection_method": "api", 
+                        "area": area
                     }
                     
-                    with open('rentals_latest.json', 'w', encoding='utf-8') as f:
-                        json.dump(data_to_save, f, indent=2, ensure_ascii=False)
-                    print(f"✅ Also saved to rentals_latest.json for server access")
+                    # Written to a temp file and renamed, so the server never reads a partial file
+                    version = write_rentals('rentals_latest.json', metadata, filtered_listings)
+                    print(f"✅ Also saved to rentals_latest.json for server access (version {version})")
                     
                 except Exception as e:
                     print(f"⚠️  Warning: Could not save rentals_latest.json: {e}")
-                    
-                print(f"✅ Final results: {len(grouped_listings)} unique listings saved")
-                return grouped_listings
+
+        # Saved after the JSON files so the server, which serves whichever changed last, keeps
+        # reading the database (all areas) rather than this run's file. Saved with or without
+        # the files, to close the run begun above and replace the area's stale listings.
+        self.save_listings_to_store(grouped_listings, area)
+
+        if save_to_file and filename:
+            print(f"✅ Final results: {len(grouped_listings)} unique listings saved")
         
         return grouped_listings
     
@@ -1583,9 +1739,10 @@ class RentalCollector:
             self.driver.quit()
 
     @staticmethod
-    def introspect_type(type_name, enum=False):
+    def introspect_type(type_name, enum=False, verbose=True):
         """
         Print available fields for a GraphQL type or enum from the StreetEasy API.
+        Returns the __type result, or None if the request failed.
         Usage:
             RentalCollector.introspect_type('RentalListingDigest')
             RentalCollector.introspect_type('PropertyFeature', enum=True)
@@ -1597,21 +1754,27 @@ class RentalCollector:
             }
         else:
             query = {
-                "query": f'{{ __type(name: "{type_name}") {{ name fields {{ name type {{ name kind ofType {{ name kind }} }} }} }} }}'
+                "query": f'{{ __type(name: "{type_name}") {{ name '
+                         f'fields {{ name type {{ {TYPE_REF} }} args {{ name type {{ {TYPE_REF} }} }} }} '
+                         f'inputFields {{ name }} }} }}'
             }
         headers = {
             'Content-Type': 'application/json',
             'User-Agent': 'Mozilla/5.0',
             'Accept': 'application/json',
         }
-        print(f"\nIntrospecting type: {type_name} (enum={enum})\nQuery: {query['query']}\n")
+        if verbose:
+            print(f"\nIntrospecting type: {type_name} (enum={enum})\nQuery: {query['query']}\n")
         try:
             resp = requests.post(url, json=query, headers=headers, timeout=10)
-            print(f"Status: {resp.status_code}")
             data = resp.json()
-            print(json.dumps(data, indent=2))
+            if verbose:
+                print(f"Status: {resp.status_code}")
+                print(json.dumps(data, indent=2))
+            return (data.get('data') or {}).get('__type')
         except Exception as e:
             print(f"Error introspecting type: {e}")
+            return None
 
 if __name__ == "__main__":
     parser = argparse.ArgumentParser(description="Rental Scraper & GraphQL Introspection Tool")
@@ -1631,6 +1794,9 @@ if __name__ == "__main__":
     parser.add_argument('--offmarket-month-start', type=int, required=True, help='Off market month start (1-12)')
     parser.add_argument('--offmarket-month-end', type=int, required=True, help='Off market month end (1-12)')
     parser.add_argument('--workers', type=int, default=4, help='Number of parallel workers for processing buildings (default: 4)')
+    parser.add_argument('--refresh-buildings', action='store_true', help='Rediscover the area\'s buildings even if its catalog is fresh')
+    parser.add_argument('--catalog-ttl-hours', type=float, default=BUILDING_CATALOG_TTL_HOURS,
+                        help=f'Reuse an area\'s cataloged buildings for this many hours (default: {BUILDING_CATALOG_TTL_HOURS:g})')
     
     args = parser.parse_args()
 
@@ -1656,7 +1822,9 @@ if __name__ == "__main__":
                 offmarket_month_end=args.offmarket_month_end,
                 area=args.area,
                 workers=args.workers,
-                save_to_file=True
+                save_to_file=True,
+                refresh_buildings=args.refresh_buildings,
+                catalog_ttl_hours=args.catalog_ttl_hours
             )
             print(f"\n📊 Summary: Collected {len(listings)} listings")
             write_status('completed', None, f"Scraping completed! Collected {len(listings)} listings")
@@ -0,0 +1,184 @@
+import json
+import os
+import queue
+import threading
+import time
+
+# How often the watcher checks the status file while anyone is subscribed
+WATCH_INTERVAL = 0.5
+
+# Minimum seconds between published updates from a scraper's progress pipe
+COALESCE_INTERVAL = 0.25
+
+# Minimum seconds between status file writes while the status stays the same; changes are written at once
+PERSIST_INTERVAL = 5
+
+# Events a slow subscriber may fall behind by; older ones are dropped, only the latest status matters
+SUBSCRIBER_BACKLOG = 16
+
+
+class StatusChannel:
+    """
+    Fans scraper status updates out to any number of subscribers
+    (/api/scraper-events streams).
+
+    Updates come from publish(), from a scraper's progress pipe via
+    follow(), and from a single watcher thread that re-reads the status
+    file whenever it changes. The watcher only runs while there are
+    subscribers, and ignores the file while a pipe is being followed.
+    """
+
+    def __init__(self, path, interval=WATCH_INTERVAL):
+        self.path = path
+        self.interval = interval
+        self._lock = threading.Lock()
+        self._subscribers = set()
+        self._latest = None
+        self._file_key = None
+        self._watcher = None
+        self._piped = False
+        self._pending = None
+        self._published_at = 0
+        self._flush_timer = None
+        self._flush_lock = threading.Lock()
+        self._unpersisted = None
+        self._persisted_status = None
+        self._persisted_at = 0
+
+    def subscribe(self):
+        """A queue receiving every status published from now on"""
+        subscriber = queue.Queue(maxsize=SUBSCRIBER_BACKLOG)
+        with self._lock:
+            self._subscribers.add(subscriber)
+            if self._watcher is None:
+                self._watcher = threading.Thread(target=self._watch, daemon=True)
+                self._watcher.start()
+        return subscriber
+
+    def unsubscribe(self, subscriber):
+        with self._lock:
+            self._subscribers.discard(subscriber)
+
+    def latest(self):
+        """The most recently published status, if any"""
+        return self._latest
+
+    @property
+    def piped(self):
+        """Whether a scraper is currently reporting over a progress pipe"""
+        return self._piped
+
+    def follow(self, stream):
+        """
+        Publish the JSON status lines a scraper writes to its progress pipe,
+        until the pipe closes.
+
+        Bursts are coalesced to at most one update per COALESCE_INTERVAL,
+        always ending on the latest state; a change of status (e.g. running
+        to completed) is published immediately. Changes of status, and
+        progress at most every PERSIST_INTERVAL, are also written to the
+        status file, so other server processes see them.
+        """
+        self._piped = True
+        try:
+            for line in stream:
+                try:
+                    status = json.loads(line)
+                except ValueError:
+                    continue
+                self._offer(status)
+        finally:
+            stream.close()
+            self._flush(final=True)
+            self._piped = False
+
+    def _offer(self, status):
+        with self._lock:
+            previous = self._pending or self._latest
+            wait = self._published_at + COALESCE_INTERVAL - time.monotonic()
+            self._pending = status
+            if wait > 0 and previous is not None and previous.get('status') == status.get('status'):
+                if self._flush_timer is None:
+                    self._flush_timer = threading.Timer(wait, self._flush)
+                    self._flush_timer.daemon = True
+                    self._flush_timer.start()
+                return
+        self._flush()
+
+    def _flush(self, final=False):
+        # Serialized so a timer flush can't publish an older state after a newer one
+        with self._flush_lock:
+            with self._lock:
+                status, self._pending = self._pending, None
+                if self._flush_timer is not None:
+                    self._flush_timer.cancel()
+                    self._flush_timer = None
+                self._published_at = time.monotonic()
+            if status is not None:
+                self.publish(status)
+                self._unpersisted = status
+            status = self._unpersisted
+            if status is not None and (final or status.get('status') != self._persisted_status
+                                       or time.monotonic() - self._persisted_at >= PERSIST_INTERVAL):
+                self._persist(status)
+                self._unpersisted = None
+
+    def _persist(self, status):
+        """Write a piped status to the status file, for other server processes to pick up"""
+        self._persisted_status = status.get('status')
+        self._persisted_at = time.monotonic()
+        temp_path = f"{self.path}.{os.getpid()}.tmp"
+        try:
+            with open(temp_path, 'w') as f:
+                json.dump(status, f)
+            os.replace(temp_path, self.path)
+            st = os.stat(self.path)
+            self._file_key = (st.st_mtime_ns, st.st_size)
+        except OSError as e:
+            print(f"Error writing scraper status: {e}")
+
+    def publish(self, status):
+        with self._lock:
+            if status == self._latest:
+                return
+            self._latest = status
+            subscribers = list(self._subscribers)
+        for subscriber in subscribers:
+            while True:
+                try:
+                    subscriber.put_nowait(status)
+                    break
+                except queue.Full:
+                    try:
+                        subscriber.get_nowait()
+                    except queue.Empty:
+                        pass
+
+    def refresh(self):
+        """Publish the status file if it changed since the last read"""
+        if self._piped:
+            return
+        try:
+            st = os.stat(self.path)
+        except OSError:
+            return
+        key = (st.st_mtime_ns, st.st_size)
+        if key == self._file_key:
+            return
+        try:
+            with open(self.path, 'r') as f:
+                status = json.load(f)
+        except (OSError, ValueError):
+            # Caught mid-write; the next check sees the finished file
+            return
+        self._file_key = key
+        self.publish(status)
+
+    def _watch(self):
+        while True:
+            self.refresh()
+            with self._lock:
+                if not self._subscribers:
+                    self._watcher = None
+                    return
+            time.sleep(self.interval)
@@ -1,61 +1,63 @@
-from flask import Flask, jsonify, render_template, send_from_directory, request
+from flask import Flask, Response, jsonify, render_template, send_from_directory, request, stream_with_context
+import base64
+import hashlib
 import json
 import os
-from datetime import datetime
-import requests
+import queue
+import socket
+from datetime import date, datetime
 import subprocess
 import threading
 import time
+from geocoder import Geocoder, LocationIQBackend, location_result, normalize_address
+from listing_index import SORT_KEYS, normalize_filters
+from listing_view import LISTING_FIELDS, frontend_listing, profile_for, serialize
+from mapped_snapshot import MappedSnapshots
+from marker_clusters import CLUSTER_FIELDS
+from response_cache import CachedResponse, ResponseCache
+from scraper_events import StatusChannel
+from snapshot import SnapshotManager
 
 app = Flask(__name__)
 
-# Load the rental data
-def load_rental_data():
-    """
-    Load rental data using a dual-file system for reliability:
-    1. rentals_latest.json - Fast access to current data (primary)
-    2. rentals_YYYYMMDD_HHMMSS.json - Timestamped backups (fallback)
-    
-    This approach provides both performance and data recovery capabilities.
-    """
-    try:
-        # Primary: Load rentals_latest.json for fast access
-        if os.path.exists('rentals_latest.json'):
-            with open('rentals_latest.json', 'r') as f:
-                data = json.load(f)
-                if isinstance(data, dict) and 'listings' in data:
-                    return data['listings']
-                return data
-        
-        # Fallback: Find the most recent timestamped backup file
-        json_files = [f for f in os.listdir('.') if f.startswith('rentals_') and f.endswith('.json') and f != 'rentals_latest.json']
-        if not json_files:
-            return []
-        latest_file = max(json_files)
-        print(f"Using fallback file: {latest_file}")
-        with open(latest_file, 'r') as f:
-            data = json.load(f)
-            if isinstance(data, dict) and 'listings' in data:
-                return data['listings']
-            return data
-    except Exception as e:
-        print(f"Error loading rental data: {e}")
-        return []
-
-# Load data at startup
-rental_data = load_rental_data()
+# Parsed rental data, reloaded in the background when the scraper writes new data. Under
+# gunicorn (see gunicorn.conf.py) workers map the snapshots its publisher process writes instead.
+snapshots = MappedSnapshots() if os.environ.get('SNAPSHOT_DIR') else SnapshotManager()
+snapshots.watch()
 
 LOCATIONIQ_API_KEY = os.environ.get('LOCATIONIQ_API_KEY', 'your_locationiq_api_key_here')
 SCRAPER_STATUS_FILE = 'scraper_status.json'
 
+# Scraper status updates pushed to /api/scraper-events subscribers
+scraper_events = StatusChannel(SCRAPER_STATUS_FILE)
+
+# Seconds between keep-alive comments on an idle event stream
+EVENT_KEEPALIVE = 15
+
+# Geocoding for addresses that aren't scraped buildings, cached on disk
+geocoder = Geocoder(LocationIQBackend(LOCATIONIQ_API_KEY))
+
+# /api/listings pagination
+DEFAULT_PAGE_SIZE = 100
+MAX_PAGE_SIZE = 1000
+
+# Serialized /api/listings and /api/markers responses, bounded by total body size
+listing_responses = ResponseCache(max_bytes=int(os.environ.get('LISTINGS_CACHE_MB', 64)) * 1024 * 1024)
+
 def set_scraper_status(status):
+    data = {'status': status, 'timestamp': datetime.now().isoformat()}
     try:
         with open(SCRAPER_STATUS_FILE, 'w') as f:
-            json.dump({'status': status, 'timestamp': datetime.now().isoformat()}, f)
+            json.dump(data, f)
     except Exception as e:
         print(f"Error writing scraper status: {e}")
+    scraper_events.publish(data)
 
 def get_scraper_status():
+    # A scraper launched by this server reports over a pipe; its latest state is in memory
+    if scraper_events.piped and scraper_events.latest() is not None:
+        return scraper_events.latest()
+
     if not os.path.exists(SCRAPER_STATUS_FILE):
         return {'status': 'idle', 'timestamp': datetime.now().isoformat()}
     
@@ -88,14 +90,27 @@ def get_scraper_status():
 def index():
     return render_template('index.html')
 
-@app.route('/api/listings')
-def get_listings():
-    rental_data = load_rental_data()  # Always reload latest data
-    if not rental_data:
-        return jsonify([])
-    
-    # Get all filter parameters from request
-    filters = {
+def parse_bbox(value):
+    """Parse a 'west,south,east,north' bbox parameter into (south, west, north, east)"""
+    if not value:
+        return None
+    try:
+        west, south, east, north = (float(v) for v in value.split(','))
+    except ValueError:
+        raise ValueError(f"Invalid bbox: {value} (expected west,south,east,north)")
+    if not (-180 <= west <= east <= 180 and -90 <= south <= north <= 90):
+        raise ValueError(f"Invalid bbox: {value} (expected west,south,east,north)")
+    return (south, west, north, east)
+
+def snapshots_loading():
+    """Response for requests that arrive before any listings have been loaded or published"""
+    response = jsonify({'error': 'Listings are still loading'})
+    response.headers['Retry-After'] = '1'
+    return response, 503
+
+def listing_filters():
+    """Get all listing filter parameters from the request"""
+    return {
         'area': request.args.get('area', 'all'),
         'by_owner': request.args.get('by_owner', 'all'),
         'bedrooms': request.args.get('bedrooms', 'all'),
@@ -107,240 +122,213 @@ def get_listings():
         'days_filter': request.args.get('days_filter', 'all'),
         'offmarket_month_start': request.args.get('offmarket_month_start', type=int),
         'offmarket_month_end': request.args.get('offmarket_month_end', type=int),
-        'rent_stabilized': request.args.get('rent_stabilized', 'all')
+        'rent_stabilized': request.args.get('rent_stabilized', 'all'),
+        'last_off_market': request.args.get('last_off_market', 'all'),
+        'bbox': parse_bbox(request.args.get('bbox'))
     }
 
-    # Only keep the most recent listing per unit (building_slug + unit)
-    unavailable_statuses = [
-        'NO_LONGER_AVAILABLE', 'RENTED', 'DELISTED', 'IN_CONTRACT', 'TEMPORARILY_OFF_MARKET', 'PAUSED'
-    ]
-    most_recent_per_unit = {}
-    for listing in rental_data:
-        key = (listing.get('building_slug', ''), listing.get('displayUnit', ''))
-        status = listing.get('status', '')
-        off_market = listing.get('offMarketAt')
-        if not off_market:
-            off_market_dt = datetime.min
-        else:
-            try:
-                off_market_dt = datetime.strptime(off_market, '%Y-%m-%d')
-            except Exception:
-                off_market_dt = datetime.min
-        # Prefer available listings
-        if key not in most_recent_per_unit:
-            most_recent_per_unit[key] = (off_market_dt, listing)
-        else:
-            current_status = most_recent_per_unit[key][1].get('status', '')
-            # If current is unavailable and this one is available, prefer available
-            if current_status in unavailable_statuses and status not in unavailable_statuses:
-                most_recent_per_unit[key] = (off_market_dt, listing)
-            # If both are available, prefer the one with the latest onMarketAt or availableAt if present
-            elif status not in unavailable_statuses and current_status not in unavailable_statuses:
-                # Use onMarketAt or availableAt if present, else fallback to offMarketAt
-                this_on = listing.get('onMarketAt') or listing.get('availableAt') or off_market
-                curr_on = most_recent_per_unit[key][1].get('onMarketAt') or most_recent_per_unit[key][1].get('availableAt') or most_recent_per_unit[key][1].get('offMarketAt')
-                try:
-                    this_on_dt = datetime.strptime(this_on, '%Y-%m-%d')
-                except Exception:
-                    this_on_dt = datetime.min
-                try:
-                    curr_on_dt = datetime.strptime(curr_on, '%Y-%m-%d')
-                except Exception:
-                    curr_on_dt = datetime.min
-                if this_on_dt > curr_on_dt:
-                    most_recent_per_unit[key] = (off_market_dt, listing)
-            # If both are unavailable, prefer the one with the latest offMarketAt
-            elif status in unavailable_statuses and current_status in unavailable_statuses:
-                if off_market_dt > most_recent_per_unit[key][0]:
-                    most_recent_per_unit[key] = (off_market_dt, listing)
-    filtered_listings = [v[1] for v in most_recent_per_unit.values()]
-
-    # Transform the data to match the frontend's expected format
-    transformed_listings = []
-    for listing in filtered_listings:
-        # Calculate days on market
-        off_market_date = datetime.strptime(listing.get('offMarketAt', datetime.now().isoformat()), '%Y-%m-%d')
-        days_on_market = (datetime.now() - off_market_date).days
-        transformed_listing = {
-            'id': listing.get('id', ''),
-            'price': listing.get('price', 0),
-            'beds': str(listing.get('bedroomCount', 0)),
-            'baths': str(listing.get('fullBathroomCount', 0) + (0.5 * listing.get('halfBathroomCount', 0))),
-            'sqft': listing.get('sqft', listing.get('livingAreaSize', 0)),
-            'unit': listing.get('displayUnit', 'N/A'),
-            'address': listing.get('building_address', ''),
-            'building_slug': listing.get('building_slug', ''),
-            'building_id': listing.get('building_id', ''),
-            'building_year_built': listing.get('building_year_built', 'N/A'),
-            'building_total_units': listing.get('building_total_units', 'N/A'),
-            'laundry_type': 'In building' if listing.get('laundryInBuilding', False) else 'None',
-            'pets_allowed': listing.get('petFriendly', False),
-            'private_outdoor_space': listing.get('privateOutdoorSpace', False),
-            'offMarketAt': listing.get('offMarketAt', datetime.now().isoformat()),
-            'days_on_market': days_on_market,
-            'url': f"https://streeteasy.com/rental/{listing.get('id', '')}",
-            'agent_name': listing.get('agentName', 'Owner'),
-            'agent_phone': listing.get('agentPhone', 'N/A'),
-            'agent_email': listing.get('agentEmail', 'N/A'),
-            'likely_stabilized': listing.get('likely_stabilized', False),
-            'stabilization_confidence': listing.get('stabilization_confidence', ''),
-            'stabilization_evidence': listing.get('stabilization_evidence', ''),
-            'is_owner': listing.get('is_owner', False),
-            'latitude': listing.get('latitude', None),
-            'longitude': listing.get('longitude', None),
-            'source_area': listing.get('source_area', '')
-        }
-        transformed_listings.append(transformed_listing)
-
-    # Apply server-side filters
-    filtered_listings = apply_filters(transformed_listings, filters)
-    
-    return jsonify(filtered_listings)
+@app.route('/api/listings')
+def get_listings():
+    # Until the listing database has been loaded into memory, queries go straight to SQL
+    snapshot = snapshots.get(block=False)
+    if snapshot is None and not isinstance(snapshots, SnapshotManager):
+        # Mapped mode before the first snapshot is published; there is no database to query
+        return snapshots_loading()
+    if snapshot is not None and not len(snapshot.view):
+        return jsonify([])
+    version = snapshot.version if snapshot is not None else snapshots.store.version()
+    try:
+        filters = listing_filters()
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
 
-def apply_filters(listings, filters):
-    """Apply all filters server-side for better performance"""
-    filtered = listings
-    
-    # Apply area filter using the source_area field from scraper
-    if filters['area'] != 'all' and filters['area']:
-        area_filter = filters['area'].lower().strip()
-        
-        area_filtered = []
-        for listing in filtered:
-            # Check if listing has source_area field (from scraper)
-            source_area = listing.get('source_area', '').lower().strip()
-            
-            # Match against the area the building was scraped from
-            if source_area and area_filter == source_area:
-                area_filtered.append(listing)
-            # Handle variations like "west village" vs "west-village" 
-            elif source_area and area_filter.replace(' ', '-') == source_area.replace(' ', '-'):
-                area_filtered.append(listing)
-            elif source_area and area_filter.replace('-', ' ') == source_area.replace('-', ' '):
-                area_filtered.append(listing)
+    fields = request.args.get('fields')
+    if fields:
+        fields = tuple(f.strip() for f in fields.split(',') if f.strip())
+        unknown = [f for f in fields if f not in LISTING_FIELDS]
+        if unknown:
+            return jsonify({'error': f"Unknown fields: {', '.join(unknown)}"}), 400
 
-        
-        # If no source_area field exists in data, show message that scraper needs to be updated
-        if len(area_filtered) == 0 and any('source_area' not in listing for listing in filtered[:5]):
-            print(f"WARNING: No source_area field found in listings. Data needs to be re-scraped with updated scraper.")
-        
-        filtered = area_filtered
-    
-    # Apply by_owner filter
-    if filters['by_owner'] != 'all':
-        if filters['by_owner'] == 'true':
-            filtered = [l for l in filtered if l.get('is_owner', False)]
-        elif filters['by_owner'] == 'false':
-            filtered = [l for l in filtered if not l.get('is_owner', False)]
-    
-    # Apply bedroom filter
-    if filters['bedrooms'] != 'all':
-        if filters['bedrooms'] == '3+':
-            filtered = [l for l in filtered if l.get('beds') and l['beds'].isdigit() and int(l['beds']) >= 3]
-        elif filters['bedrooms'] == 'Studio':
-            filtered = [l for l in filtered if l.get('beds') in ['0', 'Studio']]
+    sort = request.args.get('sort')
+    if sort and sort.lstrip('-') not in SORT_KEYS:
+        sort = None
+
+    # Optional cursor pagination; a cursor is only valid for the snapshot version that issued it
+    limit = request.args.get('limit', type=int)
+    cursor = request.args.get('cursor')
+    offset = 0
+    if cursor:
+        try:
+            cursor_version, offset = decode_cursor(cursor)
+        except ValueError:
+            return jsonify({'error': 'Invalid cursor'}), 400
+        if cursor_version != version:
+            return jsonify({'error': 'Cursor expired: listings have been updated'}), 410
+        limit = limit or DEFAULT_PAGE_SIZE
+    if limit is not None:
+        limit = max(1, min(limit, MAX_PAGE_SIZE))
+
+    # Responses are cached per data version, day (days_on_market changes daily) and
+    # normalized query, so the ETag is known before any work is done
+    key = (version, date.today().isoformat(), normalize_filters(filters), sort, fields, offset, limit)
+    if snapshot is None:
+        return cached_response(key, lambda: render_store_listings(snapshots.store, filters, sort, fields, offset, limit))
+    return cached_response(key, lambda: render_listings(snapshot, filters, sort, fields, offset, limit))
+
+def cached_response(key, compute):
+    """
+    Serve a JSON response from listing_responses, computing it on a miss.
+    The ETag is derived from the key, so revalidations never compute anything.
+    """
+    etag = hashlib.sha1(repr(key).encode()).hexdigest()
+    if request.if_none_match.contains(etag):
+        response = app.response_class(status=304)
+    else:
+        cached = listing_responses.get_or_compute(key, compute)
+        if cached.gzip_body is not None and 'gzip' in request.accept_encodings:
+            response = app.response_class(cached.gzip_body, mimetype='application/json', headers=cached.headers)
+            response.headers['Content-Encoding'] = 'gzip'
         else:
-            filtered = [l for l in filtered if l.get('beds') == filters['bedrooms']]
-    
-    # Apply price filters
-    if filters['min_price'] is not None:
-        filtered = [l for l in filtered if l.get('price', 0) >= filters['min_price']]
-    if filters['max_price'] is not None:
-        filtered = [l for l in filtered if l.get('price', 0) <= filters['max_price']]
-    
-    # Apply laundry filter
-    if filters['laundry'] != 'all':
-        filtered = [l for l in filtered if l.get('laundry_type') == filters['laundry']]
-    
-    # Apply pets filter
-    if filters['pets'] != 'all':
-        pets_bool = filters['pets'].lower() == 'true'
-        filtered = [l for l in filtered if l.get('pets_allowed', False) == pets_bool]
-    
-    # Apply outdoor filter
-    if filters['outdoor'] != 'all':
-        outdoor_bool = filters['outdoor'].lower() == 'true'
-        filtered = [l for l in filtered if l.get('private_outdoor_space', False) == outdoor_bool]
-    
-    # Apply days on market filter
-    if filters['days_filter'] != 'all':
-        if filters['days_filter'] == '0-7':
-            filtered = [l for l in filtered if l.get('days_on_market', 0) < 7]
-        elif filters['days_filter'] == '7-30':
-            filtered = [l for l in filtered if 7 <= l.get('days_on_market', 0) <= 30]
-        elif filters['days_filter'] == '30+':
-            filtered = [l for l in filtered if l.get('days_on_market', 0) > 30]
-    
-    # Apply off-market month filter
-    if filters['offmarket_month_start'] and filters['offmarket_month_end']:
-        month_start = filters['offmarket_month_start']
-        month_end = filters['offmarket_month_end']
-        filtered = [l for l in filtered if filter_by_month(l, month_start, month_end)]
-    
-    # Apply rent stabilized filter
-    if filters['rent_stabilized'] != 'all':
-        if filters['rent_stabilized'] == 'likely':
-            filtered = [l for l in filtered if l.get('likely_stabilized', False)]
-        elif filters['rent_stabilized'] == 'unlikely':
-            filtered = [l for l in filtered if not l.get('likely_stabilized', False)]
-        elif filters['rent_stabilized'] in ['high', 'medium', 'low']:
-            filtered = [l for l in filtered if (l.get('likely_stabilized', False) and 
-                       l.get('stabilization_confidence', '').lower() == filters['rent_stabilized'])]
-    
-    return filtered
+            response = app.response_class(cached.body, mimetype='application/json', headers=cached.headers)
+    response.set_etag(etag)
+    response.headers['Cache-Control'] = 'no-cache'
+    response.headers['Vary'] = 'Accept-Encoding'
+    return response
 
-def filter_by_month(listing, month_start, month_end):
-    """Helper function to filter by off-market month"""
-    off_market_date = listing.get('offMarketAt')
-    if not off_market_date:
-        return False
-    
+def render_listings(snapshot, filters, sort, fields, offset, limit):
+    """Run a listings query against a snapshot and serialize the result"""
+    # Deduplicated, frontend-shaped listings are precomputed per snapshot version;
+    # filters are evaluated against the snapshot's bitmap and sorted indexes
+    rows = snapshot.index.select(filters, sort=sort)
+    headers = {'X-Total-Count': str(len(rows)), 'X-Data-Version': str(snapshot.version)}
+    if limit is not None:
+        if offset + limit < len(rows):
+            headers['X-Next-Cursor'] = encode_cursor(snapshot.version, offset + limit)
+        rows = rows[offset:offset + limit]
+
+    # Common projections are assembled from JSON fragments serialized once per snapshot
+    profile = profile_for(fields)
+    if profile:
+        fragments = snapshot.view.fragments(profile)
+        body = b'[' + b','.join([fragments[i] for i in rows.tolist()]) + b']\n'
+    else:
+        body = serialize(snapshot.view.project(rows.tolist(), fields)) + b'\n'
+    return CachedResponse(body, headers)
+
+def render_store_listings(store, filters, sort, fields, offset, limit):
+    """Like render_listings, but with the query pushed down to the listing database"""
+    today = date.today()
+    version, total, listings = store.query_listings(filters, sort, offset, limit, today)
+    headers = {'X-Total-Count': str(total), 'X-Data-Version': version}
+    if limit is not None and offset + limit < total:
+        headers['X-Next-Cursor'] = encode_cursor(version, offset + limit)
+    fields = fields or LISTING_FIELDS
+    rows = [frontend_listing(listing, today) for listing in listings]
+    body = serialize([{f: row[f] for f in fields} for row in rows]) + b'\n'
+    return CachedResponse(body, headers)
+
+def encode_cursor(version, offset):
+    """Opaque pagination cursor for a position in one snapshot version's results"""
+    return base64.urlsafe_b64encode(json.dumps([version, offset]).encode()).decode()
+
+def decode_cursor(cursor):
     try:
-        month = datetime.strptime(off_market_date, '%Y-%m-%d').month
-        if month_start <= month_end:
-            return month_start <= month <= month_end
-        else:
-            # Wrap around year (e.g., Nov to Feb)
-            return month >= month_start or month <= month_end
-    except:
-        return False
+        version, offset = json.loads(base64.urlsafe_b64decode(cursor.encode()))
+    except Exception:
+        raise ValueError(f"Invalid cursor: {cursor}")
+    if not isinstance(offset, int) or offset < 0:
+        raise ValueError(f"Invalid cursor: {cursor}")
+    return version, offset
+
+@app.route('/api/listings/changes')
+def get_listing_changes():
+    """
+    Listings added, changed and removed since a data version (the
+    X-Data-Version of an earlier /api/listings response), keyed by
+    building_slug and unit
+    """
+    since = request.args.get('since')
+    if not since:
+        return jsonify({'error': 'Missing since parameter'}), 400
+    snapshot, diff = snapshots.changes_since(since)
+    if snapshot is None:
+        return snapshots_loading()
+    if diff is None:
+        return jsonify({'error': 'Version too old or unknown: refetch /api/listings', 'version': snapshot.version}), 410
+
+    def render():
+        changes = diff.render()
+        changes.update(since=since, version=snapshot.version)
+        return CachedResponse(serialize(changes) + b'\n')
+
+    return cached_response(('changes', since, snapshot.version, date.today().isoformat()), render)
+
+@app.route('/api/markers')
+def get_markers():
+    """
+    Map markers for the listings matching the /api/listings filters (usually
+    with a bbox), clustered on a grid for the given zoom level
+    """
+    try:
+        filters = listing_filters()
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    zoom = request.args.get('zoom', type=int)
+    if zoom is None:
+        return jsonify({'error': 'Missing zoom parameter'}), 400
+
+    snapshot = snapshots.get()
+    if snapshot is None:
+        return snapshots_loading()
+    key = ('markers', snapshot.version, date.today().isoformat(), normalize_filters(filters), zoom)
+    return cached_response(key, lambda: render_markers(snapshot, filters, zoom))
+
+def render_markers(snapshot, filters, zoom):
+    """Clusters as an array of arrays in CLUSTER_FIELDS order, rather than one object per listing"""
+    rows = snapshot.index.select(filters)
+    clusters = snapshot.clusters.clusters(rows, zoom)
+    body = serialize({'fields': CLUSTER_FIELDS, 'clusters': clusters, 'total': sum(c[2] for c in clusters)})
+    return CachedResponse(body + b'\n')
 
 @app.route('/api/statistics')
 def get_statistics():
-    if not rental_data:
-        return jsonify({
-            'total_listings': 0,
-            'average_price': 0,
-            'price_range': {'min': 0, 'max': 0},
-            'last_updated': datetime.now().isoformat()
-        })
-    
-    prices = [listing.get('price', 0) for listing in rental_data if 'price' in listing]
-    
-    return jsonify({
-        'total_listings': len(rental_data),
-        'average_price': sum(prices) / len(prices) if prices else 0,
-        'price_range': {
-            'min': min(prices) if prices else 0,
-            'max': max(prices) if prices else 0
-        },
-        'last_updated': datetime.now().isoformat()
-    })
+    """
+    Market statistics (count, mean, p10/median/p90 price, stabilized share)
+    for the listings matching the same filters as /api/listings
+    """
+    try:
+        filters = listing_filters()
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    snapshot = snapshots.get()
+    if snapshot is None:
+        return snapshots_loading()
+    statistics = snapshot.statistics.query(filters)
+    statistics['version'] = snapshot.version
+    statistics['last_updated'] = snapshot.loaded_at.isoformat()
+    return jsonify(statistics)
 
 @app.route('/api/geocode')
 def geocode():
     address = request.args.get('address')
     if not address:
         return jsonify({'error': 'Missing address parameter'}), 400
-    url = f'https://us1.locationiq.com/v1/search.php?key={LOCATIONIQ_API_KEY}&q={address}, New York, NY&format=json&limit=1'
-    resp = requests.get(url, headers={'User-Agent': 'LeaseExplorer/1.0'})
-    return jsonify(resp.json())
 
-@app.route('/api/scraper-status')
-def scraper_status():
-    status = get_scraper_status()
-    
-    # Enhance status with more details for frontend display
+    # Scraped buildings already carry coordinates
+    snapshot = snapshots.get(block=False)
+    location = snapshot.locations.get(normalize_address(address)) if snapshot is not None else None
+    if location is not None:
+        return jsonify(location_result(address, *location, source='snapshot'))
+
+    try:
+        return jsonify(geocoder.lookup(address))
+    except Exception as e:
+        print(f"Error geocoding {address!r}: {e}")
+        return jsonify({'error': 'Geocoding failed'}), 502
+
+def describe_status(status):
+    """Add a display message and progress percentage to a running scraper's status"""
+    status = dict(status)
     if status.get('status') == 'running' and 'progress' in status:
         progress = status['progress']
         
@@ -360,8 +348,39 @@ def scraper_status():
                 percent = (buildings['current'] / buildings['total']) * 100 if buildings['total'] > 0 else 0
                 status['display_message'] = f"Processing buildings: {buildings['current']}/{buildings['total']} ({percent:.1f}%)"
                 status['progress_percent'] = percent
-    
-    return jsonify(status)
+    return status
+
+@app.route('/api/scraper-status')
+def scraper_status():
+    """Current scraper status; polling fallback for clients without /api/scraper-events"""
+    return jsonify(describe_status(get_scraper_status()))
+
+@app.route('/api/scraper-events')
+def scraper_status_events():
+    """Server-Sent Events stream of scraper status, one 'status' event per change"""
+    subscriber = scraper_events.subscribe()
+    scraper_events.refresh()
+    current = scraper_events.latest() or {'status': 'idle', 'timestamp': datetime.now().isoformat()}
+
+    def stream():
+        sent = None
+        status = current
+        try:
+            while True:
+                if status is None:
+                    yield ': keep-alive\n\n'
+                elif status != sent:
+                    yield f"event: status\ndata: {json.dumps(describe_status(status))}\n\n"
+                    sent = status
+                try:
+                    status = subscriber.get(timeout=EVENT_KEEPALIVE)
+                except queue.Empty:
+                    status = None
+        finally:
+            scraper_events.unsubscribe(subscriber)
+
+    return Response(stream_with_context(stream()), mimetype='text/event-stream',
+                    headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'})
 
 @app.route('/api/stop-scraper', methods=['POST'])
 def stop_scraper():
@@ -422,6 +441,8 @@ def run_scraper():
             '--offmarket-month-end', str(offmarket_month_end),
             '--workers', '4'  # Use 4 workers for faster processing
         ]
+        if str(params.get('refresh_buildings', '')).lower() == 'true':
+            cmd.append('--refresh-buildings')
         
         # Run scraper in a separate thread to avoid blocking
         def run_scraper_thread():
@@ -433,7 +454,25 @@ def run_scraper():
                 stream.close()
             try:
                 set_scraper_status('running')
-                process = subprocess.Popen(cmd, stdout=subprocess.PIPE, stderr=subprocess.PIPE, text=True, bufsize=1)
+                popen_args = {}
+                t_progress = None
+                if os.name != 'nt':
+                    # Progress comes back over a pipe and is kept in memory instead of going through the status file.
+                    # A socket pair rather than os.pipe, so reading it is cooperative under gevent workers too.
+                    progress_socket, scraper_socket = socket.socketpair()
+                    popen_args = {'pass_fds': (scraper_socket.fileno(),),
+                                  'env': dict(os.environ, SCRAPER_PROGRESS_FD=str(scraper_socket.fileno()))}
+                    t_progress = threading.Thread(target=scraper_events.follow,
+                                                  args=(progress_socket.makefile('r', encoding='utf-8'),))
+                    progress_socket.close()
+                try:
+                    process = subprocess.Popen(cmd, stdout=subprocess.PIPE, stderr=subprocess.PIPE, text=True, bufsize=1,
+                                               **popen_args)
+                finally:
+                    if t_progress is not None:
+                        scraper_socket.close()
+                if t_progress is not None:
+                    t_progress.start()
                 t_out = threading.Thread(target=stream_output, args=(process.stdout, '[SCRAPER STDOUT]'))
                 t_err = threading.Thread(target=stream_output, args=(process.stderr, '[SCRAPER STDERR]'))
                 t_out.start()
@@ -441,12 +480,14 @@ def run_scraper():
                 process.wait()
                 t_out.join()
                 t_err.join()
+                if t_progress is not None:
+                    t_progress.join()
                 if process.returncode == 0:
                     print("Scraper completed successfully")
                     # Force reload the rental data
-                    global rental_data
-                    rental_data = load_rental_data()
-                    print(f"Reloaded {len(rental_data)} listings after scraper completion")
+                    snapshot = snapshots.refresh()
+                    if snapshot is not None:
+                        print(f"Reloaded {len(snapshot.view)} listings after scraper completion")
                     set_scraper_status('idle')
                 else:
                     print(f"Scraper failed with exit code {process.returncode}")
@@ -478,4 +519,4 @@ def run_scraper():
         }), 500
 
 if __name__ == '__main__':
-    app.run(port=5001)
\ No newline at end of file
+    app.run(port=int(os.environ.get('PORT', 5001)))
\ No newline at end of file
@@ -0,0 +1,232 @@
+import hashlib
+import os
+import threading
+import time
+from collections import OrderedDict
+from datetime import datetime
+
+from geocoder import normalize_address
+from listing_changes import SnapshotDiff, changes_between
+from listing_index import ListingIndex
+from listing_view import ListingView
+from market_stats import MarketStatistics
+from marker_clusters import MarkerClusters
+from rentals_json import iter_rentals
+from storage import ListingStore
+
+LATEST_FILE = 'rentals_latest.json'
+
+# Where listings come from: 'auto' (whichever of the listing database and the newest
+# rentals file was updated last), 'database' or 'file'
+LISTINGS_SOURCE = os.environ.get('LISTINGS_SOURCE', 'auto')
+
+# Number of past versions whose diffs are kept for /api/listings/changes
+CHANGE_HISTORY = 50
+
+# Seconds between checks for a new data version once watch() has been started
+WATCH_INTERVAL = 2
+
+
+def find_rentals_file():
+    """
+    Locate the rental data file using the dual-file system:
+    1. rentals_latest.json - Fast access to current data (primary)
+    2. rentals_YYYYMMDD_HHMMSS.json - Timestamped backups (fallback)
+    """
+    if os.path.exists(LATEST_FILE):
+        return LATEST_FILE
+    json_files = [f for f in os.listdir('.') if f.startswith('rentals_') and f.endswith('.json') and f != LATEST_FILE]
+    if not json_files:
+        return None
+    return max(json_files)
+
+
+def file_version(path):
+    """Cheap data version for a rentals file, derived from its stat metadata"""
+    st = os.stat(path)
+    key = f"{os.path.abspath(path)}:{st.st_mtime_ns}:{st.st_size}"
+    return hashlib.sha1(key.encode()).hexdigest()[:16]
+
+
+class Snapshot:
+    """
+    An immutable, fully parsed copy of the rental data for one data version.
+
+    listings may be any iterable (e.g. a streaming reader); raw listings
+    are only kept as long as the per-unit deduplication needs them.
+    """
+
+    def __init__(self, version, listings, source=None):
+        self.version = version
+        self.view = ListingView(listings)
+        self.index = ListingIndex(self.view)
+        self.statistics = MarketStatistics(self.index)
+        self.clusters = MarkerClusters(self.index, [row['id'] for row in self.view.rows])
+        # Building coordinates (from the scraped geoCenter) by normalized address, for /api/geocode
+        self.locations = {}
+        for row in self.view.rows:
+            if row['latitude'] is not None and row['longitude'] is not None:
+                self.locations.setdefault(normalize_address(row['address']), (row['latitude'], row['longitude']))
+        self.source = source
+        self.loaded_at = datetime.now()
+
+
+class SnapshotManager:
+    """
+    Keeps the parsed rental data in memory and reloads it only when the
+    scraper has produced new data.
+
+    The data comes from the listing database or the newest rentals JSON
+    file, whichever was updated last (see LISTINGS_SOURCE).
+
+    Requests get the current snapshot via get(). When the data has a new
+    version, the reload happens in a background thread and callers keep
+    being served the previous snapshot until the new one is swapped in with
+    a single assignment. Only the very first load, when there is nothing to
+    serve yet, is synchronous.
+
+    Each swap records a SnapshotDiff against the previous version, so
+    changes_since() can tell clients what changed without a full reload.
+
+    After watch(), a background thread checks for new versions and get()
+    returns the current snapshot without touching the data source at all.
+    """
+
+    def __init__(self, store=None, source=LISTINGS_SOURCE):
+        self.store = store or ListingStore()
+        self.source = source
+        self._snapshot = None
+        self._lock = threading.Lock()
+        self._loading_version = None
+        self._failed_version = None
+        self._watcher = None
+        # version -> (previous version, SnapshotDiff from it)
+        self._changes = OrderedDict()
+
+    def watch(self, interval=WATCH_INTERVAL):
+        """Start checking for new data versions in a background thread"""
+        with self._lock:
+            if self._watcher is not None:
+                return
+            self._watcher = threading.Thread(target=self._watch, args=(interval,))
+            self._watcher.daemon = True
+        self._watcher.start()
+
+    def _watch(self, interval):
+        while True:
+            try:
+                source, version = self.current_source()
+                snapshot = self._snapshot
+                if snapshot is not None and snapshot.version != version and version != self._failed_version:
+                    self._reload_in_background(source, version)
+            except Exception as e:
+                print(f"Error checking for new rental data: {e}")
+            time.sleep(interval)
+
+    def current_source(self):
+        """
+        (source, version) of the newest data: the listing database or a
+        rentals file path, per LISTINGS_SOURCE. In 'auto' mode a rentals
+        file wins only if it was written after the database last changed.
+        """
+        path = find_rentals_file() if self.source != 'database' else None
+        if self.source != 'file' and ListingStore.exists(self.store.path):
+            if path is None or os.stat(path).st_mtime_ns <= self.store.updated_at():
+                return self.store, self.store.version()
+        return path, file_version(path) if path else None
+
+    def get(self, block=True):
+        """
+        Return the current snapshot, scheduling a reload if the data changed.
+
+        With block=False a first load from the listing database also happens
+        in the background, and None is returned until it is done; callers can
+        query the database directly meanwhile.
+        """
+        snapshot = self._snapshot
+        if snapshot is not None and self._watcher is not None:
+            return snapshot
+        source, version = self.current_source()
+        if snapshot is not None and (snapshot.version == version or version == self._failed_version):
+            return snapshot
+        if snapshot is None:
+            if not block and source is self.store:
+                if version != self._failed_version:
+                    self._reload_in_background(source, version)
+                return None
+            with self._lock:
+                if self._snapshot is None:
+                    self._snapshot = self._load(source, version) or Snapshot(None, [])
+            return self._snapshot
+        self._reload_in_background(source, version)
+        return snapshot
+
+    def refresh(self):
+        """Synchronously load the latest data, e.g. right after a scraper run"""
+        source, version = self.current_source()
+        with self._lock:
+            if self._snapshot is None or self._snapshot.version != version:
+                snapshot = self._load(source, version)
+                if snapshot is not None:
+                    self._swap(snapshot)
+        return self._snapshot
+
+    def _reload_in_background(self, source, version):
+        with self._lock:
+            if self._loading_version == version:
+                return
+            self._loading_version = version
+
+        def reload():
+            snapshot = self._load(source, version)
+            with self._lock:
+                if snapshot is not None:
+                    self._swap(snapshot)
+                self._loading_version = None
+
+        thread = threading.Thread(target=reload)
+        thread.daemon = True
+        thread.start()
+
+    def _swap(self, snapshot):
+        """Make snapshot the current one, recording what changed; called with the lock held"""
+        previous = self._snapshot
+        if previous is not None and previous.version is not None and previous.version != snapshot.version:
+            try:
+                self._changes[snapshot.version] = (previous.version, SnapshotDiff.between(previous.view, snapshot.view))
+            except Exception as e:
+                print(f"Error computing listing changes for {snapshot.version}: {e}")
+            while len(self._changes) > CHANGE_HISTORY:
+                self._changes.popitem(last=False)
+        self._snapshot = snapshot
+
+    def change_history(self):
+        """{version: (previous version, SnapshotDiff)} for the recent versions"""
+        with self._lock:
+            return dict(self._changes)
+
+    def changes_since(self, version):
+        """
+        (current snapshot, SnapshotDiff from version to it), or (snapshot, None)
+        if version is too old or unknown to be answered with a diff
+        """
+        snapshot = self._snapshot
+        return snapshot, changes_between(self.change_history(), version, snapshot.version if snapshot is not None else None)
+
+    def _load(self, source, version):
+        """Build a snapshot, or return None (keeping the old one) if the data can't be read"""
+        if source is None:
+            return Snapshot(None, [])
+        try:
+            if source is self.store:
+                snapshot = Snapshot(version, self.store.iter_listings(), source=self.store.path)
+            else:
+                snapshot = Snapshot(version, iter_rentals(source), source=source)
+        except Exception as e:
+            print(f"Error loading rental data from {source}: {e}")
+            self._failed_version = version
+            return None
+        if snapshot.source not in (LATEST_FILE, self.store.path):
+            print(f"Using fallback file: {source}")
+        self._failed_version = None
+        return snapshot
@@ -0,0 +1,66 @@
+import os
+import sqlite3
+import threading
+from contextlib import contextmanager
+
+# Idle connections kept open per pool
+MAX_IDLE = 8
+
+
+class ConnectionPool:
+    """
+    SQLite connections shared by the threads of a process.
+
+    Connections are checked out for one operation and returned afterwards,
+    rather than held per thread: under gevent (see gunicorn.conf.py) thread
+    locals are per greenlet, which would mean a new connection for every
+    request. setup(conn) runs once per process, on the first connection,
+    e.g. to create the schema; pragmas run on every new connection.
+    """
+
+    def __init__(self, path, setup=None, pragmas=(), max_idle=MAX_IDLE):
+        self.path = path
+        self.setup = setup
+        self.pragmas = pragmas
+        self.max_idle = max_idle
+        self._lock = threading.Lock()
+        self._idle = []
+        self._pid = None
+
+    def _open(self):
+        conn = sqlite3.connect(self.path, timeout=30, check_same_thread=False)
+        for pragma in self.pragmas:
+            conn.execute(f'PRAGMA {pragma}')
+        return conn
+
+    def _checkout(self):
+        with self._lock:
+            if self._pid != os.getpid():
+                # First use, or a forked child: connections are not shared across processes
+                self._idle = []
+                if self.setup is not None:
+                    conn = self._open()
+                    self.setup(conn)
+                    self._idle.append(conn)
+                self._pid = os.getpid()
+            if self._idle:
+                return self._idle.pop()
+        return self._open()
+
+    def _checkin(self, conn):
+        if conn.in_transaction:
+            conn.rollback()
+        with self._lock:
+            if self._pid == os.getpid() and len(self._idle) < self.max_idle:
+                self._idle.append(conn)
+                return
+        conn.close()
+
+    @contextmanager
+    def connection(self):
+        """A connection for the duration of the with block"""
+        conn = self._checkout()
+        try:
+            yield conn
+        finally:
+            self._checkin(conn)
@@ -22,9 +22,6 @@ document.addEventListener('DOMContentLoaded', function() {
         document.getElementById('offmarket-month-end').value = 12; // December (all months)
 
 
-    // Load initial data
-    fetchListings();
-    
     // Add event listeners for all filter dropdowns and save to localStorage
     const saveFilter = id => {
         const el = document.getElementById(id);
@@ -63,9 +60,11 @@ document.addEventListener('DOMContentLoaded', function() {
     // Trigger area filter change on page load to show/hide custom input
     document.getElementById('area-filter').dispatchEvent(new Event('change'));
     
-    // Initialize map immediately since it's always visible
+    // Initialize map immediately since it's always visible, then load the initial data
+    // (after the map, so markers can be limited to its viewport)
     setTimeout(() => {
         initializeMap();
+        fetchListings();
     }, 100);
 });
 
@@ -74,14 +73,7 @@ let map;
 let markers = [];
 window.mapMarkersById = {};
 window.mapInitialized = false;
-window.currentFilteredListings = [];
 let mapLoadingTimeout;
-let mapMarkersLoaded = 0;
-let mapMarkersExpected = 0;
-let mapGeocodeErrors = 0;
-
-// Throttle geocode requests to avoid rate limiting
-let lastGeocodeTime = 0;
 
 function initializeMap() {
     if (window.mapInitialized) return;
@@ -104,109 +96,75 @@ function initializeMap() {
     
     window.mapInitialized = true;
     
+    // Reload markers when the map is zoomed or panned outside the area they were loaded for
+    map.on('moveend', debouncedRefreshMarkers);
+    
     // Show loading overlay and set timeout to hide it after 3 seconds
     document.getElementById('loading').style.display = '';
     mapLoadingTimeout = setTimeout(() => {
         document.getElementById('loading').style.display = 'none';
     }, 3000);
-    
-    // Update map with current filtered data
-    updateMap();
 }
 
-function updateMap() {
+// Draw an /api/markers response: single listings as price markers, everything else as clusters
+function updateMap(data) {
     if (!window.mapInitialized) return;
     
     // Clear existing markers
     markers.forEach(marker => map.removeLayer(marker));
     markers = [];
-    mapMarkersLoaded = 0;
-    mapGeocodeErrors = 0;
     window.mapMarkersById = {};
     
-    // Use client-side filtered listings if available, otherwise server listings
-    const mapListings = window.clientFilteredListings || window.allListings || [];
-    window.currentFilteredListings = mapListings;
-    mapMarkersExpected = mapListings.length;
+    document.getElementById('loading').style.display = 'none';
+    if (mapLoadingTimeout) clearTimeout(mapLoadingTimeout);
     
-    if (mapListings.length === 0) {
-        document.getElementById('loading').style.display = 'none';
-        return;
-    }
-    
-    // Show loading overlay if there are markers to load
-    if (mapMarkersExpected > 0) {
-        document.getElementById('loading').style.display = '';
-        if (mapLoadingTimeout) clearTimeout(mapLoadingTimeout);
-        mapLoadingTimeout = setTimeout(() => {
-            document.getElementById('loading').style.display = 'none';
-        }, 3000);
-    } else {
-        document.getElementById('loading').style.display = 'none';
-    }
-    
-    // Add markers using lat/lon if present, otherwise geocode
-    if (mapMarkersExpected === 0) return;
-    mapListings.forEach(listing => {
-        if (listing.latitude && listing.longitude) {
-            addMarkerToMap(parseFloat(listing.latitude), parseFloat(listing.longitude), listing);
+    const column = Object.fromEntries(data.fields.map((name, i) => [name, i]));
+    data.clusters.forEach(cluster => {
+        const lat = cluster[column.latitude];
+        const lon = cluster[column.longitude];
+        if (cluster[column.count] === 1) {
+            addMarkerToMap(lat, lon, { id: cluster[column.id], price: cluster[column.min_price], address: '' });
         } else {
-            geocodeAddress(listing.address, listing);
+            addClusterToMap(lat, lon, cluster[column.count], cluster[column.min_price], cluster[column.median_price]);
         }
     });
 }
 
-function geocodeAddress(address, listing) {
-    const now = Date.now();
-    const delay = Math.max(0, 500 - (now - lastGeocodeTime)); // 500ms between requests
-    setTimeout(() => {
-        lastGeocodeTime = Date.now();
-        // Use backend proxy for geocoding
-        const url = `/api/geocode?address=${encodeURIComponent(address)}`;
-        fetch(url)
-            .then(response => response.json())
-            .then(data => {
-                if (data && data.length > 0) {
-                    const location = data[0];
-                    addMarkerToMap(
-                        parseFloat(location.lat), 
-                        parseFloat(location.lon), 
-                        listing
-                    );
-                    mapMarkersLoaded++;
-                    // Hide loading overlay after first marker loads
-                    if (mapMarkersLoaded === 1) {
-                        document.getElementById('loading').style.display = 'none';
-                        if (mapLoadingTimeout) clearTimeout(mapLoadingTimeout);
-                    }
-                } else {
-                    mapGeocodeErrors++;
-                    checkMapGeocodeErrors();
-                }
-            })
-            .catch(error => {
-                mapGeocodeErrors++;
-                checkMapGeocodeErrors();
-            });
-    }, delay);
+function formatThousands(price) {
+    return `$${(price / 1000).toFixed(0)}k`;
 }
 
-function checkMapGeocodeErrors() {
-    // If all geocoding failed, show error
-    if (mapGeocodeErrors >= mapMarkersExpected && mapMarkersExpected > 0) {
-        document.getElementById('loading').textContent = 'Could not geocode any addresses. Please try again later.';
-        document.getElementById('loading').style.display = '';
-        setTimeout(() => {
-            document.getElementById('loading').style.display = 'none';
-        }, 4000);
-    }
+function addClusterToMap(lat, lon, count, minPrice, medianPrice) {
+    const size = count < 10 ? 34 : count < 100 ? 40 : 48;
+    const icon = L.divIcon({
+        className: 'cluster-marker',
+        html: `<span class="cluster-count">${count}</span>` +
+              (minPrice !== null ? `<span class="cluster-price">${formatThousands(minPrice)}+</span>` : ''),
+        iconSize: [size, size],
+        iconAnchor: [size / 2, size / 2]
+    });
+    const clusterMarker = L.marker([lat, lon], { icon }).addTo(map);
+    markers.push(clusterMarker);
+    
+    clusterMarker.on('click', function() {
+        if (map.getZoom() < map.getMaxZoom()) {
+            // Zoom in to split the cluster up
+            map.setView([lat, lon], Math.min(map.getZoom() + 2, map.getMaxZoom()), { animate: true });
+        } else {
+            // Fully zoomed in: these listings share a building
+            const prices = minPrice !== null
+                ? `<div>From $${minPrice.toLocaleString()}/month, median $${medianPrice.toLocaleString()}</div>`
+                : '';
+            clusterMarker.bindPopup(`<div class="popup-content"><strong>${count} listings</strong>${prices}</div>`).openPopup();
+        }
+    });
 }
 
 function addMarkerToMap(lat, lon, listing) {
     // Create custom marker
     const marker = L.divIcon({
         className: 'price-marker',
-        html: `$${(listing.price / 1000).toFixed(0)}k`,
+        html: formatThousands(listing.price),
         iconSize: [30, 30],
         iconAnchor: [15, 15]
     });
@@ -221,29 +179,8 @@ function addMarkerToMap(lat, lon, listing) {
     
     markers.push(mapMarker);
     
-    // Create popup content
-    const popupContent = `
-        <div class="popup-content">
-            <div class="popup-header">
-                <div class="popup-price">$${listing.price.toLocaleString()}/month</div>
-                <div class="popup-details">
-                    <div><strong>Beds:</strong> ${listing.beds === '0' ? 'Studio' : listing.beds}</div>
-                    <div><strong>Baths:</strong> ${listing.baths}</div>
-                    <div><strong>Unit:</strong> ${listing.unit}</div>
-                    <div><strong>SqFt:</strong> ${listing.sqft || 'N/A'}</div>
-                    <div><strong>Days on Market:</strong> ${listing.days_on_market}</div>
-                    <div><strong>Agent:</strong> ${listing.agent_name}</div>
-                    <div><strong>Email:</strong> ${listing.agent_email || 'N/A'}</div>
-                </div>
-            </div>
-            <div class="popup-address">${listing.address}</div>
-            <div class="popup-actions">
-                <a href="${listing.url}" target="_blank" class="popup-link">View</a>
-            </div>
-        </div>
-    `;
-    
-    mapMarker.bindPopup(popupContent);
+    // Markers only carry id and price; use the full listing once its page is loaded
+    mapMarker.bindPopup(() => buildPopupContent(window.listingDetailsById[listing.id] || listing));
     
     // Add click handler to highlight corresponding listing
     mapMarker.on('click', function() {
@@ -263,6 +200,44 @@ function addMarkerToMap(lat, lon, listing) {
     });
 }
 
+// Show a listing on the map: open its marker, or zoom in on it if it is part of a cluster
+function showListingOnMap(listing, zoom) {
+    if (!window.mapInitialized || !listing) return;
+    const marker = window.mapMarkersById[listing.id];
+    if (marker) {
+        map.setView(marker.getLatLng(), zoom || map.getZoom(), { animate: true });
+        marker.openPopup();
+    } else if (listing.latitude && listing.longitude) {
+        map.setView([parseFloat(listing.latitude), parseFloat(listing.longitude)],
+                    Math.max(zoom || 0, 17), { animate: true });
+    }
+}
+
+function buildPopupContent(listing) {
+    const field = value => (value === undefined || value === null || value === '') ? 'N/A' : value;
+    const url = listing.url || `https://streeteasy.com/rental/${listing.id}`;
+    return `
+        <div class="popup-content">
+            <div class="popup-header">
+                <div class="popup-price">$${listing.price.toLocaleString()}/month</div>
+                <div class="popup-details">
+                    <div><strong>Beds:</strong> ${listing.beds === '0' ? 'Studio' : field(listing.beds)}</div>
+                    <div><strong>Baths:</strong> ${field(listing.baths)}</div>
+                    <div><strong>Unit:</strong> ${field(listing.unit)}</div>
+                    <div><strong>SqFt:</strong> ${field(listing.sqft)}</div>
+                    <div><strong>Days on Market:</strong> ${field(listing.days_on_market)}</div>
+                    <div><strong>Agent:</strong> ${field(listing.agent_name)}</div>
+                    <div><strong>Email:</strong> ${field(listing.agent_email)}</div>
+                </div>
+            </div>
+            <div class="popup-address">${listing.address}</div>
+            <div class="popup-actions">
+                <a href="${url}" target="_blank" class="popup-link">View</a>
+            </div>
+        </div>
+    `;
+}
+
 function getCurrentFilteredListings() {
     // Guard: if listings not loaded, return empty array
     if (!Array.isArray(window.allListings)) {
@@ -347,27 +322,25 @@ function getCurrentFilteredListings() {
     return filteredListings;
 }
 
-// Debounced version of updateMap
-const debouncedUpdateMap = debounce(updateMap, 300);
-
-function updateStats(listings) {
+function updateStats(stats) {
     // Update total count
-    document.getElementById('total-count').textContent = listings.length;
+    document.getElementById('total-count').textContent = stats.total_listings;
     
-    // Calculate average price
-    const totalPrice = listings.reduce((sum, listing) => sum + listing.price, 0);
-    const avgPrice = listings.length > 0 ? Math.round(totalPrice / listings.length) : 0;
-    document.getElementById('avg-price').textContent = `$${avgPrice.toLocaleString()}`;
+    // Average price
+    document.getElementById('avg-price').textContent = `$${Math.round(stats.average_price).toLocaleString()}`;
     
     // Count stabilized units
-    const stabilizedCount = listings.filter(listing => listing.likely_stabilized).length;
+    const stabilizedCount = Math.round(stats.stabilized_share * stats.total_listings);
     document.getElementById('stabilized-count').textContent = stabilizedCount;
 }
 
-function displayListings(listings) {
+function displayListings(listings, append = false) {
     listings.sort((a, b) => a.price - b.price);
     const container = document.getElementById('listings-container');
-    if (listings.length === 0) {
+    if (append) {
+        const loadMore = document.getElementById('load-more-listings');
+        if (loadMore) loadMore.remove();
+    } else if (listings.length === 0) {
         container.innerHTML = `
             <div class="listing-card empty-state-card">
                 <div class="empty-state-icon">🔍</div>
@@ -378,8 +351,8 @@ function displayListings(listings) {
         return;
     }
     
-    // Clear the container
-    container.innerHTML = '';
+    // Clear the container unless we're appending another page
+    if (!append) container.innerHTML = '';
     
     // Create and append listing cards
     listings.forEach(listing => {
@@ -387,13 +360,7 @@ function displayListings(listings) {
         card.className = `listing-card ${listing.likely_stabilized ? 'stabilized' : ''}`;
         
         // Scroll to marker on map when card is clicked
-        card.addEventListener('click', () => {
-            if (listing.id && window.mapMarkersById[listing.id]) {
-                const marker = window.mapMarkersById[listing.id];
-                map.setView(marker.getLatLng(), map.getZoom(), { animate: true });
-                marker.openPopup();
-            }
-        });
+        card.addEventListener('click', () => showListingOnMap(listing));
         
         // Create header with address and price
         const header = document.createElement('div');
@@ -507,40 +474,6 @@ function applyFilters() {
     fetchListings();
 }
 
-// Client-side filtering function for last off market date
-function applyClientSideFilters(listings) {
-    if (!listings || listings.length === 0) return listings;
-    
-    const lastOffMarketFilter = document.getElementById('last-off-market-filter')?.value;
-    
-    if (!lastOffMarketFilter || lastOffMarketFilter === 'all') {
-        return listings;
-    }
-    
-    const currentDate = new Date();
-    const filterValue = parseInt(lastOffMarketFilter);
-    
-    return listings.filter(listing => {
-        if (!listing.offMarketAt) return false;
-        
-        try {
-            const offMarketDate = new Date(listing.offMarketAt);
-            const yearsDiff = (currentDate - offMarketDate) / (1000 * 60 * 60 * 24 * 365.25);
-            
-            if (filterValue === 6) {
-                // 6+ years ago
-                return yearsDiff >= 6;
-            } else {
-                // Within X years
-                return yearsDiff <= filterValue;
-            }
-        } catch (error) {
-            console.error('Error parsing off market date:', listing.offMarketAt, error);
-            return false;
-        }
-    });
-}
-
 // Use debounce to prevent too many rapid updates
 function debounce(func, wait) {
     let timeout;
@@ -555,9 +488,17 @@ function debounce(func, wait) {
 // Debounced version of applyFilters
 const debouncedApplyFilters = debounce(applyFilters, 300);
 
-function fetchListings() {
-    setListingsLoadingOverlay(true);
-    
+const DETAIL_PAGE_SIZE = 100;
+// Markers are loaded for the visible map area plus this margin (as a fraction of the view),
+// so small pans and popups don't trigger another request
+const MARKER_BOUNDS_PADDING = 0.5;
+let listingsRequestId = 0;
+let markersRequestId = 0;
+let markerBounds = null;
+let markerZoom = null;
+window.listingDetailsById = {};
+
+function currentFilterParams() {
     // Get all current filter values
     const filters = new URLSearchParams();
     
@@ -578,10 +519,10 @@ function fetchListings() {
         'days_filter': document.getElementById('days-filter').value,
         'offmarket_month_start': document.getElementById('offmarket-month-start').value,
         'offmarket_month_end': document.getElementById('offmarket-month-end').value,
-        'rent_stabilized': document.getElementById('rent-stabilized-filter').value
+        'rent_stabilized': document.getElementById('rent-stabilized-filter').value,
+        'last_off_market': lastOffMarketParam(document.getElementById('last-off-market-filter')?.value)
     };
 
-    
     // Add parameters, but always include area filter for clarity
     for (const [key, value] of Object.entries(filterParams)) {
         if (key === 'area') {
@@ -591,66 +532,162 @@ function fetchListings() {
             filters.append(key, value);
         }
     }
+    return filters;
+}
+
+// The "6+ Years Ago" option means 6 or more years; the others mean within N years
+function lastOffMarketParam(value) {
+    return value === '6' ? '6+' : value;
+}
 
+function fetchListings() {
+    setListingsLoadingOverlay(true);
+    const requestId = ++listingsRequestId;
+    const filters = currentFilterParams();
     
-    fetch(`/api/listings?${filters.toString()}`)
+    // Markers cover the map viewport; stats and the listing cards cover the whole result
+    fetchMarkers(filters);
+    fetchStats(filters, requestId);
+    window.listingDetailsById = {};
+    fetchListingDetails(filters, null, requestId);
+}
+
+function fetchStats(filters, requestId) {
+    fetch(`/api/statistics?${filters.toString()}`)
+        .then(response => response.json())
+        .then(stats => {
+            if (requestId === listingsRequestId) updateStats(stats);
+        })
+        .catch(error => console.error('Error loading statistics:', error));
+}
+
+// Bounding box parameter (west,south,east,north) for the padded map viewport
+function markerBoundsParam() {
+    if (!window.mapInitialized) {
+        markerBounds = null;
+        return null;
+    }
+    markerBounds = map.getBounds().pad(MARKER_BOUNDS_PADDING);
+    return [markerBounds.getWest(), markerBounds.getSouth(), markerBounds.getEast(), markerBounds.getNorth()]
+        .map(value => value.toFixed(4)).join(',');
+}
+
+// Load clustered markers for the map viewport at the current zoom
+function fetchMarkers(filters) {
+    const bbox = markerBoundsParam();
+    if (!bbox) return;
+    const requestId = ++markersRequestId;
+    markerZoom = map.getZoom();
+    const markerParams = new URLSearchParams(filters);
+    markerParams.set('bbox', bbox);
+    markerParams.set('zoom', markerZoom);
+    fetch(`/api/markers?${markerParams.toString()}`)
         .then(response => response.json())
         .then(data => {
-            setListingsLoadingOverlay(false);
-            window.allListings = data;
+            if (requestId !== markersRequestId) return; // Superseded by a newer request
+            updateMap(data);
+        })
+        .catch(error => {
+            showToast('Error loading map listings. Please try again.', 5000);
+        });
+}
+
+function refreshMarkers() {
+    // Clusters depend on the zoom level; otherwise nothing to do while the view
+    // stays inside the area the markers were loaded for
+    if (!markerBounds || (map.getZoom() === markerZoom && markerBounds.contains(map.getBounds()))) return;
+    fetchMarkers(currentFilterParams());
+}
+
+const debouncedRefreshMarkers = debounce(refreshMarkers, 300);
+
+function updateResetFiltersButton(hasResults, filters) {
+    // If no results and we have restrictive filters, offer to reset them
+    if (!hasResults && filters.toString() !== '') {
+        const resetFiltersBtn = document.createElement('button');
+        resetFiltersBtn.textContent = 'Reset All Filters';
+        resetFiltersBtn.style.cssText = `
+            background: #dc2626; color: white; border: none; padding: 8px 16px; 
+            border-radius: 4px; margin: 10px 0; cursor: pointer; font-size: 14px;
+        `;
+        resetFiltersBtn.onclick = () => {
+            // Clear all saved filters
+            const filterIds = [
+                'area-filter', 'custom-area-input', 'min-price', 'max-price', 'bedrooms-filter', 'laundry-filter', 'pets-filter',
+                'outdoor-filter', 'days-filter', 'offmarket-month-start', 'offmarket-month-end', 'by-owner-filter', 'rent-stabilized-filter', 'last-off-market-filter'
+            ];
+            filterIds.forEach(id => {
+                localStorage.removeItem('filter_' + id);
+                const el = document.getElementById(id);
+                if (el) {
+                    el.value = el.tagName === 'SELECT' ? 'all' : '';
+                }
+            });
             
-            // Apply client-side filters
-            const filteredData = applyClientSideFilters(data);
-            window.clientFilteredListings = filteredData;
+            // Reset month filters to show all months
+            document.getElementById('offmarket-month-start').value = 1;
+            document.getElementById('offmarket-month-end').value = 12;
             
-            // If no results and we have restrictive filters, offer to reset them
-            if (filteredData.length === 0 && (filters.toString() !== '' || document.getElementById('last-off-market-filter')?.value !== 'all')) {
-                const resetFiltersBtn = document.createElement('button');
-                resetFiltersBtn.textContent = 'Reset All Filters';
-                resetFiltersBtn.style.cssText = `
-                    background: #dc2626; color: white; border: none; padding: 8px 16px; 
-                    border-radius: 4px; margin: 10px 0; cursor: pointer; font-size: 14px;
-                `;
-                resetFiltersBtn.onclick = () => {
-                    // Clear all saved filters
-                    const filterIds = [
-                        'area-filter', 'custom-area-input', 'min-price', 'max-price', 'bedrooms-filter', 'laundry-filter', 'pets-filter',
-                        'outdoor-filter', 'days-filter', 'offmarket-month-start', 'offmarket-month-end', 'by-owner-filter', 'rent-stabilized-filter', 'last-off-market-filter'
-                    ];
-                    filterIds.forEach(id => {
-                        localStorage.removeItem('filter_' + id);
-                        const el = document.getElementById(id);
-                        if (el) {
-                            el.value = el.tagName === 'SELECT' ? 'all' : '';
-                        }
-                    });
-                    
-                    // Reset month filters to show all months
-                    document.getElementById('offmarket-month-start').value = 1;
-                    document.getElementById('offmarket-month-end').value = 12;
-                    
-                    // Reset last off market filter to show all
-                    document.getElementById('last-off-market-filter').value = 'all';
-                    
-                    showToast('Filters reset. Refreshing listings...', 2000);
-                    setTimeout(() => fetchListings(), 500);
-                };
-                
-                // Add the button to the listings section
-                const listingsSection = document.querySelector('.listings-section h2');
-                if (listingsSection && !document.getElementById('reset-filters-btn')) {
-                    resetFiltersBtn.id = 'reset-filters-btn';
-                    listingsSection.parentNode.insertBefore(resetFiltersBtn, listingsSection.nextSibling);
-                }
-            } else {
-                // Remove reset button if we have results
-                const resetBtn = document.getElementById('reset-filters-btn');
-                if (resetBtn) resetBtn.remove();
+            // Reset last off market filter to show all
+            document.getElementById('last-off-market-filter').value = 'all';
+            
+            showToast('Filters reset. Refreshing listings...', 2000);
+            setTimeout(() => fetchListings(), 500);
+        };
+        
+        // Add the button to the listings section
+        const listingsSection = document.querySelector('.listings-section h2');
+        if (listingsSection && !document.getElementById('reset-filters-btn')) {
+            resetFiltersBtn.id = 'reset-filters-btn';
+            listingsSection.parentNode.insertBefore(resetFiltersBtn, listingsSection.nextSibling);
+        }
+    } else {
+        // Remove reset button if we have results
+        const resetBtn = document.getElementById('reset-filters-btn');
+        if (resetBtn) resetBtn.remove();
+    }
+}
+
+// Fetch one page of full listings and append it to the listing cards
+function fetchListingDetails(filters, cursor, requestId) {
+    const params = new URLSearchParams(filters);
+    params.set('sort', 'price');
+    params.set('limit', DETAIL_PAGE_SIZE);
+    if (cursor) params.set('cursor', cursor);
+    
+    fetch(`/api/listings?${params.toString()}`)
+        .then(response => {
+            if (response.status === 410) {
+                // Listings were updated while paging; start over on the new data
+                if (requestId === listingsRequestId) fetchListings();
+                return null;
+            }
+            const nextCursor = response.headers.get('X-Next-Cursor');
+            return response.json().then(page => ({ page, nextCursor }));
+        })
+        .then(result => {
+            if (!result || requestId !== listingsRequestId) return;
+            const { page, nextCursor } = result;
+            page.forEach(listing => { window.listingDetailsById[listing.id] = listing; });
+            
+            if (cursor === null) {
+                setListingsLoadingOverlay(false);
+                updateResetFiltersButton(page.length > 0, filters);
             }
+            displayListings(page, cursor !== null);
             
-            displayListings(filteredData);
-            updateStats(filteredData);
-            updateMap();
+            if (nextCursor) {
+                const loadMore = document.createElement('button');
+                loadMore.id = 'load-more-listings';
+                loadMore.className = 'load-more-button';
+                loadMore.textContent = 'Load more listings';
+                loadMore.onclick = () => {
+                    loadMore.disabled = true;
+                    loadMore.textContent = 'Loading...';
+                    fetchListingDetails(filters, nextCursor, requestId);
+                };
+                document.getElementById('listings-container').appendChild(loadMore);
+            }
         })
         .catch(error => {
             setListingsLoadingOverlay(false);
@@ -875,7 +912,8 @@ async function stopScraper() {
     }
 }
 
-// Polls /api/scraper-status every 3 seconds until status is 'idle' or 'error'
+// Follows scraper progress until status is 'idle' or 'error'. Updates are pushed over
+// /api/scraper-events; browsers without EventSource, or a failed stream, poll /api/scraper-status.
 function pollScraperStatus({ onDone, onError, onRunning, onStopped }) {
     const button = document.getElementById('run-scraper-btn');
     const stopButton = document.getElementById('stop-scraper-btn');
@@ -884,66 +922,85 @@ function pollScraperStatus({ onDone, onError, onRunning, onStopped }) {
     const progressText = document.getElementById('progress-text');
     const progressDetail = document.getElementById('progress-detail');
     let polling = true;
+    let events = null;
+
+    // Update the progress display; false once the scraper has finished
+    function handleStatus(data) {
+        const status = data.status;
+        
+        if (status === 'running' || status === 'starting') {
+            // Show progress elements and keep them visible
+            progress.style.display = 'block';
+            
+            // Update progress information
+            if (data.progress_percent !== undefined) {
+                progressBar.style.width = `${data.progress_percent}%`;
+                progressText.textContent = `${Math.round(data.progress_percent)}%`;
+            } else {
+                progressBar.style.width = '0%';
+                progressText.textContent = status === 'starting' ? 'Starting...' : 'Processing...';
+            }
+            
+            // Update progress detail message
+            if (data.display_message) {
+                progressDetail.textContent = data.display_message;
+            } else if (data.message) {
+                progressDetail.textContent = data.message;
+            } else {
+                progressDetail.textContent = status === 'starting' ? 'Initializing scraper...' : 'Running...';
+            }
+            
+            // Update button text
+            button.textContent = status === 'starting' ? 'Starting...' : 'Running...';
+            
+            if (onRunning) onRunning(data);
+            return true;
+        } else if (status === 'completed' || status === 'idle') {
+            polling = false;
+    
+            if (onDone) onDone();
+            resetScraperButtons();
+        } else if (status === 'stopped') {
+            polling = false;
+    
+            if (onStopped) onStopped();
+            resetScraperButtons();
+        } else if (status === 'error') {
+            polling = false;
+            if (onError) onError(data.message || 'Unknown error');
+            resetScraperButtons();
+        } else {
+            // Unknown status, treat as error
+            polling = false;
+            if (onError) onError('Unknown status: ' + status);
+            resetScraperButtons();
+        }
+        return false;
+    }
 
     async function checkStatus() {
         try {
             const resp = await fetch('/api/scraper-status');
             const data = await resp.json();
-            const status = data.status;
-            
-            if (status === 'running' || status === 'starting') {
-                // Show progress elements and keep them visible
-                progress.style.display = 'block';
-                
-                // Update progress information
-                if (data.progress_percent !== undefined) {
-                    progressBar.style.width = `${data.progress_percent}%`;
-                    progressText.textContent = `${Math.round(data.progress_percent)}%`;
-                } else {
-                    progressBar.style.width = '0%';
-                    progressText.textContent = status === 'starting' ? 'Starting...' : 'Processing...';
-                }
-                
-                // Update progress detail message
-                if (data.display_message) {
-                    progressDetail.textContent = data.display_message;
-                } else if (data.message) {
-                    progressDetail.textContent = data.message;
-                } else {
-                    progressDetail.textContent = status === 'starting' ? 'Initializing scraper...' : 'Running...';
-                }
-                
-                // Update button text
-                button.textContent = status === 'starting' ? 'Starting...' : 'Running...';
-                
-                if (onRunning) onRunning(data);
-                if (polling) setTimeout(checkStatus, 2000); // Check more frequently for better responsiveness
-            } else if (status === 'completed' || status === 'idle') {
-                polling = false;
-    
-                if (onDone) onDone();
-                resetScraperButtons();
-            } else if (status === 'stopped') {
-                polling = false;
-    
-                if (onStopped) onStopped();
-                resetScraperButtons();
-            } else if (status === 'error') {
-                polling = false;
-                if (onError) onError(data.message || 'Unknown error');
-                resetScraperButtons();
-            } else {
-                // Unknown status, treat as error
-                polling = false;
-                if (onError) onError('Unknown status: ' + status);
-                resetScraperButtons();
-            }
+            if (handleStatus(data) && polling) setTimeout(checkStatus, 2000);
         } catch (e) {
             polling = false;
             if (onError) onError('Network error: ' + e.message);
             resetScraperButtons();
         }
     }
+
+    function followEvents() {
+        events = new EventSource('/api/scraper-events');
+        events.addEventListener('status', (event) => {
+            if (!handleStatus(JSON.parse(event.data))) events.close();
+        });
+        events.onerror = () => {
+            // Stream dropped or unavailable: fall back to polling
+            events.close();
+            if (polling) checkStatus();
+        };
+    }
     
     function resetScraperButtons() {
         button.disabled = false;
@@ -962,15 +1019,13 @@ function pollScraperStatus({ onDone, onError, onRunning, onStopped }) {
         }, 3000);
     }
     
-    checkStatus();
+    if (window.EventSource) {
+        followEvents();
+    } else {
+        checkStatus();
+    }
 }
 
 function panToListing(listingId) {
-    if (!window.mapInitialized) return;
-    
-    const marker = window.mapMarkersById[listingId];
-    if (marker) {
-        map.setView(marker.getLatLng(), 16, { animate: true });
-        marker.openPopup();
-    }
+    showListingOnMap(window.listingDetailsById[listingId] || { id: listingId }, 16);
 }
\ No newline at end of file
@@ -0,0 +1,552 @@
+import json
+import math
+import os
+import re
+import time
+from datetime import date, datetime
+
+from sqlite_pool import ConnectionPool
+
+DB_FILE = os.environ.get('LISTINGS_DB', 'listings.db')
+
+DAYS_PER_YEAR = 365.25
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS meta (
+    key TEXT PRIMARY KEY,
+    value INTEGER NOT NULL
+);
+INSERT OR IGNORE INTO meta (key, value) VALUES ('generation', 0);
+
+CREATE TABLE IF NOT EXISTS runs (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    area TEXT,
+    started_at TEXT NOT NULL,
+    finished_at TEXT,
+    listing_count INTEGER
+);
+
+CREATE TABLE IF NOT EXISTS buildings (
+    slug TEXT PRIMARY KEY,
+    building_id TEXT,
+    address TEXT,
+    latitude REAL,
+    longitude REAL,
+    source_area TEXT,
+    updated_at TEXT NOT NULL,
+    last_seen_at TEXT,
+    history_hash TEXT
+);
+
+-- Building catalog: which buildings each area had when it was last discovered
+CREATE TABLE IF NOT EXISTS areas (
+    area TEXT PRIMARY KEY,
+    discovered_at TEXT NOT NULL
+);
+
+CREATE TABLE IF NOT EXISTS area_buildings (
+    area TEXT NOT NULL,
+    slug TEXT NOT NULL,
+    position INTEGER NOT NULL,
+    PRIMARY KEY (area, slug)
+);
+
+CREATE TABLE IF NOT EXISTS listings (
+    building_slug TEXT NOT NULL,
+    unit_key TEXT NOT NULL,
+    listing_id TEXT,
+    status TEXT,
+    price REAL,
+    beds TEXT,
+    off_market_at TEXT,
+    area_key TEXT,
+    pet_friendly INTEGER,
+    private_outdoor INTEGER,
+    laundry_type TEXT,
+    is_owner INTEGER,
+    likely_stabilized INTEGER,
+    stabilization_confidence TEXT,
+    latitude REAL,
+    longitude REAL,
+    priority INTEGER NOT NULL,
+    sort_date TEXT NOT NULL,
+    run_id INTEGER NOT NULL,
+    data TEXT NOT NULL,
+    first_seen_at TEXT NOT NULL,
+    last_seen_at TEXT NOT NULL,
+    PRIMARY KEY (building_slug, unit_key)
+);
+CREATE INDEX IF NOT EXISTS idx_listings_status ON listings (status);
+CREATE INDEX IF NOT EXISTS idx_listings_price ON listings (price);
+CREATE INDEX IF NOT EXISTS idx_listings_off_market ON listings (off_market_at);
+CREATE INDEX IF NOT EXISTS idx_listings_area ON listings (area_key);
+
+CREATE TABLE IF NOT EXISTS price_history (
+    listing_id TEXT NOT NULL,
+    price REAL NOT NULL,
+    observed_at TEXT NOT NULL,
+    UNIQUE (listing_id, observed_at, price)
+);
+"""
+
+UPSERT_LISTING = """
+INSERT INTO listings (
+    building_slug, unit_key, listing_id, status, price, beds, off_market_at, area_key,
+    pet_friendly, private_outdoor, laundry_type, is_owner, likely_stabilized,
+    stabilization_confidence, latitude, longitude, priority, sort_date, run_id, data, first_seen_at,
+    last_seen_at
+) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+ON CONFLICT (building_slug, unit_key) DO UPDATE SET
+    listing_id = excluded.listing_id, status = excluded.status, price = excluded.price,
+    beds = excluded.beds, off_market_at = excluded.off_market_at,
+    area_key = excluded.area_key, pet_friendly = excluded.pet_friendly,
+    private_outdoor = excluded.private_outdoor, laundry_type = excluded.laundry_type,
+    is_owner = excluded.is_owner, likely_stabilized = excluded.likely_stabilized,
+    stabilization_confidence = excluded.stabilization_confidence, latitude = excluded.latitude,
+    longitude = excluded.longitude, priority = excluded.priority,
+    sort_date = excluded.sort_date, run_id = excluded.run_id, data = excluded.data,
+    last_seen_at = excluded.last_seen_at
+"""
+
+# A listing replaces the stored row for its unit if it comes from a newer run, or
+# from the same run and ranks higher, i.e. the scraper's own per-unit grouping
+# (see listing_priority and listing_date)
+KEEP_BEST = """
+WHERE excluded.run_id > listings.run_id
+   OR (excluded.run_id = listings.run_id
+       AND (excluded.priority, excluded.sort_date) > (listings.priority, listings.sort_date))
+"""
+
+
+def normalize_unit(unit_str):
+    """Normalize unit numbers for deduplication (e.g., '3A', '3a', '3-A' -> '3A')"""
+    if not unit_str or unit_str is None:
+        return ''
+
+    # Convert to string and strip whitespace, handle None values explicitly
+    try:
+        unit_str = str(unit_str).strip().upper()
+    except (AttributeError, TypeError):
+        return ''
+
+    # Remove common separators and normalize
+    unit_str = re.sub(r'[-_\s]+', '', unit_str)
+
+    return unit_str
+
+
+def normalize_area(area):
+    """Canonical area key: 'West-Village ', 'west village' and 'west-village' all match"""
+    return str(area).lower().strip().replace('-', ' ')
+
+
+def format_building_address(building, slug):
+    """Display address for a GraphQL building: its address fields, else its name, else the slug"""
+    address = building.get('address') or {}
+    parts = [address[f] for f in ('street', 'city', 'state', 'zipCode') if address.get(f)]
+    if parts:
+        return ', '.join(parts)
+    return building.get('name') or slug.replace('-', ' ').title()
+
+
+def last_off_market_days(value):
+    """
+    Inclusive days-since-off-market range for a last_off_market filter:
+    'N' means within the last N years, 'N+' N or more years ago. None if
+    the value isn't one of those.
+    """
+    value = str(value or '')
+    years = value[:-1] if value.endswith('+') else value
+    if not years.isdigit():
+        return None
+    days = int(years) * DAYS_PER_YEAR
+    return (math.ceil(days), math.inf) if value.endswith('+') else (-math.inf, math.floor(days))
+
+
+def listing_priority(listing):
+    """Priority score for picking one listing per unit (higher = better)"""
+    status = listing.get('status', '') or ''
+    try:
+        status = status.upper()
+    except (AttributeError, TypeError):
+        status = ''
+
+    # Active listings get highest priority
+    if status in ['AVAILABLE', 'ON_MARKET']:
+        return 1000
+    # Recently off market gets medium priority
+    elif status in ['OFF_MARKET', 'RENTED', 'NO_LONGER_AVAILABLE']:
+        return 500
+    # Any other status gets low priority
+    else:
+        return 100
+
+
+def listing_date(listing):
+    """Most relevant date for comparing listings of the same unit (onMarketAt > availableAt > offMarketAt)"""
+    date_str = (listing.get('onMarketAt') or
+               listing.get('availableAt') or
+               listing.get('offMarketAt') or '1900-01-01')
+
+    try:
+        return datetime.strptime(date_str, '%Y-%m-%d') if date_str != '1900-01-01' else datetime(1900, 1, 1)
+    except:
+        return datetime(1900, 1, 1)
+
+
+def _iso_date(value):
+    """Zero-padded YYYY-MM-DD form of a date string, or None if it isn't a valid date"""
+    try:
+        return datetime.strptime(value, '%Y-%m-%d').date().isoformat()
+    except (TypeError, ValueError):
+        return None
+
+
+def _flag(value):
+    """SQLite value for a boolean field, keeping None distinct from False"""
+    if value == True:  # noqa: E712
+        return 1
+    if value == False:  # noqa: E712
+        return 0
+    return None
+
+
+def _number(value):
+    try:
+        return float(value)
+    except (TypeError, ValueError):
+        return None
+
+
+class ListingStore:
+    """
+    SQLite store for scraped buildings, listings and price history.
+
+    The scraper upserts into it as it goes and the server reads from it. The
+    database runs in WAL mode so reads don't block on the scraper's writes;
+    connections come from a per-process pool. Listings are keyed by
+    (building_slug, normalized unit), one row per unit.
+    """
+
+    def __init__(self, path=DB_FILE):
+        self.path = path
+        self._pool = ConnectionPool(path, setup=self._setup, pragmas=('synchronous=NORMAL',))
+
+    @staticmethod
+    def exists(path=DB_FILE):
+        return os.path.exists(path)
+
+    def _setup(self, conn):
+        """Once per process: WAL mode (persistent in the file) and the schema"""
+        conn.execute('PRAGMA journal_mode=WAL')
+        conn.executescript(SCHEMA)
+        self._migrate(conn)
+
+    def _migrate(self, conn):
+        """Bring databases created by older versions up to SCHEMA"""
+        columns = {row[1] for row in conn.execute('PRAGMA table_info(listings)')}
+        with conn:
+            for column in ('latitude', 'longitude'):
+                if column not in columns:
+                    conn.execute(f'ALTER TABLE listings ADD COLUMN {column} REAL')
+                    conn.execute(f"UPDATE listings SET {column} = CAST(json_extract(data, '$.{column}') AS REAL)")
+            conn.execute('CREATE INDEX IF NOT EXISTS idx_listings_location ON listings (latitude, longitude)')
+            building_columns = {row[1] for row in conn.execute('PRAGMA table_info(buildings)')}
+            for column in ('last_seen_at', 'history_hash'):
+                if column not in building_columns:
+                    conn.execute(f'ALTER TABLE buildings ADD COLUMN {column} TEXT')
+
+    def _bump_generation(self, conn):
+        conn.execute("UPDATE meta SET value = value + 1 WHERE key = 'generation'")
+        conn.execute("INSERT OR REPLACE INTO meta (key, value) VALUES ('updated_at', ?)", (time.time_ns(),))
+
+    def _version(self, conn):
+        row = conn.execute("SELECT value FROM meta WHERE key = 'generation'").fetchone()
+        return f"db-{row[0]}"
+
+    def version(self):
+        """Data version; changes whenever a write transaction commits"""
+        with self._pool.connection() as conn:
+            return self._version(conn)
+
+    def updated_at(self):
+        """When the listings last changed, in ns since the epoch (0 if not recorded)"""
+        with self._pool.connection() as conn:
+            row = conn.execute("SELECT value FROM meta WHERE key = 'updated_at'").fetchone()
+        return row[0] if row else 0
+
+    # Writes (scraper)
+
+    def begin_run(self, area):
+        """Register a scraper run; its listings win over those of earlier runs"""
+        with self._pool.connection() as conn, conn:
+            cursor = conn.execute('INSERT INTO runs (area, started_at) VALUES (?, ?)',
+                                  (area, datetime.now().isoformat()))
+        return cursor.lastrowid
+
+    def finish_run(self, run_id, listings):
+        """
+        Close a run with its final listing set, which replaces its area's
+        contents: units that this run or an earlier run of the same area
+        wrote and that didn't make it into the final set (e.g. delisted, or
+        excluded by this run's filters) are removed. Other areas' listings
+        are kept.
+        """
+        keep = {(l.get('building_slug', ''), normalize_unit(l.get('displayUnit', ''))) for l in listings}
+        with self._pool.connection() as conn, conn:
+            (area,) = conn.execute('SELECT area FROM runs WHERE id = ?', (run_id,)).fetchone()
+            runs = [run_id]
+            if area is not None:
+                runs += [other for other, other_area in conn.execute('SELECT id, area FROM runs WHERE id != ?', (run_id,))
+                         if other_area is not None and normalize_area(other_area) == normalize_area(area)]
+            placeholders = ', '.join('?' * len(runs))
+            stale = [key for key in conn.execute(
+                f'SELECT building_slug, unit_key FROM listings WHERE run_id IN ({placeholders})', runs)
+                if key not in keep]
+            conn.executemany('DELETE FROM listings WHERE building_slug = ? AND unit_key = ?', stale)
+            conn.execute('UPDATE runs SET finished_at = ?, listing_count = ? WHERE id = ?',
+                         (datetime.now().isoformat(), len(listings), run_id))
+            self._bump_generation(conn)
+
+    def upsert_buildings(self, building_info, area=None):
+        """Store building metadata from RentalCollector.building_info"""
+        now = datetime.now().isoformat()
+        rows = []
+        for slug, info in list(building_info.items()):
+            geo = info.get('geoCenter') or {}
+            rows.append((slug, info.get('building_id'), info.get('address'),
+                         geo.get('latitude'), geo.get('longitude'), area, now,
+                         info.get('last_seen_at'), info.get('history_hash')))
+        with self._pool.connection() as conn, conn:
+            conn.executemany("""
+                INSERT INTO buildings (slug, building_id, address, latitude, longitude, source_area, updated_at,
+                                       last_seen_at, history_hash)
+                VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)
+                ON CONFLICT (slug) DO UPDATE SET
+                    building_id = COALESCE(excluded.building_id, buildings.building_id),
+                    address = COALESCE(excluded.address, buildings.address),
+                    latitude = COALESCE(excluded.latitude, buildings.latitude),
+                    longitude = COALESCE(excluded.longitude, buildings.longitude),
+                    source_area = COALESCE(excluded.source_area, buildings.source_area),
+                    updated_at = excluded.updated_at,
+                    last_seen_at = COALESCE(excluded.last_seen_at, buildings.last_seen_at),
+                    history_hash = COALESCE(excluded.history_hash, buildings.history_hash)
+            """, rows)
+
+    def save_area_buildings(self, area, slugs, building_info):
+        """
+        Record a completed discovery of an area: its buildings (in discovery
+        order, with their metadata from building_info) replace the area's
+        previous catalog entry.
+        """
+        area_key = normalize_area(area)
+        self.upsert_buildings({slug: building_info.get(slug) or {} for slug in slugs}, area)
+        with self._pool.connection() as conn, conn:
+            conn.execute('DELETE FROM area_buildings WHERE area = ?', (area_key,))
+            conn.executemany('INSERT OR IGNORE INTO area_buildings (area, slug, position) VALUES (?, ?, ?)',
+                             [(area_key, slug, position) for position, slug in enumerate(slugs)])
+            conn.execute('INSERT OR REPLACE INTO areas (area, discovered_at) VALUES (?, ?)',
+                         (area_key, datetime.now().isoformat()))
+
+    def area_buildings(self, area, max_age):
+        """
+        {slug: building info} for an area discovered within the last max_age
+        seconds, in discovery order, or None if it has no catalog that fresh
+        """
+        area_key = normalize_area(area)
+        with self._pool.connection() as conn:
+            row = conn.execute('SELECT discovered_at FROM areas WHERE area = ?', (area_key,)).fetchone()
+            if row is None or (datetime.now() - datetime.fromisoformat(row[0])).total_seconds() > max_age:
+                return None
+            rows = conn.execute("""
+                SELECT b.slug, b.building_id, b.address, b.latitude, b.longitude, b.last_seen_at, b.history_hash
+                FROM area_buildings a JOIN buildings b ON b.slug = a.slug
+                WHERE a.area = ? ORDER BY a.position
+                """, (area_key,)).fetchall()
+        catalog = {}
+        for slug, building_id, address, latitude, longitude, last_seen_at, history_hash in rows:
+            info = {'href': f"https://streeteasy.com/building/{slug}", 'address': address}
+            if building_id:
+                info['building_id'] = building_id
+            if latitude is not None and longitude is not None:
+                info['geoCenter'] = {'latitude': latitude, 'longitude': longitude}
+            if last_seen_at:
+                info['last_seen_at'] = last_seen_at
+            if history_hash:
+                info['history_hash'] = history_hash
+            catalog[slug] = info
+        return catalog
+
+    def upsert_listings(self, listings, run_id, replace=False):
+        """
+        Insert or update listings (one row per unit) and record their prices.
+
+        With replace=True the listings overwrite the stored rows
+        unconditionally, e.g. for a run's final, already grouped results.
+        """
+        now = datetime.now().isoformat()
+        today = date.today().isoformat()
+        rows = []
+        prices = []
+        for listing in listings:
+            rows.append((
+                listing.get('building_slug', ''),
+                normalize_unit(listing.get('displayUnit', '')),
+                str(listing['id']) if listing.get('id') is not None else None,
+                listing.get('status'),
+                _number(listing.get('price', 0)),
+                str(listing.get('bedroomCount', 0)),
+                _iso_date(listing.get('offMarketAt')),
+                normalize_area(listing.get('source_area') or ''),
+                _flag(listing.get('petFriendly', False)),
+                _flag(listing.get('privateOutdoorSpace', False)),
+                'In building' if listing.get('laundryInBuilding', False) else 'None',
+                1 if listing.get('is_owner', False) else 0,
+                1 if listing.get('likely_stabilized', False) else 0,
+                str(listing.get('stabilization_confidence') or '').lower(),
+                _number(listing.get('latitude')),
+                _number(listing.get('longitude')),
+                listing_priority(listing),
+                listing_date(listing).strftime('%Y-%m-%d'),
+                run_id,
+                json.dumps(listing, ensure_ascii=False),
+                now,
+                now,
+            ))
+            if listing.get('id') is None:
+                continue
+            if _number(listing.get('price')) is not None:
+                prices.append((str(listing['id']), _number(listing['price']), today))
+            for entry in listing.get('priceHistory') or []:
+                if isinstance(entry, dict) and _number(entry.get('price')) is not None and entry.get('timestamp'):
+                    prices.append((str(listing['id']), _number(entry['price']), str(entry['timestamp'])[:10]))
+        with self._pool.connection() as conn, conn:
+            conn.executemany(UPSERT_LISTING if replace else UPSERT_LISTING + KEEP_BEST, rows)
+            conn.executemany('INSERT OR IGNORE INTO price_history (listing_id, price, observed_at) VALUES (?, ?, ?)',
+                             prices)
+            self._bump_generation(conn)
+
+    # Reads (server)
+
+    def iter_listings(self):
+        """Current listings, one per unit, in insertion order"""
+        with self._pool.connection() as conn:
+            for (data,) in conn.execute('SELECT data FROM listings ORDER BY rowid'):
+                yield json.loads(data)
+
+    def price_history(self, listing_id):
+        with self._pool.connection() as conn:
+            rows = conn.execute(
+                'SELECT price, observed_at FROM price_history WHERE listing_id = ? ORDER BY observed_at',
+                (str(listing_id),)).fetchall()
+        return [{'price': price, 'date': observed_at} for price, observed_at in rows]
+
+    def query_listings(self, filters, sort=None, offset=0, limit=None, today=None):
+        """
+        Run a /api/listings query in SQL, pushing every filter down to the
+        indexed columns. Matches ListingIndex.select() row for row.
+
+        Returns (data version, total matches, raw listings for the requested
+        page), all read from the same database snapshot.
+        """
+        where, params = ['1'], []
+
+        area = filters.get('area')
+        if area and area != 'all':
+            where.append("area_key = ? AND area_key != ''")
+            params.append(normalize_area(area))
+
+        bedrooms = filters.get('bedrooms', 'all')
+        if bedrooms == '3+':
+            where.append("beds GLOB '[0-9]*' AND beds NOT GLOB '*[^0-9]*' AND CAST(beds AS INTEGER) >= 3")
+        elif bedrooms == 'Studio':
+            where.append("beds IN ('0', 'Studio')")
+        elif bedrooms != 'all':
+            where.append('beds = ?')
+            params.append(bedrooms)
+
+        if filters.get('min_price') is not None:
+            where.append('price >= ?')
+            params.append(filters['min_price'])
+        if filters.get('max_price') is not None:
+            where.append('price <= ?')
+            params.append(filters['max_price'])
+
+        laundry = filters.get('laundry', 'all')
+        if laundry != 'all':
+            where.append('laundry_type = ?')
+            params.append(laundry)
+        for field, column in (('pets', 'pet_friendly'), ('outdoor', 'private_outdoor')):
+            value = filters.get(field, 'all')
+            if value != 'all':
+                where.append(f"{column} = {1 if value.lower() == 'true' else 0}")
+        if filters.get('by_owner') in ('true', 'false'):
+            where.append(f"is_owner = {1 if filters['by_owner'] == 'true' else 0}")
+
+        rent_stabilized = filters.get('rent_stabilized')
+        if rent_stabilized == 'likely':
+            where.append('likely_stabilized = 1')
+        elif rent_stabilized == 'unlikely':
+            where.append('likely_stabilized = 0')
+        elif rent_stabilized in ('high', 'medium', 'low'):
+            where.append('likely_stabilized = 1 AND stabilization_confidence = ?')
+            params.append(rent_stabilized)
+
+        # days_on_market counts from offMarketAt; listings without a date count as 0 days
+        today = today or date.today()
+        days_filter = filters.get('days_filter')
+        if days_filter == '0-7':
+            where.append('(off_market_at > ? OR off_market_at IS NULL)')
+            params.append(date.fromordinal(today.toordinal() - 7).isoformat())
+        elif days_filter == '7-30':
+            where.append('off_market_at BETWEEN ? AND ?')
+            params.extend([date.fromordinal(today.toordinal() - 30).isoformat(),
+                           date.fromordinal(today.toordinal() - 7).isoformat()])
+        elif days_filter == '30+':
+            where.append('off_market_at < ?')
+            params.append(date.fromordinal(today.toordinal() - 30).isoformat())
+
+        years_range = last_off_market_days(filters.get('last_off_market'))
+        if years_range:
+            min_age, max_age = years_range
+            where.append('off_market_at IS NOT NULL')
+            if max_age != math.inf:
+                where.append('off_market_at >= ?')
+                params.append(date.fromordinal(today.toordinal() - int(max_age)).isoformat())
+            if min_age != -math.inf:
+                where.append('off_market_at <= ?')
+                params.append(date.fromordinal(today.toordinal() - int(min_age)).isoformat())
+
+        month_start = filters.get('offmarket_month_start')
+        month_end = filters.get('offmarket_month_end')
+        if month_start and month_end:
+            month = "CAST(substr(off_market_at, 6, 2) AS INTEGER)"
+            op = 'AND' if month_start <= month_end else 'OR'
+            where.append(f"off_market_at IS NOT NULL AND ({month} >= ? {op} {month} <= ?)")
+            params.extend([month_start, month_end])
+
+        bbox = filters.get('bbox')
+        if bbox:
+            south, west, north, east = bbox
+            where.append('latitude BETWEEN ? AND ? AND longitude BETWEEN ? AND ?')
+            params.extend([south, north, west, east])
+
+        order = {
+            'price': 'price IS NULL, price, rowid',
+            '-price': 'price IS NOT NULL, price DESC, rowid DESC',
+            'days_on_market': 'off_market_at IS NULL, off_market_at DESC, rowid',
+            '-days_on_market': 'off_market_at IS NOT NULL, off_market_at, rowid DESC',
+        }.get(sort, 'rowid')
+
+        clause = ' AND '.join(where)
+        page = f' LIMIT {int(limit)} OFFSET {int(offset)}' if limit is not None else ''
+        with self._pool.connection() as conn:
+            conn.execute('BEGIN')
+            try:
+                version = self._version(conn)
+                total = conn.execute(f'SELECT COUNT(*) FROM listings WHERE {clause}', params).fetchone()[0]
+                rows = conn.execute(f'SELECT data FROM listings WHERE {clause} ORDER BY {order}{page}',
+                                    params).fetchall()
+            finally:
+                conn.execute('COMMIT')
+        return version, total, [json.loads(data) for (data,) in rows]
@@ -0,0 +1,113 @@
+import pytest
+
+from geocoder import normalize_address
+from storage import format_building_address
+
+
+def building(street, city, zip_code, state='NY'):
+    return {'address': {'street': street, 'city': city, 'state': state, 'zipCode': zip_code}}
+
+
+@pytest.mark.parametrize('scraped, query', [
+    (building('123 Main St', 'New York', '10014'), '123 Main St'),
+    (building('123 Main St.', 'New York', '10014'), '123 main st, new york, ny 10014'),
+    (building('45 Court St', 'Brooklyn', '11201'), '45 Court St, Brooklyn, NY'),
+    (building('27-10 Jackson Ave', 'Long Island City', '11101'), '27-10 Jackson Ave, Queens'),
+    (building('1 Bay St', 'Staten Island', '10301'), '1 Bay St, Staten Island, NY 10301'),
+    (building('900 Grand Concourse', 'Bronx', '10451'), '900 Grand Concourse, The Bronx'),
+])
+def test_scraped_addresses_match_queries(scraped, query):
+    assert normalize_address(format_building_address(scraped, 'slug')) == normalize_address(query)
+
+
+def test_manhattan_addresses_match_plain_streets():
+    assert normalize_address(format_building_address(building('123 Main St', 'New York', '10014'), 's')) == '123 main st'
+    assert normalize_address('123 Main St, Manhattan') == '123 main st'
+
+
+def test_same_street_in_different_boroughs_has_different_keys():
+    keys = {normalize_address(address) for address in (
+        '100 Broadway, Brooklyn, NY 11249', '100 Broadway, New York, NY 10005', '100 Broadway, Astoria')}
+    assert keys == {'100 broadway, brooklyn', '100 broadway', '100 broadway, queens'}
+    assert normalize_address('100 Broadway, Brooklyn, New York') == '100 broadway, brooklyn'
+
+
+def test_city_is_only_stripped_after_a_comma():
+    assert normalize_address('10 Brooklyn Ave, Brooklyn, NY, 11213') == '10 brooklyn ave, brooklyn'
+    assert normalize_address('250 Queens Blvd') == '250 queens blvd'
+
+
+def test_partial_building_addresses():
+    assert normalize_address(format_building_address(building('5 Elm St', None, None, state=None), 's')) == '5 elm st'
+    assert normalize_address(format_building_address(building('5 Elm St', None, '10012'), 's')) == '5 elm st'
+
+
+def test_cache_hits_do_not_write_until_flushed(tmp_path):
+    import sqlite3
+
+    from geocoder import GeocodeCache
+
+    cache = GeocodeCache(str(tmp_path / 'geocode.db'), max_entries=2)
+    cache.put('a', [1])
+    cache.put('b', [2])
+    accessed = lambda: dict(sqlite3.connect(cache.path).execute('SELECT address, accessed_at FROM geocodes'))
+    before = accessed()
+    assert cache.get('a') == [1]
+    assert accessed() == before
+
+    # Eviction sees the pending access time: 'a' was used after 'b', so 'b' goes
+    cache.put('c', [3])
+    assert cache.get('a') == [1] and cache.get('b') is None and cache.get('c') == [3]
+
+
+def test_concurrent_lookups_of_one_address_share_a_backend_call(tmp_path):
+    import threading
+
+    from geocoder import GeocodeCache, Geocoder
+
+    calls = []
+    release = threading.Event()
+
+    class Backend:
+        def search(self, address):
+            calls.append(address)
+            release.wait(5)
+            return [{'lat': '1', 'lon': '2'}]
+
+    geocoder = Geocoder(Backend(), GeocodeCache(str(tmp_path / 'geocode.db')))
+    results = []
+    threads = [threading.Thread(target=lambda: results.append(geocoder.lookup('1 Main St'))) for _ in range(4)]
+    for thread in threads:
+        thread.start()
+    while not calls:
+        pass
+    release.set()
+    for thread in threads:
+        thread.join()
+    assert len(calls) == 1 and results == [[{'lat': '1', 'lon': '2'}]] * 4
+
+
+def test_same_street_in_another_borough_is_not_answered_from_the_cache(tmp_path):
+    from geocoder import GeocodeCache, Geocoder
+
+    class Backend:
+        def search(self, address):
+            return [{'display_name': address}]
+
+    geocoder = Geocoder(Backend(), GeocodeCache(str(tmp_path / 'geocode.db')))
+    assert geocoder.lookup('100 Broadway, New York, NY 10005') == [{'display_name': '100 Broadway, New York, NY 10005'}]
+    assert geocoder.lookup('100 Broadway, Brooklyn') == [{'display_name': '100 Broadway, Brooklyn'}]
+
+
+def test_results_cached_under_old_keys_are_dropped(tmp_path):
+    import sqlite3
+
+    from geocoder import SCHEMA, GeocodeCache
+
+    path = str(tmp_path / 'geocode.db')
+    conn = sqlite3.connect(path)
+    conn.executescript(SCHEMA)
+    conn.execute("INSERT INTO geocodes VALUES ('100 broadway', '[1]', 1e12, 1e12)")
+    conn.commit()
+    conn.close()
+    assert GeocodeCache(path).get('100 broadway') is None
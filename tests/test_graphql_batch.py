@@ -0,0 +1,152 @@
+import threading
+
+import pytest
+
+from graphql_batch import ResolveError, SlugResolver
+
+
+class FakeAPI:
+    """A post() that answers aliased buildingBySlug batches from a dict of slugs"""
+
+    def __init__(self, buildings, errors=None):
+        self.buildings = buildings
+        # Slugs the API reports an error for: slug -> whether it still returns its data
+        self.errors = errors or {}
+        self.batches = []
+        self.lock = threading.Lock()
+
+    def __call__(self, query):
+        slugs = [query['variables'][f'k{i}'] for i in range(len(query['variables']))]
+        with self.lock:
+            self.batches.append(slugs)
+        data, errors = {}, []
+        for i, slug in enumerate(slugs):
+            if slug in self.errors:
+                errors.append({'message': 'boom', 'path': [f'b{i}', 'address']})
+                data[f'b{i}'] = self.buildings.get(slug) if self.errors[slug] else None
+            else:
+                data[f'b{i}'] = self.buildings.get(slug)
+        return {'data': data, 'errors': errors}
+
+
+def test_alias_with_data_is_kept_despite_an_error_under_it():
+    api = FakeAPI({'a': {'id': 1}, 'b': {'id': 2}}, errors={'a': True})
+    resolver = SlugResolver(api, loaders=1)
+    resolver.prefetch(['a', 'b'])
+    assert resolver.resolve('a') == {'id': 1}
+    assert resolver.resolve('b') == {'id': 2}
+    assert len(api.batches) == 1
+
+
+def test_null_alias_with_an_error_fails_and_unknown_keys_are_none():
+    api = FakeAPI({'a': {'id': 1}, 'b': {'id': 2}}, errors={'b': False})
+    resolver = SlugResolver(api, loaders=1)
+    resolver.prefetch(['a', 'b', 'missing'])
+    assert resolver.resolve('a') == {'id': 1}
+    assert resolver.resolve('missing') is None
+    with pytest.raises(ResolveError):
+        resolver.resolve('b')
+    assert len(api.batches) == 1
+
+
+def test_nothing_is_sent_once_stopped():
+    api = FakeAPI({'a': {'id': 1}})
+    resolver = SlugResolver(api, stopped=lambda: True)
+    with pytest.raises(ResolveError):
+        resolver.resolve('a')
+    assert api.batches == []
+
+
+def test_cancel_fails_queued_keys():
+    sending, release = threading.Event(), threading.Event()
+
+    def post(query):
+        sending.set()
+        release.wait()
+        return {'data': {f'b{i}': {'id': i} for i in range(len(query['variables']))}}
+
+    resolver = SlugResolver(post, loaders=1, batch_size=1)
+    resolver.prefetch(['a', 'b'])
+    sending.wait()
+    resolver.cancel()
+    release.set()
+    assert resolver.resolve('a') == {'id': 0}
+    with pytest.raises(ResolveError):
+        resolver.resolve('b')
+
+
+def test_batches_grow_after_successes():
+    api = FakeAPI({str(i): {'id': i} for i in range(30)})
+    resolver = SlugResolver(api, loaders=1, batch_size=4, growth=2, max_batch_size=8)
+    for slug in map(str, range(30)):
+        resolver.prefetch([slug])
+        assert resolver.resolve(slug) == {'id': int(slug)}
+    assert resolver.batch_size == 8
+
+
+def test_failed_requests_are_split_and_the_batch_size_shrinks():
+    sizes = []
+
+    def post(query):
+        slugs = list(query['variables'].values())
+        sizes.append(len(slugs))
+        if 'bad' in slugs:
+            raise IOError('HTTP 500')
+        return {'data': {f'b{i}': {'slug': slug} for i, slug in enumerate(slugs)}}
+
+    resolver = SlugResolver(post, loaders=1, batch_size=8, growth=0)
+    slugs = ['a', 'b', 'c', 'bad', 'd', 'e', 'f', 'g']
+    resolver.prefetch(slugs)
+    for slug in slugs:
+        if slug == 'bad':
+            # A key that fails on its own is left to the caller's single lookup
+            with pytest.raises(ResolveError):
+                resolver.resolve(slug)
+        else:
+            assert resolver.resolve(slug) == {'slug': slug}
+    assert sizes == [8, 4, 2, 2, 1, 1, 4]
+    assert resolver.batch_size == 1
+
+
+def type_ref(*signature):
+    """Introspected type reference for e.g. ('NON_NULL', 'LIST', 'OBJECT', 'Rental')"""
+    ref = {'kind': signature[-2], 'name': signature[-1], 'ofType': None}
+    for kind in reversed(signature[:-2]):
+        ref = {'kind': kind, 'name': None, 'ofType': ref}
+    return ref
+
+
+QUERY_TYPE = {'fields': [
+    {'name': 'buildingBySlug', 'type': type_ref('OBJECT', 'Building'), 'args': []},
+    {'name': 'rentalsHistoryByBuildingId', 'type': type_ref('NON_NULL', 'LIST', 'OBJECT', 'Rental'), 'args': []},
+]}
+
+
+def test_nested_history_field_must_match_the_history_type():
+    from graphql_batch import building_type_name, nested_history_field
+
+    assert building_type_name(QUERY_TYPE) == 'Building'
+    building = {'fields': [
+        {'name': 'id', 'type': type_ref('NON_NULL', 'SCALAR', 'ID'), 'args': []},
+        {'name': 'rentals', 'type': type_ref('LIST', 'OBJECT', 'Rental'), 'args': []},
+        {'name': 'pastRentals', 'type': type_ref('NON_NULL', 'LIST', 'OBJECT', 'Rental'),
+         'args': [{'name': 'since', 'type': type_ref('NON_NULL', 'SCALAR', 'Date')}]},
+    ]}
+    assert nested_history_field(QUERY_TYPE, building) is None
+    building['fields'].append({'name': 'rentalHistory', 'type': type_ref('NON_NULL', 'LIST', 'OBJECT', 'Rental'),
+                               'args': [{'name': 'first', 'type': type_ref('SCALAR', 'Int')}]})
+    assert nested_history_field(QUERY_TYPE, building) == 'rentalHistory'
+    assert nested_history_field({'fields': QUERY_TYPE['fields'][:1]}, building) is None
+
+
+def test_nested_histories_come_with_the_slug_lookup():
+    queries = []
+
+    def post(query):
+        queries.append(query['query'])
+        return {'data': {'b0': {'id': 1, 'rentalHistory': [{'id': 'r1'}]}}}
+
+    resolver = SlugResolver(post, history_field='rentalHistory')
+    assert resolver.resolve('a') == {'id': 1, 'rentalHistory': [{'id': 'r1'}]}
+    assert 'rentalHistory {' in queries[0] and 'legacy { id }' in queries[0]
+    assert resolver.batch_size <= 40
@@ -0,0 +1,107 @@
+import json
+import random
+from datetime import date
+
+import server
+from listing_changes import SnapshotDiff, changes_between
+from listing_view import LISTING_FIELDS, ListingView
+from snapshot import SnapshotManager
+from storage import ListingStore
+
+TODAY = date(2024, 6, 15)
+
+
+def listing(unit, price=3000, status='AVAILABLE', offMarketAt='2024-06-01'):
+    return {'building_slug': 'a', 'displayUnit': unit, 'id': f'{unit}-{price}', 'status': status,
+            'price': price, 'offMarketAt': offMarketAt}
+
+
+def apply(listings, changes):
+    """Update a client's listings, keyed by building_slug and unit, with a rendered diff"""
+    listings = {(l['building_slug'], l['unit']): l for l in listings}
+    for removed in changes['removed']:
+        del listings[(removed['building_slug'], removed['unit'])]
+    for changed in changes['changed']:
+        listings[(changed['building_slug'], changed['unit'])].update(changed['fields'])
+    for added in changes['added']:
+        listings[(added['building_slug'], added['unit'])] = {f: added[f] for f in LISTING_FIELDS}
+    return {key: {f: l[f] for f in LISTING_FIELDS} for key, l in listings.items()}
+
+
+def state(view):
+    return {(l['building_slug'], l['unit']): l for l in view.listings(TODAY)}
+
+
+def test_added_changed_and_removed():
+    old = ListingView([listing('1'), listing('2'), listing('3')])
+    new = ListingView([listing('1'), listing('2', price=3100, offMarketAt='2024-06-10'), listing('4'),
+                       listing('3', status='RENTED')])
+    changes = SnapshotDiff.between(old, new).render(TODAY)
+    assert [l['unit'] for l in changes['added']] == ['4']
+    assert changes['removed'] == []
+    assert {c['unit']: c['fields'] for c in changes['changed']} == {
+        '2': {'id': '2-3100', 'price': 3100, 'offMarketAt': '2024-06-10', 'days_on_market': 5,
+              'url': 'https://streeteasy.com/rental/2-3100'},
+        '3': {'status': 'RENTED'},
+    }
+    changes = SnapshotDiff.between(new, ListingView([listing('2', price=3100, offMarketAt='2024-06-10')])).render()
+    assert sorted(r['unit'] for r in changes['removed']) == ['1', '3', '4']
+
+
+def test_units_that_normalize_alike_are_the_same_unit():
+    old = ListingView([listing('3a')])
+    changes = SnapshotDiff.between(old, ListingView([listing('3-A', price=3200)])).render(TODAY)
+    assert changes['added'] == changes['removed'] == []
+    assert changes['changed'][0]['unit'] == '3a'
+
+
+def test_combined_diffs_bring_a_client_up_to_date():
+    rng = random.Random(3)
+    views = [ListingView([listing(str(u), price=rng.choice([3000, 3100, 3200]))
+                          for u in range(30) if rng.random() < 0.7]) for _ in range(6)]
+    history = {f'v{i}': (f'v{i - 1}', SnapshotDiff.between(views[i - 1], views[i])) for i in range(1, len(views))}
+    for since in range(len(views)):
+        combined = changes_between(history, f'v{since}', f'v{len(views) - 1}')
+        assert apply(state(views[since]).values(), combined.render(TODAY)) == state(views[-1])
+
+
+def test_units_removed_and_back_stay_known_to_clients():
+    present, gone = ListingView([listing('1')]), ListingView([])
+    back = SnapshotDiff.between(present, gone).then(SnapshotDiff.between(gone, present))
+    assert back.render(TODAY)['changed'][0]['fields']['price'] == 3000
+    removed = back.then(SnapshotDiff.between(present, gone)).render(TODAY)
+    assert [r['unit'] for r in removed['removed']] == ['1']
+
+
+def test_history_must_reach_back_to_the_version():
+    diff = SnapshotDiff({})
+    history = {'v2': ('v1', diff), 'v3': ('v2', diff)}
+    assert len(changes_between(history, 'v3', 'v3')) == 0
+    assert changes_between(history, 'v0', 'v3') is None
+    assert changes_between(history, 'unknown', 'v3') is None
+    assert changes_between({'a': ('b', diff), 'b': ('a', diff)}, 'c', 'a') is None
+
+
+def test_changes_endpoint(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+
+    def write_file(listings):
+        with open('rentals_latest.json', 'w') as f:
+            json.dump({'metadata': {}, 'listings': listings}, f)
+
+    write_file([listing('1'), listing('2')])
+    manager = SnapshotManager(ListingStore(str(tmp_path / 'listings.db')), source='file')
+    monkeypatch.setattr(server, 'snapshots', manager)
+    client = server.app.test_client()
+    since = client.get('/api/listings').headers['X-Data-Version']
+    write_file([listing('1'), listing('3'), listing('2', price=3300)])
+    server.snapshots.refresh()
+
+    changes = client.get('/api/listings/changes', query_string={'since': since}).get_json()
+    assert changes['since'] == since and changes['version'] != since
+    assert [l['unit'] for l in changes['added']] == ['3']
+    assert [c['fields']['price'] for c in changes['changed']] == [3300]
+    assert client.get('/api/listings/changes', query_string={'since': changes['version']}).get_json()['added'] == []
+    response = client.get('/api/listings/changes?since=unknown')
+    assert response.status_code == 410 and response.get_json()['version'] == changes['version']
+    assert client.get('/api/listings/changes').status_code == 400
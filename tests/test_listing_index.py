@@ -0,0 +1,174 @@
+import random
+from datetime import date, datetime
+
+import numpy as np
+import pytest
+
+from listing_index import BitmapIndex, GridIndex, ListingIndex, SortedIndex
+from listing_view import ListingView
+
+TODAY = date(2024, 6, 15)
+
+
+def random_listings(count, seed=0):
+    rng = random.Random(seed)
+    areas = ['west village', 'West-Village', 'soho', 'east village ', 'upper-east-side', '']
+    return [{
+        'building_slug': f'b{rng.randrange(count // 3)}', 'displayUnit': str(rng.randrange(6)), 'id': str(i),
+        'status': rng.choice(['AVAILABLE', 'RENTED', 'DELISTED']),
+        'price': rng.randrange(1500, 9000, 50), 'bedroomCount': rng.choice([0, 1, 2, 3, 4, 'Studio']),
+        'offMarketAt': date.fromordinal(TODAY.toordinal() - rng.randrange(400)).isoformat(),
+        'source_area': rng.choice(areas), 'is_owner': rng.random() < 0.2,
+        'laundryInBuilding': rng.random() < 0.5, 'petFriendly': rng.choice([True, False, None]),
+        'privateOutdoorSpace': rng.choice([True, False]), 'likely_stabilized': rng.random() < 0.3,
+        'stabilization_confidence': rng.choice(['High', 'medium', 'low', '']),
+        'latitude': 40.70 + rng.random() / 10, 'longitude': -74.02 + rng.random() / 10,
+    } for i in range(count)]
+
+
+def reference_filters(listings, filters):
+    """The filtering /api/listings did before the index, one pass per filter over the listing dicts"""
+    filtered = listings
+    if filters['area'] != 'all' and filters['area']:
+        area = filters['area'].lower().strip()
+        filtered = [l for l in filtered if l['source_area'] and (
+            area == l['source_area'].lower().strip()
+            or area.replace(' ', '-') == l['source_area'].lower().strip().replace(' ', '-')
+            or area.replace('-', ' ') == l['source_area'].lower().strip().replace('-', ' '))]
+    if filters['by_owner'] in ('true', 'false'):
+        filtered = [l for l in filtered if bool(l['is_owner']) == (filters['by_owner'] == 'true')]
+    if filters['bedrooms'] == '3+':
+        filtered = [l for l in filtered if l['beds'].isdigit() and int(l['beds']) >= 3]
+    elif filters['bedrooms'] == 'Studio':
+        filtered = [l for l in filtered if l['beds'] in ['0', 'Studio']]
+    elif filters['bedrooms'] != 'all':
+        filtered = [l for l in filtered if l['beds'] == filters['bedrooms']]
+    if filters['min_price'] is not None:
+        filtered = [l for l in filtered if l['price'] >= filters['min_price']]
+    if filters['max_price'] is not None:
+        filtered = [l for l in filtered if l['price'] <= filters['max_price']]
+    if filters['laundry'] != 'all':
+        filtered = [l for l in filtered if l['laundry_type'] == filters['laundry']]
+    for field, column in (('pets', 'pets_allowed'), ('outdoor', 'private_outdoor_space')):
+        if filters[field] != 'all':
+            filtered = [l for l in filtered if l[column] == (filters[field].lower() == 'true')]
+    if filters['days_filter'] == '0-7':
+        filtered = [l for l in filtered if l['days_on_market'] < 7]
+    elif filters['days_filter'] == '7-30':
+        filtered = [l for l in filtered if 7 <= l['days_on_market'] <= 30]
+    elif filters['days_filter'] == '30+':
+        filtered = [l for l in filtered if l['days_on_market'] > 30]
+    start, end = filters['offmarket_month_start'], filters['offmarket_month_end']
+    if start and end:
+        def in_months(month):
+            return start <= month <= end if start <= end else month >= start or month <= end
+        filtered = [l for l in filtered if in_months(datetime.strptime(l['offMarketAt'], '%Y-%m-%d').month)]
+    if filters['rent_stabilized'] == 'likely':
+        filtered = [l for l in filtered if l['likely_stabilized']]
+    elif filters['rent_stabilized'] == 'unlikely':
+        filtered = [l for l in filtered if not l['likely_stabilized']]
+    elif filters['rent_stabilized'] in ['high', 'medium', 'low']:
+        filtered = [l for l in filtered if l['likely_stabilized']
+                    and l['stabilization_confidence'].lower() == filters['rent_stabilized']]
+    return filtered
+
+
+def filters(**values):
+    return dict({'area': 'all', 'by_owner': 'all', 'bedrooms': 'all', 'min_price': None, 'max_price': None,
+                 'laundry': 'all', 'pets': 'all', 'outdoor': 'all', 'days_filter': 'all',
+                 'offmarket_month_start': None, 'offmarket_month_end': None, 'rent_stabilized': 'all'}, **values)
+
+
+FILTERS = [
+    filters(),
+    filters(area='west village'), filters(area='West-Village'), filters(area='upper east side'),
+    filters(area='nowhere'), filters(by_owner='true'), filters(by_owner='false'),
+    filters(bedrooms='3+'), filters(bedrooms='Studio'), filters(bedrooms='2'),
+    filters(min_price=3000), filters(max_price=4000), filters(min_price=3000, max_price=3000),
+    filters(min_price=5000, max_price=4000), filters(laundry='In building'), filters(laundry='None'),
+    filters(pets='true'), filters(pets='False'), filters(outdoor='true'),
+    filters(days_filter='0-7'), filters(days_filter='7-30'), filters(days_filter='30+'),
+    filters(offmarket_month_start=3, offmarket_month_end=5), filters(offmarket_month_start=11, offmarket_month_end=2),
+    filters(rent_stabilized='likely'), filters(rent_stabilized='unlikely'), filters(rent_stabilized='high'),
+    filters(area='soho', bedrooms='1', max_price=6000, pets='true', days_filter='30+'),
+    filters(bedrooms='3+', rent_stabilized='medium', offmarket_month_start=12, offmarket_month_end=1),
+    filters(by_owner='false', laundry='In building', outdoor='false', min_price=2000, days_filter='7-30'),
+]
+
+
+@pytest.fixture(scope='module')
+def view():
+    return ListingView(random_listings(3000))
+
+
+@pytest.fixture(scope='module')
+def index(view):
+    return ListingIndex(view)
+
+
+@pytest.mark.parametrize('query', FILTERS)
+def test_index_matches_reference_filtering(view, index, query):
+    expected = [row['id'] for row in reference_filters(view.listings(TODAY), query)]
+    assert [view.rows[i]['id'] for i in index.select(query, TODAY)] == expected
+    assert index.mask(query, TODAY).sum() == len(expected)
+
+
+def test_bitmaps_round_trip_sizes_that_are_not_whole_bytes():
+    codes = np.array([0, 1, 0, 2, 2, 1, 0, 0, 2, 1, 1], dtype=np.int32)
+    bitmaps = BitmapIndex(len(codes))
+    bitmaps.add_encoded('beds', codes, ['1', '2', '3'])
+    assert sorted(bitmaps.keys('beds')) == ['1', '2', '3']
+    assert list(np.flatnonzero(bitmaps.to_mask(bitmaps.get('beds', '2')))) == [1, 5, 9, 10]
+    assert list(np.flatnonzero(bitmaps.to_mask(bitmaps.any_of('beds', ['1', '3'])))) == [0, 2, 3, 4, 6, 7, 8]
+    assert not bitmaps.to_mask(bitmaps.get('beds', '4')).any()
+
+
+def test_categorical_filters_resolve_to_one_bitmap(index):
+    query = filters(area='soho', bedrooms='3+', pets='true', rent_stabilized='likely')
+    expected = (index.bitmaps.to_mask(index.bitmaps.get('area', 'soho'))
+                & np.isin(index.beds, [c for c, v in enumerate(index.beds_values) if v in ('3', '4')])
+                & (index.pets == 1) & index.stabilized)
+    assert (index.bitmaps.to_mask(index.categorical_bits(query)) == expected).all()
+    assert index.categorical_bits(filters(min_price=3000)) is None
+    assert not index.categorical_bits(filters(laundry='Unknown')).any()
+
+
+def test_sorted_index_ranges():
+    values = np.array([5.0, np.nan, 1.0, 3.0, 3.0, np.nan, 8.0])
+    index = SortedIndex(values)
+    assert sorted(index.range(3, 5)) == [0, 3, 4]
+    assert sorted(index.range(None, 3)) == [2, 3, 4]
+    # Rows without a value are never in a range, even an open-ended one
+    assert sorted(index.range(4, None)) == [0, 6]
+    assert list(index.range(6, 4)) == []
+
+
+@pytest.mark.parametrize('query', [filters(), filters(bedrooms='2', max_price=3500)])
+def test_sorting_follows_the_presorted_indexes(view, index, query):
+    rows = index.select(query, TODAY)
+    for sort in ('price', 'days_on_market'):
+        key = index.price if sort == 'price' else -index.off_market
+        ascending = index.select(query, TODAY, sort=sort)
+        assert list(ascending) == list(rows[np.argsort(key[rows], kind='stable')])
+        assert list(index.select(query, TODAY, sort='-' + sort)) == list(ascending[::-1])
+    assert list(index.select(query, TODAY, sort='unknown')) == list(rows)
+
+
+@pytest.mark.parametrize('cell_size', [0.001, 0.005, 1.0])
+def test_grid_ranges_match_a_scan(cell_size):
+    rng = np.random.default_rng(0)
+    latitude, longitude = 40.6 + rng.random(2000) / 5, -74.1 + rng.random(2000) / 5
+    latitude[::25] = np.nan
+    grid = GridIndex(latitude, longitude, cell_size)
+    for south, west, north, east in [(40.65, -74.05, 40.7, -74.0), (40.0, -75.0, 41.0, -73.0),
+                                     (40.7, -74.0, 40.7, -74.0), (41.0, -74.0, 42.0, -73.0), (40.75, -73.95, 40.9, -73.8)]:
+        inside = (latitude >= south) & (latitude <= north) & (longitude >= west) & (longitude <= east)
+        assert sorted(grid.range(south, west, north, east)) == list(np.flatnonzero(inside))
+
+
+def test_bbox_combines_with_other_filters(view, index):
+    bbox = (40.72, -74.0, 40.76, -73.95)
+    query = dict(filters(bedrooms='2', max_price=5000), bbox=bbox)
+    expected = [row['id'] for row in reference_filters(view.listings(TODAY), query)
+                if bbox[0] <= row['latitude'] <= bbox[2] and bbox[1] <= row['longitude'] <= bbox[3]]
+    assert expected and [view.rows[i]['id'] for i in index.select(query, TODAY)] == expected
@@ -0,0 +1,52 @@
+import json
+from datetime import date
+
+from listing_view import FIELD_PROFILES, ListingView, frontend_listing, profile_for, serialize
+
+
+def listing(unit, status='AVAILABLE', **fields):
+    return dict({'building_slug': 'a', 'displayUnit': unit, 'id': f'{unit}-{status}', 'status': status,
+                 'price': 3000, 'offMarketAt': '2024-01-15'}, **fields)
+
+
+def test_one_listing_per_unit():
+    view = ListingView([
+        # An available listing wins over an unavailable one, whatever the order
+        listing('1', 'RENTED', offMarketAt='2024-03-01'), listing('1'),
+        # Among available listings the latest onMarketAt wins
+        listing('2', onMarketAt='2024-01-01', price=1), listing('2', onMarketAt='2024-02-01', price=2),
+        listing('2', onMarketAt='2023-12-01', price=3),
+        # Among unavailable listings the latest offMarketAt wins
+        listing('3', 'RENTED', offMarketAt='2024-02-01', price=4), listing('3', 'DELISTED', offMarketAt='2024-01-01'),
+    ])
+    rows = {row['unit']: row for row in view.rows}
+    assert len(view) == 3
+    assert rows['1']['id'] == '1-AVAILABLE'
+    assert rows['2']['price'] == 2
+    assert rows['3']['price'] == 4
+    assert view.statuses == ['AVAILABLE', 'AVAILABLE', 'RENTED']
+
+
+def test_days_on_market_follow_the_day():
+    view = ListingView([listing('1'), listing('2', offMarketAt=None), listing('3', offMarketAt='garbage')])
+    first = view.listings(date(2024, 1, 25))
+    assert [row['days_on_market'] for row in first] == [10, 0, 0]
+    assert view.listings(date(2024, 1, 25)) is first
+    assert [row['days_on_market'] for row in view.listings(date(2024, 2, 1))] == [17, 0, 0]
+    assert first[0] == frontend_listing(listing('1'), date(2024, 1, 25))
+
+
+def test_fragments_serialize_like_the_rows():
+    view = ListingView([listing(str(i), price=3000 + i, offMarketAt=f'2024-01-{i + 1:02d}') for i in range(5)]
+                       + [listing('x', offMarketAt=None, building_address='5 "Quoted" St')])
+    for today in (date(2024, 1, 25), date(2024, 3, 1)):
+        full = b'[' + b','.join(view.fragments('full', today)) + b']'
+        assert full == serialize(view.listings(today))
+        marker = b'[' + b','.join(view.fragments('marker', today)) + b']'
+        assert json.loads(marker) == view.project(range(len(view)), FIELD_PROFILES['marker'], today)
+
+
+def test_profiles_match_field_sets_in_any_order():
+    assert profile_for(None) == 'full'
+    assert profile_for(tuple(reversed(FIELD_PROFILES['marker']))) == 'marker'
+    assert profile_for(('id', 'price')) is None
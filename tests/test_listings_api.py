@@ -0,0 +1,129 @@
+import gzip
+import json
+import threading
+
+import pytest
+
+import server
+from response_cache import CachedResponse, ResponseCache
+from snapshot import SnapshotManager
+from storage import ListingStore
+
+
+def listings(count, price=3000):
+    return [{'building_slug': f'b{i % 7}', 'displayUnit': str(i), 'id': str(i), 'status': 'AVAILABLE',
+             'price': price + (i * 37) % 500, 'bedroomCount': i % 3, 'offMarketAt': '2024-01-15',
+             'building_address': f'{i} Main St', 'latitude': 40.7 + i / 1000, 'longitude': -74.0 + i / 1000}
+            for i in range(count)]
+
+
+def write_file(listings):
+    with open('rentals_latest.json', 'w') as f:
+        json.dump({'metadata': {}, 'listings': listings}, f)
+
+
+@pytest.fixture
+def client(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    write_file(listings(40))
+    manager = SnapshotManager(ListingStore(str(tmp_path / 'listings.db')), source='file')
+    monkeypatch.setattr(server, 'snapshots', manager)
+    return server.app.test_client()
+
+
+def test_cursor_pages_cover_the_sorted_listings(client):
+    everything = client.get('/api/listings?sort=-price').get_json()
+    ids, cursor = [], None
+    while True:
+        response = client.get('/api/listings', query_string={'sort': '-price', 'limit': 7, 'cursor': cursor})
+        assert response.headers['X-Total-Count'] == '40'
+        ids += [listing['id'] for listing in response.get_json()]
+        cursor = response.headers.get('X-Next-Cursor')
+        if cursor is None:
+            break
+    assert ids == [listing['id'] for listing in everything]
+    prices = [listing['price'] for listing in everything]
+    assert prices == sorted(prices, reverse=True)
+
+
+def test_stale_cursor_is_gone(client):
+    cursor = client.get('/api/listings?limit=10').headers['X-Next-Cursor']
+    assert client.get('/api/listings', query_string={'cursor': cursor}).status_code == 200
+    write_file(listings(50))
+    server.snapshots.refresh()
+    response = client.get('/api/listings', query_string={'cursor': cursor})
+    assert response.status_code == 410
+    assert client.get('/api/listings?cursor=not-a-cursor').status_code == 400
+
+
+def test_fields_projection(client):
+    response = client.get('/api/listings?fields=id,price,days_on_market&limit=3')
+    assert [set(listing) for listing in response.get_json()] == [{'id', 'price', 'days_on_market'}] * 3
+    response = client.get('/api/listings?fields=id,bogus')
+    assert response.status_code == 400
+    assert 'bogus' in response.get_json()['error']
+
+
+def test_etag_revalidation_until_the_data_changes(client):
+    first = client.get('/api/listings?bedrooms=1')
+    etag = first.headers['ETag']
+    revalidated = client.get('/api/listings?bedrooms=1', headers={'If-None-Match': etag})
+    assert revalidated.status_code == 304 and revalidated.data == b''
+    # Equivalent spellings of a query share a cache entry and its ETag
+    assert client.get('/api/listings?bedrooms=1&area=all&pets=all').headers['ETag'] == etag
+
+    write_file(listings(40, price=5000))
+    server.snapshots.refresh()
+    changed = client.get('/api/listings?bedrooms=1', headers={'If-None-Match': etag})
+    assert changed.status_code == 200 and changed.headers['ETag'] != etag
+    assert min(listing['price'] for listing in changed.get_json()) >= 5000
+
+
+def test_large_bodies_are_served_precompressed(client):
+    response = client.get('/api/listings', headers={'Accept-Encoding': 'gzip'})
+    assert response.headers['Content-Encoding'] == 'gzip'
+    assert json.loads(gzip.decompress(response.data)) == client.get('/api/listings').get_json()
+
+
+def test_cache_is_bounded_by_body_size():
+    cache = ResponseCache(max_bytes=250)
+    for key in 'abc':
+        cache.get_or_compute(key, lambda: CachedResponse(b'x' * 100))
+    assert len(cache) == 2
+    computed = []
+    cache.get_or_compute('c', lambda: computed.append('c'))
+    cache.get_or_compute('big', lambda: CachedResponse(b'x' * 1000))
+    assert computed == [] and len(cache) == 2
+
+
+def test_concurrent_misses_compute_once():
+    cache = ResponseCache(max_bytes=1000)
+    release, calls = threading.Event(), []
+
+    def compute():
+        calls.append(1)
+        release.wait()
+        return CachedResponse(b'body')
+
+    results = []
+    threads = [threading.Thread(target=lambda: results.append(cache.get_or_compute('k', compute)))
+               for _ in range(4)]
+    for thread in threads:
+        thread.start()
+    release.set()
+    for thread in threads:
+        thread.join()
+    assert len(calls) == 1 and len({id(result) for result in results}) == 1
+
+
+def test_bbox_limits_the_listings(client):
+    listed = client.get('/api/listings?bbox=-74,40.705,-73.99,40.715').get_json()
+    assert sorted(int(listing['id']) for listing in listed) == list(range(5, 11))
+
+
+@pytest.mark.parametrize('bbox', ['1,2,3', 'a,b,c,d', '-73.9,40.7,-74.0,40.8', '-74,40.8,-73.9,40.7', '0,91,1,92'])
+def test_bad_bbox_is_rejected(client, bbox):
+    for path in ('/api/listings', '/api/markers', '/api/statistics'):
+        response = client.get(path, query_string={'bbox': bbox, 'zoom': 12})
+        assert response.status_code == 400, path
+        assert 'Invalid bbox' in response.get_json()['error']
@@ -0,0 +1,80 @@
+import os
+
+import server
+from mapped_snapshot import MappedSnapshots, SnapshotPublisher, read_snapshot, write_snapshot
+from snapshot import Snapshot, SnapshotManager
+from storage import ListingStore
+
+
+def listings(count, price=3000):
+    # Enough rows that the view's lists are written as mapped tables
+    return [{'building_slug': f'b{i % 40}', 'displayUnit': str(i), 'id': str(i), 'status': 'AVAILABLE',
+             'price': price + i, 'offMarketAt': '2024-01-15', 'building_address': f'{i} Main St',
+             'latitude': 40.7 + i / 1000, 'longitude': -74.0} for i in range(count)]
+
+
+def publisher_for(tmp_path, rows):
+    store = ListingStore(str(tmp_path / 'listings.db'))
+    run_id = store.begin_run('soho')
+    store.upsert_listings(rows, run_id)
+    store.finish_run(run_id, rows)
+    return SnapshotPublisher(str(tmp_path / 'snapshots'), SnapshotManager(store, source='database')), store
+
+
+def test_round_trip(tmp_path):
+    snapshot = Snapshot('v1', listings(300))
+    write_snapshot(str(tmp_path / 'snap.bin'), snapshot)
+    mapped, changes = read_snapshot(str(tmp_path / 'snap.bin'))
+    assert mapped.version == 'v1' and changes == {}
+    assert list(mapped.view.rows) == snapshot.view.rows
+    assert list(mapped.view.listings()) == snapshot.view.listings()
+    assert list(mapped.view.fragments('full')) == snapshot.view.fragments('full')
+    assert list(mapped.index.select({})) == list(snapshot.index.select({}))
+    assert mapped.view.project([3, 1], ['id', 'price']) == snapshot.view.project([3, 1], ['id', 'price'])
+
+
+def test_mapped_rows_are_parsed_once(tmp_path):
+    write_snapshot(str(tmp_path / 'snap.bin'), Snapshot('v1', listings(300)))
+    rows = read_snapshot(str(tmp_path / 'snap.bin'))[0].view.rows
+    assert rows[5] is rows[5]
+    assert rows[-1] is rows[len(rows) - 1]
+
+
+def test_readers_pick_up_new_versions(tmp_path):
+    publisher, store = publisher_for(tmp_path, listings(300))
+    publisher.publish()
+    snapshots = MappedSnapshots(publisher.directory)
+    first = snapshots.get()
+    assert first.version == store.version()
+
+    rows = listings(300, price=4000)
+    run_id = store.begin_run('soho')
+    store.upsert_listings(rows, run_id)
+    store.finish_run(run_id, rows)
+    publisher.publish()
+    second = snapshots.refresh()
+    assert second.version == store.version() != first.version
+    assert second.view.rows[0]['price'] == 4000
+    _, diff = snapshots.changes_since(first.version)
+    assert diff is not None
+
+
+def test_old_files_are_pruned(tmp_path):
+    publisher, store = publisher_for(tmp_path, listings(10))
+    for price in range(5):
+        rows = listings(10, price=price)
+        run_id = store.begin_run('soho')
+        store.upsert_listings(rows, run_id)
+        store.finish_run(run_id, rows)
+        publisher.publish()
+    files = [f for f in os.listdir(publisher.directory) if f.endswith('.bin')]
+    assert publisher.published[1] in files and len(files) <= 3
+
+
+def test_503_before_the_first_snapshot(tmp_path, monkeypatch):
+    monkeypatch.setattr(server, 'snapshots', MappedSnapshots(str(tmp_path / 'snapshots')))
+    client = server.app.test_client()
+    for path in ('/api/listings', '/api/markers?zoom=12', '/api/statistics', '/api/listings/changes?since=x'):
+        response = client.get(path)
+        assert response.status_code == 503, path
+        assert response.headers['Retry-After'] == '1'
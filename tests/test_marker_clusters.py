@@ -0,0 +1,76 @@
+import random
+
+import numpy as np
+import pytest
+
+import server
+from marker_clusters import CELL_PIXELS, MAX_ZOOM
+from snapshot import Snapshot
+
+
+def random_listings(count, seed=2):
+    rng = random.Random(seed)
+    return [{'building_slug': f'b{i}', 'displayUnit': '1', 'id': str(i), 'status': 'AVAILABLE',
+             'price': rng.randrange(1500, 9000), 'bedroomCount': rng.choice([0, 1, 2]),
+             'offMarketAt': '2024-01-15',
+             'latitude': None if i % 40 == 0 else 40.6 + rng.random() / 4,
+             'longitude': None if i % 40 == 0 else -74.1 + rng.random() / 4} for i in range(count)]
+
+
+@pytest.fixture(scope='module')
+def snapshot():
+    return Snapshot('v1', random_listings(3000))
+
+
+@pytest.mark.parametrize('query', [{}, {'bedrooms': '1'}, {'bedrooms': '2', 'max_price': 4000}])
+def test_cluster_counts_sum_to_the_filtered_total(snapshot, query):
+    rows = snapshot.index.select(query)
+    located = rows[~np.isnan(snapshot.index.latitude[rows])]
+    previous = 0
+    for zoom in range(0, MAX_ZOOM + 3):
+        clusters = snapshot.clusters.clusters(rows, zoom)
+        assert sum(cluster[2] for cluster in clusters) == len(located)
+        # Cells nest, so zooming in never merges clusters
+        assert len(clusters) >= previous
+        previous = len(clusters)
+    assert len(snapshot.clusters.clusters(rows, 0)) == 1
+
+
+def test_clusters_match_a_grouping_by_cell(snapshot):
+    rows = snapshot.index.select({'bedrooms': '0'})
+    zoom = 12
+    shift = MAX_ZOOM - zoom + CELL_PIXELS.bit_length() - 1
+    cells = {}
+    for i in rows.tolist():
+        if snapshot.view.rows[i]['latitude'] is not None:
+            cells.setdefault((snapshot.clusters.y[i] >> shift, snapshot.clusters.x[i] >> shift), []).append(i)
+    clusters = snapshot.clusters.clusters(rows, zoom)
+    assert len(clusters) == len(cells)
+    by_count = sorted(clusters, key=lambda c: (c[2], c[0], c[1]))
+    expected = []
+    for members in cells.values():
+        listings = [snapshot.view.rows[i] for i in members]
+        prices = [listing['price'] for listing in listings]
+        expected.append([
+            round(float(np.mean([listing['latitude'] for listing in listings])), 6),
+            round(float(np.mean([listing['longitude'] for listing in listings])), 6),
+            len(members), min(prices), float(np.median(prices)),
+            listings[0]['id'] if len(members) == 1 else None])
+    expected.sort(key=lambda c: (c[2], c[0], c[1]))
+    for actual, wanted in zip(by_count, expected):
+        assert actual[2:] == wanted[2:]
+        assert actual[:2] == pytest.approx(wanted[:2], abs=1e-6)
+
+
+def test_markers_endpoint(snapshot, monkeypatch):
+    class Snapshots:
+        def get(self, block=True):
+            return snapshot
+
+    monkeypatch.setattr(server, 'snapshots', Snapshots())
+    client = server.app.test_client()
+    body = client.get('/api/markers?zoom=11&bedrooms=1').get_json()
+    assert list(body['fields']) == ['latitude', 'longitude', 'count', 'min_price', 'median_price', 'id']
+    rows = snapshot.index.select({'bedrooms': '1'})
+    assert body['total'] == int((~np.isnan(snapshot.index.latitude[rows])).sum())
+    assert client.get('/api/markers').status_code == 400
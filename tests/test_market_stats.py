@@ -0,0 +1,56 @@
+import random
+from datetime import date
+
+import numpy as np
+import pytest
+
+from listing_index import ListingIndex
+from listing_view import ListingView
+from market_stats import MarketStatistics
+
+TODAY = date(2024, 6, 15)
+
+
+def random_listings(count, seed=1):
+    rng = random.Random(seed)
+    return [{'building_slug': f'b{i}', 'displayUnit': '1', 'id': str(i), 'status': 'AVAILABLE',
+             'price': rng.choice([rng.randrange(1500, 12000), None]) if i % 50 == 0 else rng.randrange(1500, 12000),
+             'bedroomCount': rng.choice([0, 1, 2, 3, 4]), 'source_area': rng.choice(['soho', 'West-Village', '']),
+             'offMarketAt': rng.choice([None, date.fromordinal(TODAY.toordinal() - rng.randrange(365)).isoformat()]),
+             'likely_stabilized': rng.random() < 0.3} for i in range(count)]
+
+
+@pytest.fixture(scope='module')
+def index():
+    return ListingIndex(ListingView(random_listings(4000)))
+
+
+def filters(**values):
+    return dict({'area': 'all', 'bedrooms': 'all', 'min_price': None, 'max_price': None,
+                 'offmarket_month_start': None, 'offmarket_month_end': None}, **values)
+
+
+@pytest.mark.parametrize('query', [
+    filters(), filters(area='west village'), filters(area=''), filters(bedrooms='3+'),
+    filters(area='soho', bedrooms='Studio'), filters(offmarket_month_start=11, offmarket_month_end=2),
+    # Not answerable from the buckets alone
+    filters(min_price=4000), filters(area='soho', max_price=3000), filters(days_filter='30+', bedrooms='1'),
+])
+def test_statistics_match_the_selected_rows(index, query):
+    statistics = MarketStatistics(index).query(query, TODAY)
+    rows = index.select(query, TODAY)
+    prices = index.price[rows][~np.isnan(index.price[rows])]
+    assert statistics['total_listings'] == len(rows)
+    assert statistics['average_price'] == pytest.approx(prices.mean())
+    assert statistics['price_range'] == {'min': prices.min(), 'max': prices.max()}
+    assert statistics['stabilized_share'] == pytest.approx(index.stabilized[rows].mean())
+    # Percentiles come from ~2.5% wide histogram bins
+    for name, q in (('p10', 10), ('p50', 50), ('p90', 90)):
+        assert statistics['percentiles'][name] == pytest.approx(np.percentile(prices, q), rel=0.03)
+    assert statistics['median_price'] == statistics['percentiles']['p50']
+
+
+def test_no_matching_listings(index):
+    statistics = MarketStatistics(index).query(filters(area='nowhere'), TODAY)
+    assert statistics['total_listings'] == 0 and statistics['median_price'] == 0
+    assert statistics['price_range'] == {'min': 0, 'max': 0}
@@ -0,0 +1,43 @@
+import json
+
+import pytest
+
+import rentals_json
+from rentals_json import iter_rentals, write_rentals
+
+LISTINGS = [
+    {'id': '1', 'price': 3250, 'baths': 1.5, 'sqft': 1e3, 'offMarketAt': None, 'petFriendly': True},
+    {'id': '2', 'price': -0.25, 'building_address': 'Café "Corner", [5] {A}', 'tags': [1, [2, {'x': 3}]]},
+    {'id': '3', 'price': 12345678901234567890, 'agentName': '\\u00e9 \\\\ ☃', 'nested': {}},
+]
+
+
+@pytest.mark.parametrize('chunk_size', [1, 2, 3, 7, 1 << 16])
+def test_listings_stream_across_chunk_boundaries(tmp_path, monkeypatch, chunk_size):
+    monkeypatch.setattr(rentals_json, 'CHUNK_SIZE', chunk_size)
+    path = str(tmp_path / 'rentals.json')
+    version = write_rentals(path, {'area': 'soho'}, LISTINGS)
+    metadata = {}
+    assert list(iter_rentals(path, metadata)) == LISTINGS
+    assert metadata == {'area': 'soho', 'version': version}
+
+
+@pytest.mark.parametrize('chunk_size', [1, 5])
+@pytest.mark.parametrize('document', [
+    LISTINGS, [], {'listings': []}, {}, {'listings': LISTINGS[:1], 'metadata': {'n': 1}},
+    {'other': [1, 2], 'listings': LISTINGS},
+])
+def test_other_layouts(tmp_path, monkeypatch, chunk_size, document):
+    monkeypatch.setattr(rentals_json, 'CHUNK_SIZE', chunk_size)
+    path = tmp_path / 'rentals.json'
+    path.write_text(json.dumps(document, separators=(',', ':')))
+    expected = document if isinstance(document, list) else document.get('listings', [])
+    assert list(iter_rentals(str(path))) == expected
+
+
+def test_truncated_files_fail(tmp_path):
+    path = tmp_path / 'rentals.json'
+    path.write_text(json.dumps({'listings': LISTINGS})[:-10])
+    with pytest.raises(ValueError):
+        list(iter_rentals(str(path)))
+
@@ -0,0 +1,33 @@
+import io
+import json
+
+import scraper_events
+from scraper_events import StatusChannel
+
+
+class CountingChannel(StatusChannel):
+    def __init__(self, path):
+        super().__init__(path)
+        self.written = []
+
+    def _persist(self, status):
+        self.written.append(status)
+        super()._persist(status)
+
+
+def test_status_file_is_written_on_transitions_and_at_the_end(tmp_path, monkeypatch):
+    monkeypatch.setattr(scraper_events, 'COALESCE_INTERVAL', 0)
+    channel = CountingChannel(str(tmp_path / 'status.json'))
+    updates = [{'status': 'running', 'progress': i} for i in range(50)] + [{'status': 'completed'}]
+    channel.follow(io.StringIO(''.join(json.dumps(update) + '\n' for update in updates)))
+    assert channel.written == [updates[0], updates[-1]]
+    with open(tmp_path / 'status.json') as f:
+        assert json.load(f) == updates[-1]
+
+
+def test_latest_progress_is_written_when_the_pipe_closes(tmp_path, monkeypatch):
+    monkeypatch.setattr(scraper_events, 'COALESCE_INTERVAL', 0)
+    channel = CountingChannel(str(tmp_path / 'status.json'))
+    updates = [{'status': 'running', 'progress': i} for i in range(5)]
+    channel.follow(io.StringIO(''.join(json.dumps(update) + '\n' for update in updates)))
+    assert channel.written == [updates[0], updates[-1]]
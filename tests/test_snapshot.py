@@ -0,0 +1,50 @@
+import json
+import os
+import time
+
+from snapshot import SnapshotManager
+from storage import ListingStore
+
+
+def write_file(path, listings):
+    with open(path, 'w') as f:
+        json.dump({'metadata': {}, 'listings': listings}, f)
+
+
+def store_with(path, listings):
+    store = ListingStore(path)
+    run_id = store.begin_run('soho')
+    store.upsert_listings(listings, run_id)
+    store.finish_run(run_id, listings)
+    return store
+
+
+LISTING = {'building_slug': 'a', 'displayUnit': '1', 'id': '1', 'status': 'AVAILABLE', 'price': 3000}
+
+
+def test_newer_rentals_file_wins_over_database(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    store = store_with(str(tmp_path / 'listings.db'), [LISTING])
+    assert SnapshotManager(store).current_source()[0] is store
+    time.sleep(0.01)
+    write_file('rentals_latest.json', [LISTING])
+    assert SnapshotManager(store).current_source()[0] == 'rentals_latest.json'
+
+
+def test_database_written_after_file_wins(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    write_file('rentals_latest.json', [LISTING])
+    time.sleep(0.01)
+    store = store_with(str(tmp_path / 'listings.db'), [LISTING])
+    assert SnapshotManager(store).current_source()[0] is store
+
+
+def test_source_can_be_pinned(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    store = store_with(str(tmp_path / 'listings.db'), [LISTING])
+    time.sleep(0.01)
+    write_file('rentals_latest.json', [LISTING])
+    assert SnapshotManager(store, source='database').current_source()[0] is store
+    assert SnapshotManager(store, source='file').current_source()[0] == 'rentals_latest.json'
+    os.remove('rentals_latest.json')
+    assert SnapshotManager(store, source='file').current_source() == (None, None)
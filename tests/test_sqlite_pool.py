@@ -0,0 +1,29 @@
+import threading
+
+from sqlite_pool import ConnectionPool
+
+
+def test_setup_runs_once_and_connections_are_reused_across_threads(tmp_path):
+    setups = []
+    pool = ConnectionPool(str(tmp_path / 'test.db'), setup=setups.append)
+    seen = []
+
+    def use():
+        with pool.connection() as conn:
+            seen.append(conn)
+
+    for _ in range(3):
+        thread = threading.Thread(target=use)
+        thread.start()
+        thread.join()
+    assert len(setups) == 1
+    assert len(set(map(id, seen))) == 1
+
+
+def test_open_transactions_are_rolled_back_on_checkin(tmp_path):
+    pool = ConnectionPool(str(tmp_path / 'test.db'), setup=lambda conn: conn.execute('CREATE TABLE t (x)'))
+    with pool.connection() as conn:
+        conn.execute('INSERT INTO t VALUES (1)')
+    with pool.connection() as conn:
+        assert not conn.in_transaction
+        assert conn.execute('SELECT COUNT(*) FROM t').fetchone()[0] == 0
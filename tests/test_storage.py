@@ -0,0 +1,39 @@
+from storage import ListingStore
+
+
+def listing(slug, unit, area='west village', status='AVAILABLE'):
+    return {'building_slug': slug, 'displayUnit': unit, 'id': f'{slug}-{unit}', 'status': status,
+            'price': 3000, 'areaName': area}
+
+
+def units(store):
+    return sorted((l['building_slug'], l['displayUnit']) for l in store.iter_listings())
+
+
+def run(store, area, listings):
+    run_id = store.begin_run(area)
+    store.upsert_listings(listings, run_id)
+    store.finish_run(run_id, listings)
+
+
+def test_finish_run_replaces_the_areas_earlier_listings(tmp_path):
+    store = ListingStore(str(tmp_path / 'listings.db'))
+    run(store, 'west village', [listing('a', '1'), listing('a', '2')])
+    run(store, 'West-Village', [listing('a', '2'), listing('b', '1')])
+    assert units(store) == [('a', '2'), ('b', '1')]
+
+
+def test_finish_run_keeps_other_areas(tmp_path):
+    store = ListingStore(str(tmp_path / 'listings.db'))
+    run(store, 'west village', [listing('a', '1')])
+    run(store, 'soho', [listing('s', '1', area='soho')])
+    run(store, 'west village', [listing('b', '1')])
+    assert units(store) == [('b', '1'), ('s', '1')]
+
+
+def test_finish_run_drops_units_left_out_of_the_final_set(tmp_path):
+    store = ListingStore(str(tmp_path / 'listings.db'))
+    run_id = store.begin_run('soho')
+    store.upsert_listings([listing('s', '1'), listing('s', '2')], run_id)
+    store.finish_run(run_id, [listing('s', '1')])
+    assert units(store) == [('s', '1')]